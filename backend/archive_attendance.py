@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Move closed months of attendance records into the Parquet archive
+Months older than ARCHIVE_AFTER_MONTHS (or --keep-months) leave the
+database; summaries and history keep reading them from ARCHIVE_DIR.
+
+Usage:
+  python archive_attendance.py                  # archive everything older than ARCHIVE_AFTER_MONTHS
+  python archive_attendance.py --keep-months 6 --dry-run
+  python archive_attendance.py --list
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+
+from config import settings
+from models import AttendanceRecord
+from partitioning import add_months
+from services.archive import attendance_archive, archive_month, naive
+from sharding import shard_map
+
+
+def months_to_archive(db, cutoff: date):
+    """Months with records in the database that end before ``cutoff``"""
+    oldest = db.query(func.min(AttendanceRecord.check_in_time)).filter(
+        AttendanceRecord.check_in_time < datetime.combine(cutoff, time.min)
+    ).scalar()
+    if oldest is None:
+        return []
+    month = naive(oldest).date().replace(day=1)
+    months = []
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def list_archive():
+    months = attendance_archive.months()
+    if not months:
+        print(f"📦 Archive at {attendance_archive.root} is empty")
+        return
+    print(f"📦 Archive at {attendance_archive.root}:")
+    for month in months:
+        files = attendance_archive.files(month)
+        size = sum(os.path.getsize(path) for path in files)
+        print(f"  - {month:%Y-%m}: {len(files)} file(s), {size / (1024*1024):.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-months", type=int, default=settings.ARCHIVE_AFTER_MONTHS,
+                        help="Months (besides the current one) kept in the database")
+    parser.add_argument("--dry-run", action="store_true", help="Show which months would be archived")
+    parser.add_argument("--list", action="store_true", help="Show archived months and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        list_archive()
+        return
+    if args.keep_months < 0:
+        parser.error("--keep-months must be 0 or more")
+
+    cutoff = add_months(date.today().replace(day=1), -args.keep_months)
+    for shard in shard_map.all():
+        db = shard.session()
+        label = f"shard {shard.number}: " if len(shard_map.shards) > 1 else ""
+        try:
+            months = months_to_archive(db, cutoff)
+            if not months:
+                print(f"✅ {label}No records before {cutoff:%Y-%m} to archive")
+                continue
+            print(f"🗄️  {label}Archiving {len(months)} month(s) before {cutoff:%Y-%m} to {attendance_archive.root}")
+            for month in months:
+                if args.dry_run:
+                    print(f"  - {month:%Y-%m} (dry run)")
+                    continue
+                result = archive_month(db, month)
+                dropped = ", partition dropped" if result["partition_dropped"] else ""
+                print(f"  - {result['month']}: {result['written']} written, {result['deleted']} removed from the database{dropped}")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ {label}Archiving failed: {e}")
+            sys.exit(1)
+        finally:
+            db.close()
+    print("✅ Archive complete")
+
+
+if __name__ == "__main__":
+    main()
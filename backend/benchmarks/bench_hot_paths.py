@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the backend hot functions
+Face hashing, password hashing, JWTs, TOTP QR codes and attendance summaries,
+checked against a stored baseline so regressions fail loudly
+
+Usage:
+  python benchmarks/bench_hot_paths.py                   # compare with baseline, exit 1 on regression
+  python benchmarks/bench_hot_paths.py --save-baseline   # record a new baseline on this machine
+  python benchmarks/bench_hot_paths.py --only hash --threshold 0.1 --json results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import User, AttendanceRecord
+from services.auth_service import AuthService
+from services.attendance_service import AttendanceService
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_hot_paths.json")
+
+
+def seed(db, days: int) -> User:
+    """One user with a closed check-in on every weekday of the last ``days`` days"""
+    user = User(username="bench", email="bench@example.com", hashed_password="x", full_name="Bench User")
+    db.add(user)
+    db.flush()
+
+    rng = random.Random(42)
+    today = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    for offset in range(days):
+        check_in = today - timedelta(days=offset, minutes=rng.randint(0, 45))
+        if check_in.weekday() >= 5:
+            continue
+        db.add(AttendanceRecord(
+            user_id=user.id,
+            check_in_time=check_in,
+            check_out_time=check_in + timedelta(hours=8),
+            work_duration=round(8 + rng.random(), 2),
+            location="HQ",
+            face_verified=True
+        ))
+    db.commit()
+    return user
+
+
+def build_cases(db, user: User) -> dict:
+    """name -> zero-argument callable exercising one hot path"""
+    auth = AuthService(db)
+    attendance = AttendanceService(db)
+
+    rng = random.Random(7)
+    # _match_face hashes a 32x32 grayscale image
+    face = Image.frombytes("L", (32, 32), bytes(rng.randrange(256) for _ in range(32 * 32)))
+    hash1 = auth._get_perceptual_hash(face)
+    hash2 = bytes(b ^ 0x11 for b in hash1)
+
+    password_hash = auth.get_password_hash("Bench-Password-1")
+    token = auth.create_access_token({"sub": user.username})
+    secret = "JBSWY3DPEHPK3PXP"
+
+    now = datetime.now()
+    summary_ranges = {
+        "get_attendance_summary[31d]": 31,
+        "get_attendance_summary[365d]": 365,
+        "get_attendance_summary[1825d]": 1825,
+    }
+
+    cases = {
+        "_get_perceptual_hash": lambda: auth._get_perceptual_hash(face),
+        "_hamming_distance": lambda: auth._hamming_distance(hash1, hash2),
+        "get_password_hash": lambda: auth.get_password_hash("Bench-Password-1"),
+        "verify_password": lambda: auth.verify_password("Bench-Password-1", password_hash),
+        "create_access_token": lambda: auth.create_access_token({"sub": user.username}),
+        "verify_token": lambda: auth.verify_token(token),
+        "generate_totp_qr_code": lambda: auth.generate_totp_qr_code(user, secret),
+    }
+    for name, days in summary_ranges.items():
+        start = now - timedelta(days=days)
+        cases[name] = lambda start=start: attendance.get_attendance_summary(user=user, start_date=start, end_date=now)
+    return cases
+
+
+def measure(fn, repeat: int, min_seconds: float) -> dict:
+    """Median and best per-call time in microseconds over ``repeat`` timed runs"""
+    timer = timeit.Timer(fn)
+    loops = 1
+    while timer.timeit(loops) < min_seconds:
+        loops *= 2
+    samples = [timer.timeit(loops) / loops * 1e6 for _ in range(repeat)]
+    return {"median_us": round(statistics.median(samples), 3), "best_us": round(min(samples), 3), "loops": loops}
+
+
+def format_us(value: float) -> str:
+    if value >= 1000:
+        return f"{value / 1000:.2f} ms"
+    return f"{value:.2f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown of the median vs baseline (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per benchmark")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Minimum duration of one timed run")
+    parser.add_argument("--days", type=int, default=1825, help="Days of attendance history to seed")
+    parser.add_argument("--only", help="Run benchmarks whose name contains this string")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = seed(db, args.days)
+    cases = build_cases(db, user)
+    if args.only:
+        cases = {name: fn for name, fn in cases.items() if args.only in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    print(f"\n{'Benchmark':<32}{'median':>12}{'best':>12}{'baseline':>12}{'change':>10}")
+    print("-" * 78)
+    for name, fn in cases.items():
+        result = measure(fn, args.repeat, args.min_seconds)
+        results[name] = result
+
+        line = f"{name:<32}{format_us(result['median_us']):>12}{format_us(result['best_us']):>12}"
+        base = baseline.get(name)
+        if base:
+            change = result["median_us"] / base["median_us"] - 1
+            regressed = change > args.threshold
+            if regressed:
+                regressions.append(name)
+            line += f"{format_us(base['median_us']):>12}{change * 100:>+9.1f}%{' ❌' if regressed else ''}"
+        print(line)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {"repeat": args.repeat, "min_seconds": args.min_seconds, "days": args.days},
+        "results": results
+    }
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline written to {args.baseline}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    if baseline:
+        print(f"\n✅ No regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for the list-heavy attendance endpoints
+Compares FastAPI's default JSON path with orjson and reports bytes on the wire
+
+Usage:
+  python benchmarks/bench_serialization.py
+  python benchmarks/bench_serialization.py --days 31 --image-kb 40 --repeat 200 --json results.json
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import User, AttendanceRecord
+from responses import FastJSONResponse
+from services.attendance_service import AttendanceService
+from config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def seed(db, days: int, image_kb: int) -> User:
+    """Create one user with a check-in per weekday, each carrying a random image"""
+    user = User(username="bench", email="bench@example.com", hashed_password="x", full_name="Bench User")
+    db.add(user)
+    db.flush()
+
+    rng = random.Random(42)
+    today = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    for offset in range(days):
+        check_in = today - timedelta(days=offset, minutes=rng.randint(0, 45))
+        # Random bytes compress about as badly as real JPEG data
+        image = base64.b64encode(rng.randbytes(image_kb * 1024 * 3 // 4)).decode()
+        db.add(AttendanceRecord(
+            user_id=user.id,
+            check_in_time=check_in,
+            check_out_time=check_in + timedelta(hours=8, minutes=rng.randint(0, 60)),
+            work_duration=round(8 + rng.random(), 2),
+            location="HQ",
+            face_verified=True,
+            face_image=f"data:image/jpeg;base64,{image}"
+        ))
+    db.commit()
+    return user
+
+
+def build_payloads(db, user: User) -> dict:
+    """Build the same content /dashboard and /monthly-summary return"""
+    service = AttendanceService(db)
+    today = datetime.now().date()
+
+    week_start = today - timedelta(days=today.weekday())
+    month_start = datetime(today.year, today.month, 1)
+    if today.month == 12:
+        month_end = datetime(today.year + 1, 1, 1) - timedelta(days=1)
+    else:
+        month_end = datetime(today.year, today.month + 1, 1) - timedelta(days=1)
+
+    dashboard = {
+        "today_status": service.get_today_status(user, include_image=False),
+        "week_summary": service.get_attendance_summary(
+            user=user,
+            start_date=datetime.combine(week_start, datetime.min.time()),
+            end_date=datetime.combine(week_start + timedelta(days=6), datetime.max.time())
+        ),
+        "month_summary": service.get_attendance_summary(user=user, start_date=month_start, end_date=month_end),
+        "recent_records": service.get_user_attendance(user=user, limit=10, include_images=False),
+        "user_info": {"username": user.username, "full_name": user.full_name, "face_registered": True}
+    }
+    monthly = {
+        "summary": service.get_attendance_summary(user=user, start_date=month_start, end_date=month_end),
+        "daily_records": service.get_user_attendance(
+            user=user, start_date=month_start, end_date=month_end + timedelta(days=1), limit=100
+        ),
+        "month": today.month,
+        "year": today.year
+    }
+    return {"/dashboard": dashboard, "/monthly-summary": monthly}
+
+
+def default_render(content) -> bytes:
+    """What FastAPI does for a plain dict: jsonable_encoder + JSONResponse.render"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_render(content) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def time_ms(fn, content, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=31, help="Attendance records to seed")
+    parser.add_argument("--image-kb", type=int, default=30, help="Size of each stored base64 image in KB")
+    parser.add_argument("--repeat", type=int, default=100, help="Timing repetitions per encoder")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = seed(db, args.days, args.image_kb)
+    payloads = build_payloads(db, user)
+
+    results = []
+    for endpoint, content in payloads.items():
+        assert json.loads(default_render(content)) == json.loads(fast_render(content))
+        body = fast_render(content)
+        result = {
+            "endpoint": endpoint,
+            "default_encode_ms": round(time_ms(default_render, content, args.repeat), 3),
+            "orjson_encode_ms": round(time_ms(fast_render, content, args.repeat), 3),
+            "raw_bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=settings.GZIP_COMPRESSION_LEVEL)),
+            "brotli_bytes": len(brotli.compress(body, quality=settings.BROTLI_QUALITY)) if brotli else None
+        }
+        results.append(result)
+
+    print(f"\n{'Endpoint':<18}{'default ms':>12}{'orjson ms':>12}{'speedup':>9}{'raw KB':>10}{'gzip KB':>10}{'br KB':>10}")
+    print("-" * 81)
+    for r in results:
+        speedup = r["default_encode_ms"] / r["orjson_encode_ms"] if r["orjson_encode_ms"] else float("inf")
+        br_kb = f"{r['brotli_bytes'] / 1024:.1f}" if r["brotli_bytes"] is not None else "n/a"
+        print(f"{r['endpoint']:<18}{r['default_encode_ms']:>12.3f}{r['orjson_encode_ms']:>12.3f}{speedup:>8.1f}x"
+              f"{r['raw_bytes'] / 1024:>10.1f}{r['gzip_bytes'] / 1024:>10.1f}{br_kb:>10}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
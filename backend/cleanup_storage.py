@@ -10,6 +10,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import SessionLocal
 from models import AttendanceRecord, User
+from services.archive import attendance_archive
+from services.maintenance import bump_data_versions
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
@@ -96,15 +98,18 @@ def cleanup_old_records(days_to_keep: int, delete_records: bool = False):
                 AttendanceRecord.face_image.isnot(None)
             ).all()
         
-        if not old_records:
+        archived = attendance_archive.purge(cutoff_date, delete_records=delete_records, dry_run=True)
+        
+        if not old_records and not archived["records"]:
             print(f"\n✅ No records older than {days_to_keep} days found")
             return
         
         # Calculate space to be freed
-        total_size = sum(len(r.face_image) for r in old_records if r.face_image)
+        total_size = sum(len(r.face_image) for r in old_records if r.face_image) + archived["bytes"]
         
         print(f"\n🗑️  Records to clean:")
         print(f"  - Found: {len(old_records)} records")
+        print(f"  - Found in archive: {archived['records']} records")
         print(f"  - Older than: {cutoff_date.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"  - Space to free: {total_size:,} bytes ({total_size / 1024:.2f} KB, {total_size / (1024*1024):.2f} MB)")
         
@@ -133,12 +138,17 @@ def cleanup_old_records(days_to_keep: int, delete_records: bool = False):
         
         db.commit()
         
+        archived = attendance_archive.purge(cutoff_date, delete_records=delete_records)
+        bump_data_versions(db, archived["user_ids"])
+        db.commit()
+        
         print(f"\n✅ Cleanup complete!")
         print(f"  - Records processed: {len(old_records)}")
+        print(f"  - Archived records processed: {archived['records']}")
         print(f"  - Space freed: {total_size / (1024*1024):.2f} MB")
         
         # Run VACUUM to reclaim space (SQLite specific)
-        if delete_records:
+        if delete_records and old_records:
             print(f"\n🔧 Running VACUUM to reclaim disk space...")
             db.execute("VACUUM")
             print(f"✅ VACUUM complete")
@@ -168,19 +178,24 @@ def cleanup_by_user(user_id: int, days_to_keep: int):
             AttendanceRecord.face_image.isnot(None)
         ).all()
         
-        if not old_records:
+        archived = attendance_archive.purge(cutoff_date, user_id, dry_run=True)
+        
+        if not old_records and not archived["records"]:
             print(f"✅ No old records found for user {user.username}")
             return
         
-        total_size = sum(len(r.face_image) for r in old_records if r.face_image)
+        total_size = sum(len(r.face_image) for r in old_records if r.face_image) + archived["bytes"]
         
         print(f"\n🗑️  Cleaning records for user: {user.username}")
         print(f"  - Records: {len(old_records)}")
+        print(f"  - Archived records: {archived['records']}")
         print(f"  - Space to free: {total_size / 1024:.2f} KB")
         
         for record in old_records:
             record.face_image = None
         
+        attendance_archive.purge(cutoff_date, user_id)
+        bump_data_versions(db, [user_id])
         db.commit()
         print(f"✅ Cleanup complete for {user.username}")
         
@@ -197,14 +212,16 @@ def delete_all_face_images():
             AttendanceRecord.face_image.isnot(None)
         ).all()
         
-        if not records:
+        archived = attendance_archive.purge(None, dry_run=True)
+        
+        if not records and not archived["records"]:
             print("✅ No face images to delete")
             return
         
-        total_size = sum(len(r.face_image) for r in records if r.face_image)
+        total_size = sum(len(r.face_image) for r in records if r.face_image) + archived["bytes"]
         
         print(f"\n⚠️  EMERGENCY CLEANUP")
-        print(f"  - This will delete ALL {len(records)} face images")
+        print(f"  - This will delete ALL {len(records) + archived['records']} face images, archived ones included")
         print(f"  - Space to free: {total_size / (1024*1024):.2f} MB")
         print(f"  - Attendance data will be preserved")
         
@@ -217,6 +234,9 @@ def delete_all_face_images():
         for record in records:
             record.face_image = None
         
+        db.commit()
+        archived = attendance_archive.purge(None)
+        bump_data_versions(db, archived["user_ids"])
         db.commit()
         print(f"\n✅ All face images deleted!")
         print(f"  - Space freed: {total_size / (1024*1024):.2f} MB")
@@ -9,7 +9,8 @@ class Settings(BaseSettings):
     # JWT
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
     # Face Recognition
     FACE_RECOGNITION_TOLERANCE: float = 0.6
@@ -36,6 +37,120 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5MB
     ALLOWED_IMAGE_TYPES: list = ["image/jpeg", "image/png", "image/jpg"]
     
+    # Bulk ingestion (offline kiosks)
+    BULK_MAX_EVENTS: int = 500
+    BULK_MAX_CLOCK_SKEW_MINUTES: int = 5
+    IDEMPOTENCY_KEY_RETENTION_DAYS: int = 30  # events replayed later than this are ingested again
+    
+    # Read replica for GET endpoints, e.g. a PostgreSQL streaming standby or
+    # "sqlite:///file:mfa_attendance.db?mode=ro&uri=true" (unset: everything uses DATABASE_URL)
+    DATABASE_REPLICA_URL: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: float = 10.0  # a user's reads stay on the primary after their own write
+    
+    # Multi-site sharding (see sharding.py). Shard 0 is DATABASE_URL; extra
+    # shards as "1=postgresql://...;2=postgresql://..." and sites assigned
+    # to them as "plant-a=1,plant-b=2". Unassigned sites live on shard 0.
+    DEFAULT_SITE: str = "main"
+    SHARD_DATABASE_URLS: str = ""
+    SITE_SHARDS: str = ""
+    
+    # Worker pools for CPU-heavy work
+    FACE_POOL_WORKERS: int = 4
+    BCRYPT_POOL_WORKERS: int = 4
+    
+    # Background jobs (maintenance submitted by admins or on a schedule)
+    JOB_WORKERS: int = 2
+    JOB_PROGRESS_INTERVAL_SECONDS: float = 1.0  # min time between progress writes / cancel checks
+    JOB_HEARTBEAT_SECONDS: int = 30  # jobs not heard from for 3 heartbeats are failed as lost
+    JOB_RETENTION_DAYS: int = 30  # finished job records kept
+    STORAGE_CLEANUP_BATCH_SIZE: int = 500  # records per transaction
+    
+    # Readiness probe thresholds
+    READINESS_DB_TIMEOUT_MS: int = 500
+    READINESS_MAX_EXECUTOR_BACKLOG: int = 50
+    READINESS_MIN_FREE_DISK_MB: int = 200
+    
+    # Metrics
+    METRICS_ENABLED: bool = True
+    
+    # SQL instrumentation
+    QUERY_STATS_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 100.0
+    SLOW_QUERY_LOG_FILE: Optional[str] = None  # defaults to stderr
+    N_PLUS_ONE_THRESHOLD: int = 5  # identical statements per request before warning
+    
+    # Response compression
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes
+    GZIP_COMPRESSION_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    
+    # Live events (SSE)
+    LIVE_EVENTS_QUEUE_SIZE: int = 100
+    LIVE_EVENTS_HEARTBEAT_SECONDS: int = 15
+    
+    # Production server (gunicorn.conf.py)
+    BIND: str = "0.0.0.0:8000"
+    WEB_CONCURRENCY: int = 0  # worker processes; 0 = one per CPU core
+    WORKER_MAX_REQUESTS: int = 10000  # recycle a worker after this many requests
+    WORKER_MAX_REQUESTS_JITTER: int = 1000
+    WORKER_GRACEFUL_TIMEOUT: int = 30  # seconds to drain on SIGTERM
+    WORKER_TIMEOUT: int = 60
+    EVENT_RELAY_DIR: str = "/tmp/mfa-attendance-events"  # live events shared between workers
+    PROMETHEUS_MULTIPROC_DIR: str = "/tmp/mfa-attendance-metrics"  # metrics merged across workers
+    METRICS_FLUSH_SECONDS: float = 1.0  # how often each worker publishes its metrics there
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""  # per-logger overrides, e.g. "services.auth_service=DEBUG,sql.slow=WARNING"
+    LOG_FORMAT: str = "json"  # json or text
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0  # fraction of DEBUG records kept
+    LOG_QUEUE_SIZE: int = 10000  # records buffered before new ones are dropped
+    
+    # PostgreSQL partitioning of attendance_records (applied by migrate.py)
+    ATTENDANCE_PARTITIONING: bool = False
+    ATTENDANCE_PARTITION_MONTHS_AHEAD: int = 3  # future monthly partitions kept ready
+    
+    # Audit logs (login_attempts, security_events)
+    AUDIT_RETENTION_DAYS: int = 90  # raw rows; hourly/daily rollups are kept
+    AUDIT_PRUNE_BATCH_SIZE: int = 5000  # rows deleted per transaction
+    AUDIT_MAINTENANCE_INTERVAL_MINUTES: int = 60  # 0 disables the in-app job
+    
+    # Cold archive of closed months (archive_attendance.py)
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_AFTER_MONTHS: int = 12  # months kept in the database before archiving
+    ARCHIVE_COMPRESSION: str = "zstd"
+    
+    # Per-IP admission control for bcrypt- and image-heavy endpoints
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_LOGIN_PER_MINUTE: float = 30  # 0 = unlimited
+    RATE_LIMIT_LOGIN_BURST: int = 10
+    RATE_LIMIT_REGISTER_PER_MINUTE: float = 5
+    RATE_LIMIT_REGISTER_BURST: int = 5
+    RATE_LIMIT_FACE_PER_MINUTE: float = 60  # verify-face, register-face, check-in
+    RATE_LIMIT_FACE_BURST: int = 20
+    RATE_LIMIT_MAX_CLIENTS: int = 10000  # buckets kept per worker, least recently used evicted
+    RATE_LIMIT_EXEMPT_IPS: str = ""  # comma-separated, e.g. office kiosks behind one NAT address
+    
+    # Replayed check-in photos (near-duplicates of the user's earlier check-ins)
+    REPLAY_DETECTION_ENABLED: bool = True
+    REPLAY_REJECT: bool = False  # reject instead of flagging the check-in
+    REPLAY_WINDOW_DAYS: int = 90  # earlier check-ins compared against
+    REPLAY_MAX_DISTANCE: int = 12  # differing bits out of 256 (15 at most)
+    REPLAY_INDEX_MAX_USERS: int = 10000  # users kept in memory per worker
+    
+    # Org-wide analytics (/api/admin/analytics)
+    ANALYTICS_WORKDAY_START: str = "09:00"  # local time; later first check-ins count as late
+    ANALYTICS_LATE_GRACE_MINUTES: int = 5
+    ANALYTICS_HISTOGRAM_BIN_MINUTES: int = 15
+    ANALYTICS_CACHE_PERIODS: int = 32  # reports kept per worker
+    ANALYTICS_MAX_DAYS: int = 366
+    
+    # Request profiler (armed at runtime by an admin)
+    PROFILE_DIR: str = "./profiles"
+    PROFILE_MAX_CAPTURES: int = 50
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILE_HEADER_TOKEN_MAX_TTL_SECONDS: int = 3600
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
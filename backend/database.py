@@ -1,16 +1,34 @@
-from sqlalchemy import create_engine
+from sqlalchemy import String, create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
+from metrics import instrument_sessions
+from query_stats import instrument_engine
+
+def _connect_args(url: str) -> dict:
+    return {"check_same_thread": False} if "sqlite" in url else {}
 
 # Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+engine = create_engine(settings.DATABASE_URL, connect_args=_connect_args(settings.DATABASE_URL))
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine)
+
+# Read-only engine for GET endpoints (see replica.py), if a replica is configured
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_engine(settings.DATABASE_REPLICA_URL, connect_args=_connect_args(settings.DATABASE_REPLICA_URL))
+    instrument_engine(replica_engine)
+else:
+    replica_engine = None
+
+# Create session factory. A request commits once, at the end of its unit of
+# work; objects stay loaded afterwards so building the response (ids,
+# timestamps, the current user) needs no refresh queries.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+instrument_sessions(SessionLocal)
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_engine)
+    if replica_engine is not None else None
+)
 
 # Create base class for models
 Base = declarative_base()
@@ -22,3 +40,40 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def add_missing_columns(bind):
+    """Add columns declared on the models but missing from existing tables"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None and isinstance(column.server_default.arg, str):
+                    default = column.server_default.arg
+                    if isinstance(column.type, String):
+                        default = "'" + default.replace("'", "''") + "'"
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+
+def add_missing_indexes(bind):
+    """Create indexes declared on the models but missing from existing tables"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind)
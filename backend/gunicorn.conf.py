@@ -0,0 +1,74 @@
+"""
+Gunicorn settings for production
+Loaded automatically when gunicorn starts from this directory:
+
+  python migrate.py
+  gunicorn main:app
+"""
+
+import multiprocessing
+import os
+import shutil
+
+from config import settings
+
+bind = settings.BIND
+workers = settings.WEB_CONCURRENCY or multiprocessing.cpu_count()
+worker_class = "worker.DrainingUvicornWorker"
+
+# Import the app once in the master; workers fork from it and share its
+# memory copy-on-write. Importing main has no side effects (no DB access).
+preload_app = True
+
+# Recycle workers to bound memory growth; jitter avoids simultaneous restarts
+max_requests = settings.WORKER_MAX_REQUESTS
+max_requests_jitter = settings.WORKER_MAX_REQUESTS_JITTER
+
+# SIGTERM: stop accepting, finish in-flight requests, then run lifespan shutdown
+graceful_timeout = settings.WORKER_GRACEFUL_TIMEOUT
+timeout = settings.WORKER_TIMEOUT
+keepalive = 5
+
+
+def on_starting(server):
+    # Fresh relay and metrics directories; leftovers belong to old workers
+    for directory in (settings.EVENT_RELAY_DIR, settings.PROMETHEUS_MULTIPROC_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def post_fork(server, worker):
+    from database import engine, replica_engine
+    from metrics import registry
+    from services.event_bus import attendance_events
+    from sharding import shard_map
+
+    # Never share pooled connections inherited from the master
+    engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
+    for shard in shard_map.all():
+        if shard.engine is not engine:
+            shard.engine.dispose(close=False)
+    if server.cfg.workers > 1:
+        attendance_events.enable_worker_relay(settings.EVENT_RELAY_DIR)
+        registry.enable_multiprocess(settings.PROMETHEUS_MULTIPROC_DIR, settings.METRICS_FLUSH_SECONDS)
+
+
+def worker_exit(server, worker):
+    from metrics import registry
+
+    # Publish the last samples before the master folds them into the archive
+    registry.flush()
+
+
+def child_exit(server, worker):
+    from metrics import registry
+
+    if server.cfg.workers > 1:
+        registry.mark_process_dead(settings.PROMETHEUS_MULTIPROC_DIR, worker.pid)
+
+
+def on_exit(server):
+    for directory in (settings.EVENT_RELAY_DIR, settings.PROMETHEUS_MULTIPROC_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
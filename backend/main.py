@@ -1,38 +1,138 @@
+import time
+
+# Measured from the first import so worker boot time can be reported
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
-import uvicorn
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
-from database import engine, get_db
-from models import Base
-from routers import auth, attendance, storage
+from database import get_db, engine
+from routers import auth, attendance, storage, admin
 from services.auth_service import AuthService
+from services.presence import presence_table
+from services.event_bus import attendance_events
+from services.health import readiness
+from services.executors import face_pool, bcrypt_pool
 from config import settings
+from responses import FastJSONResponse
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.query_stats import QueryStatsMiddleware
+from middleware.profiler import ProfilerMiddleware
+from middleware.rate_limit import RateLimitMiddleware
+from query_stats import configure_slow_query_log
+from metrics import registry, startup_duration
+from logging_config import setup_logging, flush_logging
+from partitioning import partitioning_enabled
+from sharding import shard_map
+from services.jobs import job_runner
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
+async def run_periodically(job, interval_seconds: float, name: str):
+    """Run a blocking maintenance job in a thread now and every ``interval_seconds``"""
+    while True:
+        try:
+            await asyncio.to_thread(job)
+        except Exception:
+            logger.exception("%s failed", name)
+        await asyncio.sleep(interval_seconds)
+
+def schedule_job(kind: str):
+    """Submit a background job unless one of the same kind is already queued or running"""
+    return lambda: job_runner.submit(kind)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    print("🚀 Starting MFA Attendance System...")
-    print(f"📊 Database: {settings.DATABASE_URL}")
-    print(f"🔐 JWT Secret: {'*' * 20}")
+    # Startup (credentials in the database URL stay out of the log)
+    startup_started = time.perf_counter()
+    setup_logging()
+    if settings.QUERY_STATS_ENABLED:
+        configure_slow_query_log()
+    database = make_url(settings.DATABASE_URL).render_as_string(hide_password=True)
+    logger.info("starting MFA Attendance System", extra={"database": database})
+    try:
+        presence_table.rebuild()
+    except (OperationalError, ProgrammingError):
+        # The schema is created by `python migrate.py`, not at startup
+        logger.error("database schema is missing or outdated; run `python migrate.py`")
+        raise
+    
+    # Heartbeat background jobs; keep future monthly attendance partitions created,
+    # prune idempotency keys, roll up and prune audit logs (all but the first as background jobs)
+    maintenance_tasks = [asyncio.create_task(
+        run_periodically(job_runner.maintain, settings.JOB_HEARTBEAT_SECONDS, "background job maintenance")
+    )]
+    if any(partitioning_enabled(shard.engine) for shard in shard_map.all()):
+        maintenance_tasks.append(asyncio.create_task(
+            run_periodically(schedule_job("ensure_partitions"), 24 * 3600, "creating attendance partitions")
+        ))
+    maintenance_tasks.append(asyncio.create_task(
+        run_periodically(schedule_job("prune_idempotency_keys"), 24 * 3600, "pruning idempotency keys")
+    ))
+    if settings.AUDIT_MAINTENANCE_INTERVAL_MINUTES > 0:
+        maintenance_tasks.append(asyncio.create_task(
+            run_periodically(schedule_job("audit_maintenance"), settings.AUDIT_MAINTENANCE_INTERVAL_MINUTES * 60, "audit log maintenance")
+        ))
+    
+    startup_duration.labels("import").set(import_seconds)
+    startup_duration.labels("lifespan").set(time.perf_counter() - startup_started)
+    logger.info("startup complete", extra={
+        "import_ms": round(import_seconds * 1000, 1),
+        "lifespan_ms": round((time.perf_counter() - startup_started) * 1000, 1)
+    })
     yield
     # Shutdown
-    print("🛑 Shutting down MFA Attendance System...")
+    logger.info("shutting down MFA Attendance System")
+    for task in maintenance_tasks:
+        task.cancel()
+    attendance_events.close()
+    await asyncio.to_thread(job_runner.shutdown)
+    face_pool.shutdown()
+    bcrypt_pool.shutdown()
+    flush_logging()
 
 app = FastAPI(
     title="MFA Attendance System",
     description="Multi-Factor Authentication with Facial Recognition and Attendance Tracking",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+
+# Request profiler (innermost; idle until an admin arms it)
+app.add_middleware(ProfilerMiddleware)
+
+# Compression middleware
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.GZIP_COMPRESSION_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
 )
 
+# SQL instrumentation middleware (Server-Timing header, N+1 warnings)
+if settings.QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware, n_plus_one_threshold=settings.N_PLUS_ONE_THRESHOLD)
+
+# Per-IP rate limiting of bcrypt- and image-heavy routes (inside metrics, so 429s are counted)
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
+# Metrics middleware (wraps compression, so latency includes it)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -46,6 +146,7 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(attendance.router, prefix="/api/attendance", tags=["Attendance"])
 app.include_router(storage.router, prefix="/api/storage", tags=["Storage Management"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 @app.get("/")
 async def root():
@@ -55,29 +156,55 @@ async def root():
         "status": "active",
         "endpoints": {
             "auth": "/api/auth",
+            "health": "/health/ready",
             "attendance": "/api/attendance",
             "admin": "/api/admin",
             "docs": "/docs"
         }
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process is up and the event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: database, connection pool, worker pools and disk are all healthy"""
+    result = await readiness()
+    status_code = status.HTTP_200_OK if result["status"] == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE
+    return FastJSONResponse(result, status_code=status_code)
+
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "timestamp": "2024-01-01T00:00:00Z",
-        "services": {
-            "database": "connected",
-            "face_recognition": "ready",
-            "totp": "ready"
-        }
-    }
+    """Kept for existing load balancer configs; same as /health/ready"""
+    return await readiness_check()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    # Merging other workers' samples reads files
+    body = await asyncio.to_thread(registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+import_seconds = time.perf_counter() - _import_started
 
 if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    from migrate import migrate
+
+    parser = argparse.ArgumentParser(description="Run the development server")
+    parser.add_argument("--reload", action="store_true", help="Restart on code changes (development only)")
+    args = parser.parse_args()
+
+    # Development convenience; deployments run `python migrate.py` once instead
+    migrate()
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=args.reload,
         log_level="info"
     )
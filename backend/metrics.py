@@ -0,0 +1,423 @@
+"""
+Minimal in-process metrics registry with Prometheus text exposition
+Counters, gauges and histograms keyed by label values. Under several worker
+processes each one writes its samples to a shared directory and a scrape of
+any worker merges them, like prometheus_client's multiprocess mode.
+"""
+
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Label names of samples merged across processes
+        self.merged_labelnames = self.labelnames
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """Child for the given label values; creation is the only locked path"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        """JSON-serialisable state of every child"""
+        return {key: child.state() for key, child in list(self._children.items())}
+
+    def _merge(self, total, state):
+        return total + state
+
+    def fold(self, totals: dict, rows: list, pid: Optional[str]):
+        """Add one process's ``[labels, state]`` rows to ``totals`` (pid is None for finished processes)"""
+        for key, state in rows:
+            key = tuple(key)
+            totals[key] = self._merge(totals[key], state) if key in totals else state
+
+    def _samples(self, samples: dict, labelnames: Sequence[str]) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self, merged: Optional[dict] = None) -> str:
+        """This process's samples, or ``merged`` ones built with ``fold``"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        if merged is None:
+            lines.extend(self._samples(self.snapshot(), self.labelnames))
+        else:
+            lines.extend(self._samples(merged, self.merged_labelnames))
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def state(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self, samples: dict, labelnames: Sequence[str]) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(labelnames, key)} {_format_value(value)}"
+            for key, value in samples.items()
+        ]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Gauge(_Metric):
+    """
+    ``multiprocess_mode`` decides how worker processes combine: ``livesum``
+    adds up the live workers' values, ``liveall`` keeps one sample per live
+    worker under a ``pid`` label. Values of finished workers are dropped.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 multiprocess_mode: str = "livesum"):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ("livesum", "liveall"):
+            raise ValueError(f"unknown multiprocess_mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        if multiprocess_mode == "liveall":
+            self.merged_labelnames = self.labelnames + ("pid",)
+
+    def fold(self, totals: dict, rows: list, pid: Optional[str]):
+        if pid is None:
+            return
+        if self.multiprocess_mode == "liveall":
+            rows = [(list(key) + [pid], state) for key, state in rows]
+        super().fold(totals, rows, pid)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self, samples: dict, labelnames: Sequence[str]) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(labelnames, key)} {_format_value(value)}"
+            for key, value in samples.items()
+        ]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def state(self) -> list:
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _merge(self, total, state):
+        return [[a + b for a, b in zip(total[0], state[0])], total[1] + state[1]]
+
+    def _samples(self, samples: dict, labelnames: Sequence[str]) -> List[str]:
+        lines = []
+        for key, (counts, total) in samples.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+_PROCESS_FILE = re.compile(r"^(\d+)\.json$")
+_ARCHIVE_FILE = "archive.json"
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, payload: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._directory: Optional[str] = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def enable_multiprocess(self, directory: str, interval: float):
+        """
+        Share samples with sibling worker processes through ``directory``
+        (call after fork). This process rewrites ``<pid>.json`` there every
+        ``interval`` seconds and before each scrape; render() merges every
+        process's file, so other workers' samples are at most that old.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        threading.Thread(target=self._flush_loop, args=(interval,), name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        """Write this process's samples for sibling workers (no-op outside multiprocess mode)"""
+        if self._directory is None:
+            return
+        payload = {
+            metric.name: [[list(key), state] for key, state in metric.snapshot().items()]
+            for metric in self._metrics
+        }
+        with self._flush_lock:
+            _write_json(os.path.join(self._directory, f"{os.getpid()}.json"), payload)
+
+    def _fold(self, totals: Dict[str, dict], payload: dict, pid: Optional[str]):
+        for metric in self._metrics:
+            metric.fold(totals[metric.name], payload.get(metric.name, []), pid)
+
+    def mark_process_dead(self, directory: str, pid: int):
+        """
+        Fold a finished worker's counters and histograms into the archive
+        and drop its gauges. Called by the gunicorn master (child_exit).
+        """
+        name = f"{pid}.json"
+        payload = _read_json(os.path.join(directory, name))
+        if payload is None:
+            return
+        archive_path = os.path.join(directory, _ARCHIVE_FILE)
+        archive = _read_json(archive_path) or {"merged": [], "metrics": {}}
+        totals = {metric.name: {} for metric in self._metrics}
+        self._fold(totals, archive["metrics"], None)
+        self._fold(totals, payload, None)
+        metrics = {
+            metric_name: [[list(key), state] for key, state in samples.items()]
+            for metric_name, samples in totals.items()
+        }
+        # Scrapes skip files listed in "merged" until they are gone, so the
+        # worker is never counted twice
+        _write_json(archive_path, {"merged": [name], "metrics": metrics})
+        os.remove(os.path.join(directory, name))
+        _write_json(archive_path, {"merged": [], "metrics": metrics})
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        if self._directory is None:
+            return "\n".join(metric.expose() for metric in self._metrics) + "\n"
+
+        self.flush()
+        archive_path = os.path.join(self._directory, _ARCHIVE_FILE)
+        archive = _read_json(archive_path)
+        while True:
+            payloads = {}
+            for name in os.listdir(self._directory):
+                match = _PROCESS_FILE.match(name)
+                if match is None or (archive and name in archive["merged"]):
+                    continue
+                payload = _read_json(os.path.join(self._directory, name))
+                if payload is not None:
+                    payloads[match.group(1)] = payload
+            # A worker folded into the archive meanwhile may be missing from
+            # both or present in both; read again rather than dip or spike
+            latest = _read_json(archive_path)
+            if latest == archive:
+                break
+            archive = latest
+
+        totals = {metric.name: {} for metric in self._metrics}
+        if archive:
+            self._fold(totals, archive["metrics"], None)
+        for pid, payload in payloads.items():
+            self._fold(totals, payload, pid)
+        return "\n".join(metric.expose(totals[metric.name]) for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code",
+    ("method", "route", "status")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed"
+))
+stage_duration = registry.register(Histogram(
+    "stage_duration_seconds",
+    "Latency of expensive stages inside request handlers",
+    ("stage",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request",
+    "SQL statements executed per HTTP request",
+    ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+))
+startup_duration = registry.register(Gauge(
+    "app_startup_seconds",
+    "Worker boot time: importing the app and running lifespan startup",
+    ("phase",),
+    multiprocess_mode="liveall"
+))
+face_verifications = registry.register(Counter(
+    "face_verifications",
+    "Face verification outcomes",
+    ("result",)
+))
+rate_limit_decisions = registry.register(Counter(
+    "rate_limit_decisions",
+    "Admission decisions for rate-limited routes",
+    ("route_class", "result")
+))
+
+db_read_routes = registry.register(Counter(
+    "db_read_routes",
+    "Sessions of read-only endpoints by database and reason",
+    ("route",)
+))
+background_jobs = registry.register(Counter(
+    "background_jobs",
+    "Finished background jobs by kind and outcome",
+    ("kind", "status")
+))
+background_job_duration = registry.register(Histogram(
+    "background_job_duration_seconds",
+    "Run time of background jobs",
+    ("kind",),
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+))
+
+
+def stage_timer(stage: str):
+    """Context manager timing one named stage, e.g. ``with stage_timer("verify_password"):``"""
+    return stage_duration.labels(stage).time()
+
+
+def instrument_sessions(session_factory):
+    """Record commit latency (including the flush) for sessions from this factory"""
+    from sqlalchemy import event
+
+    @event.listens_for(session_factory, "before_commit")
+    def _before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            stage_duration.labels("db_commit").observe(time.perf_counter() - started)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("commit_started", None)
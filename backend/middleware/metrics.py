@@ -0,0 +1,60 @@
+"""
+Request latency and in-flight metrics middleware
+"""
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import http_request_duration, http_requests_in_flight
+
+
+def route_template(scope: Scope) -> str:
+    """Matched route template for a finished request, or 'unmatched'"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    # Newer FastAPI versions keep included routers nested and report the
+    # route's path without the include prefix
+    included_router = scope.get("fastapi", {}).get("included_router")
+    prefix = getattr(getattr(included_router, "include_context", None), "prefix", "")
+    if prefix and not path.startswith(prefix):
+        path = prefix + path
+    return path
+
+
+class MetricsMiddleware:
+    """
+    Time every HTTP request and label it with the matched route template
+    (e.g. ``/api/attendance/records``) rather than the raw path, so
+    path parameters and scanners can't blow up label cardinality.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.labels(
+                scope["method"],
+                route_template(scope),
+                status_code
+            ).observe(time.perf_counter() - start)
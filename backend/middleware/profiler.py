@@ -0,0 +1,83 @@
+"""
+Per-request profiler middleware
+"""
+
+import asyncio
+import cProfile
+import marshal
+import threading
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from profiling import StackSampler, capture_store, profiler_state
+
+PROFILE_HEADER = "x-profile"
+
+# Long-lived responses would hold the single capture slot for as long as the
+# client stays connected
+STREAMING_PATHS = frozenset({"/api/attendance/live"})
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests selected by the admin-controlled ProfilerState.
+
+    While no trigger is armed this is an attribute check per request, plus a
+    stat of the shared trigger file once a second. Only one capture runs at a
+    time; requests arriving meanwhile, and event streams, are served
+    unprofiled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            profiler_state.refresh()
+        if scope["type"] != "http" or not profiler_state.armed or scope["path"] in STREAMING_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        header_value = Headers(scope=scope).get(PROFILE_HEADER)
+        if not profiler_state.should_profile(scope["path"], header_value) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._busy.release()
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send):
+        mode = profiler_state.mode
+        extension = "folded" if mode == "sampling" else "pstats"
+        name = capture_store.new_name(scope["method"], scope["path"], extension)
+
+        async def send_with_capture_name(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Capture", name)
+            await send(message)
+
+        if mode == "sampling":
+            sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL_MS)
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_with_capture_name)
+            finally:
+                data = sampler.stop().encode()
+        else:
+            # cProfile only sees the event loop thread, including any other
+            # requests interleaved with this one while it is enabled
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await self.app(scope, receive, send_with_capture_name)
+            finally:
+                profile.disable()
+                profile.create_stats()
+                data = marshal.dumps(profile.stats)
+
+        await asyncio.to_thread(capture_store.save, name, data)
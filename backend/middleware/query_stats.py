@@ -0,0 +1,58 @@
+"""
+Server-Timing and N+1 reporting for the SQL issued by each request
+"""
+
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import db_queries_per_request
+from middleware.metrics import route_template
+from query_stats import track_queries
+
+n_plus_one_logger = logging.getLogger("sql.n_plus_one")
+
+
+class QueryStatsMiddleware:
+    """
+    Add ``Server-Timing: db;dur=..;desc="N queries", db-slowest;dur=.., app;dur=..``
+    to every response and warn when a request repeats the same statement many
+    times. The slowest statement's text goes to the slow-query log once it
+    crosses SLOW_QUERY_THRESHOLD_MS, never to the client.
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 5):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+
+        with track_queries() as stats:
+            async def send_with_timing(message: Message):
+                if message["type"] == "http.response.start":
+                    app_ms = (time.perf_counter() - start) * 1000
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries", '
+                        f'db-slowest;dur={stats.slowest_ms:.2f}, app;dur={app_ms:.2f}'
+                    )
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        route = route_template(scope)
+        db_queries_per_request.labels(route).observe(stats.count)
+
+        for statement, count in stats.repeated_statements(self.n_plus_one_threshold):
+            n_plus_one_logger.warning(
+                "possible N+1 on %s %s: statement ran %d times: %s",
+                scope["method"], route, count, " ".join(statement.split())
+            )
@@ -0,0 +1,52 @@
+"""
+Admission control for bcrypt- and image-heavy endpoints
+"""
+
+import math
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import rate_limit_decisions
+from rate_limit import TokenBucketLimiter, exempt_clients, limiter, route_class
+from responses import FastJSONResponse
+
+
+class RateLimitMiddleware:
+    """
+    Refuse requests over their client's budget with 429 and ``Retry-After``
+    before the body is read, so password hashing and image decoding only run
+    for admitted requests. Other routes pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: TokenBucketLimiter = limiter,
+                 exempt: frozenset = exempt_clients):
+        self.app = app
+        self.limiter = limiter
+        self.exempt = exempt
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope["method"], scope["path"])
+        client = scope.get("client")
+        host = client[0] if client else "unknown"
+        if name is None or host in self.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.limiter.acquire(name, host)
+        if not wait:
+            rate_limit_decisions.labels(name, "admitted").inc()
+            await self.app(scope, receive, send)
+            return
+
+        rate_limit_decisions.labels(name, "limited").inc()
+        retry_after = max(1, math.ceil(wait))
+        response = FastJSONResponse(
+            {"detail": f"Too many requests, retry in {retry_after} seconds"},
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+        await response(scope, receive, send)
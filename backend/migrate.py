@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Database schema setup
+Creates missing tables, adds columns and indexes introduced since the
+database was created, and partitions attendance_records when
+ATTENDANCE_PARTITIONING is on, on every shard. Run once per deploy, before
+starting workers:
+
+  python migrate.py
+"""
+
+from sqlalchemy import inspect, text
+
+from database import engine, add_missing_columns, add_missing_indexes
+from models import Base, AttendanceRecord
+from partitioning import is_partitioned, partitioning_enabled, partition_attendance_records
+
+
+def upgrade_idempotency_keys(bind):
+    """
+    Idempotency keys used to be unique on their own; they are unique per
+    user now. On PostgreSQL the attendance_id foreign key also gains
+    ON DELETE SET NULL (SQLite does not enforce foreign keys here).
+    """
+    inspector = inspect(bind)
+    if not inspector.has_table("idempotency_keys"):
+        return
+    with bind.begin() as conn:
+        if any(index["name"] == "ix_idempotency_keys_key" for index in inspector.get_indexes("idempotency_keys")):
+            conn.execute(text("DROP INDEX ix_idempotency_keys_key"))
+        if bind.dialect.name != "postgresql" or is_partitioned(conn):
+            return
+        for foreign_key in inspector.get_foreign_keys("idempotency_keys"):
+            if foreign_key["referred_table"] != "attendance_records":
+                continue
+            if (foreign_key.get("options") or {}).get("ondelete", "").upper() == "SET NULL":
+                return
+            conn.execute(text(f'ALTER TABLE idempotency_keys DROP CONSTRAINT "{foreign_key["name"]}"'))
+        conn.execute(text(
+            "ALTER TABLE idempotency_keys ADD CONSTRAINT fk_idempotency_keys_attendance_id "
+            "FOREIGN KEY (attendance_id) REFERENCES attendance_records (id) ON DELETE SET NULL"
+        ))
+
+
+def migrate(bind=engine):
+    """Create missing tables, columns and indexes; safe to run repeatedly"""
+    if partitioning_enabled(bind):
+        tables = [table for table in Base.metadata.sorted_tables if table is not AttendanceRecord.__table__]
+        Base.metadata.create_all(bind=bind, tables=tables)
+        partition_attendance_records(bind)
+    else:
+        Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    upgrade_idempotency_keys(bind)
+    add_missing_indexes(bind)
+
+
+if __name__ == "__main__":
+    from sharding import shard_map
+
+    for shard in shard_map.all():
+        label = f"shard {shard.number} " if len(shard_map.shards) > 1 else ""
+        print(f"📊 Migrating {label}{shard.engine.url.render_as_string(hide_password=True)}...")
+        migrate(shard.engine)
+    print("✅ Database schema is up to date")
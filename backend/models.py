@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Text, ForeignKey, ForeignKeyConstraint, Float, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from config import settings
 from database import Base
 
+def _unless_partitioned(ddl, target, bind, dialect=None, **kw):
+    """A partitioned attendance_records has no unique key on id alone, so foreign keys can't point at it"""
+    return not (settings.ATTENDANCE_PARTITIONING and dialect.name == "postgresql")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -12,6 +17,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
+    is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -30,6 +36,12 @@ class User(Base):
     login_attempts = Column(Integer, default=0)
     locked_until = Column(DateTime(timezone=True), nullable=True)
     
+    # Bumped whenever the user's profile or attendance data changes (used for ETags)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    # Site (tenant) the user belongs to; decides the user's shard (sharding.py)
+    site = Column(String(50), nullable=False, index=True, default=settings.DEFAULT_SITE, server_default=settings.DEFAULT_SITE)
+    
     # Relationships
     attendance_records = relationship("AttendanceRecord", back_populates="user")
 
@@ -46,10 +58,17 @@ class AttendanceRecord(Base):
     face_image = Column(Text, nullable=True)  # base64 encoded face image
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(Text, nullable=True)
+    image_hash = Column(String(64), nullable=True)  # hex difference hash of face_image (services/replay.py)
+    replay_of = Column(Integer, nullable=True)  # earlier record whose photo this one nearly duplicates
+    site = Column(String(50), nullable=False, default=settings.DEFAULT_SITE, server_default=settings.DEFAULT_SITE)  # the user's site
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="attendance_records")
+    
+    __table_args__ = (
+        Index("ix_attendance_records_user_id_check_in_time", "user_id", "check_in_time"),
+    )
 
 class LoginAttempt(Base):
     __tablename__ = "login_attempts"
@@ -62,6 +81,11 @@ class LoginAttempt(Base):
     success = Column(Boolean, default=False)
     failure_reason = Column(String(100), nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_login_attempts_timestamp_id", "timestamp", "id"),  # paging and pruning
+        Index("ix_login_attempts_username_timestamp", "username", "timestamp"),  # lockout checks
+    )
 
 class SecurityEvent(Base):
     __tablename__ = "security_events"
@@ -73,3 +97,99 @@ class SecurityEvent(Base):
     ip_address = Column(String(45), nullable=True)
     severity = Column(String(20), default="info")  # info, warning, error, critical
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_security_events_timestamp_id", "timestamp", "id"),
+        Index("ix_security_events_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+class LoginAttemptRollup(Base):
+    """Login attempts per username and IP address per hour (UTC); kept after raw rows are pruned"""
+    __tablename__ = "login_attempt_rollups"
+    
+    id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, nullable=False)
+    username = Column(String(50), nullable=False)  # "" when the attempt had none
+    ip_address = Column(String(45), nullable=False)
+    user_id = Column(Integer, nullable=True)  # no foreign key: rollups outlive deleted users
+    attempts = Column(Integer, nullable=False)
+    failures = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "username", "ip_address", name="uq_login_attempt_rollups_bucket"),
+    )
+
+class SecurityEventRollup(Base):
+    """Security events per type and severity per day (UTC)"""
+    __tablename__ = "security_event_rollups"
+    
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    severity = Column(String(20), nullable=False)
+    count = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("day", "event_type", "severity", name="uq_security_event_rollups_bucket"),
+    )
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 hex of the raw token
+    family_id = Column(String(32), index=True, nullable=False)  # shared by every rotation of one login
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    ip_address = Column(String(45), nullable=True)
+    user_agent = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    """A background job (services/jobs.py); timestamps are naive UTC"""
+    __tablename__ = "jobs"
+    
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    kind = Column(String(50), nullable=False)  # storage_cleanup, vacuum, audit_maintenance, ...
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed, cancelled
+    params = Column(Text, nullable=True)  # JSON keyword arguments
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    message = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_by = Column(Integer, nullable=True)  # no foreign key: job history outlives deleted users
+    worker = Column(String(100), nullable=True)  # host:pid of the process running it
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=False)  # refreshed while queued or running
+    exclusive = Column(Boolean, nullable=True)  # at most one queued or running job of this kind
+    
+    __table_args__ = (
+        Index("ix_jobs_created_at", "created_at"),
+        Index("ix_jobs_status_heartbeat_at", "status", "heartbeat_at"),
+        # Enforces exclusive kinds across worker processes
+        Index("ux_jobs_active_exclusive_kind", "kind", unique=True,
+              sqlite_where=text("exclusive AND status IN ('queued', 'running')"),
+              postgresql_where=text("exclusive AND status IN ('queued', 'running')")),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(64), nullable=False)  # client-generated, e.g. a UUID; unique per user
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    event_type = Column(String(20), nullable=False)  # check_in, check_out
+    attendance_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ux_idempotency_keys_key_user_id", "key", "user_id", unique=True),
+        Index("ix_idempotency_keys_created_at", "created_at"),
+        # Deleting or archiving a record keeps its key (a replay stays a duplicate)
+        ForeignKeyConstraint(["attendance_id"], ["attendance_records.id"], ondelete="SET NULL",
+                             name="fk_idempotency_keys_attendance_id").ddl_if(callable_=_unless_partitioned),
+    )
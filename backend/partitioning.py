@@ -0,0 +1,247 @@
+"""
+Monthly partitioning of attendance_records (PostgreSQL only)
+With ATTENDANCE_PARTITIONING on, attendance_records is range-partitioned by
+check_in_time into one table per month, so date-range queries only scan the
+months they touch and retention drops whole months instead of deleting rows.
+
+Partition bounds are calendar months in the database session's time zone,
+the same zone naive ``datetime.now()`` values are stored in.
+"""
+
+import logging
+import re
+from datetime import date, datetime, time
+from typing import Dict, List, Optional
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, inspect, text
+
+from config import settings
+from models import AttendanceRecord
+
+logger = logging.getLogger(__name__)
+
+TABLE = AttendanceRecord.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Serializes partition DDL between workers and migrate.py
+_ADVISORY_LOCK_KEY = 0x6D666141  # "mfaA"
+
+_PARTITION_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def partitioning_enabled(bind) -> bool:
+    return settings.ATTENDANCE_PARTITIONING and bind.dialect.name == "postgresql"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"
+    ), {"table": TABLE}).scalar()
+
+
+def list_partitions(conn) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {"table": TABLE}).scalars())
+
+
+def _lock(conn):
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+
+
+def _partitioned_table():
+    """
+    The model's table, declared PARTITION BY RANGE. The primary key has to
+    include the partition key; the model's (user_id, check_in_time) index
+    is copied along and serves per-user range queries inside each month.
+    """
+    metadata = MetaData()
+    AttendanceRecord.metadata.tables["users"].to_metadata(metadata)
+    table = AttendanceRecord.__table__.to_metadata(metadata)
+    table.c.check_in_time.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.check_in_time))
+    table.c.id.autoincrement = True
+    table.dialect_kwargs["postgresql_partition_by"] = "RANGE (check_in_time)"
+    return table
+
+
+def _create_months(conn, months) -> List[str]:
+    """Create the missing partitions for ``months``, moving matching rows out of the default partition"""
+    existing = set(list_partitions(conn))
+    created = []
+    for month in months:
+        name = partition_name(month)
+        if name in existing:
+            continue
+        bounds = {"start": month, "end": add_months(month, 1)}
+        in_range = "check_in_time >= CAST(:start AS date) AND check_in_time < CAST(:end AS date)"
+
+        stray = conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds).scalar()
+        if not stray:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+            ))
+        else:
+            # A month's partition can't be created while the default partition
+            # holds rows for it: build it standalone, move the rows, then attach
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            conn.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+            conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+            conn.execute(text(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+            ))
+            logger.warning("moved rows out of the default partition", extra={"partition": name, "rows": stray})
+        created.append(name)
+    return created
+
+
+def ensure_partitions(bind, months_ahead: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """Create partitions for this month, ``months_ahead`` months after it and any month stuck in the default partition"""
+    if months_ahead is None:
+        months_ahead = settings.ATTENDANCE_PARTITION_MONTHS_AHEAD
+    this_month = (today or date.today()).replace(day=1)
+
+    with bind.begin() as conn:
+        _lock(conn)
+        if not is_partitioned(conn):
+            return []
+        # Also give months that only exist in the default partition (backdated
+        # or bulk-ingested rows) a partition of their own
+        stray_months = conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', check_in_time)::date FROM {DEFAULT_PARTITION}"
+        )).scalars().all()
+        months = sorted(set(stray_months) | {add_months(this_month, i) for i in range(months_ahead + 1)})
+        created = _create_months(conn, months)
+    if created:
+        logger.info("created attendance partitions", extra={"partitions": created})
+    return created
+
+
+def _create_partitioned(conn, months) -> None:
+    _partitioned_table().create(conn)
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+    _create_months(conn, months)
+
+
+def _convert(conn) -> int:
+    """Rebuild an existing plain attendance_records as a partitioned table; returns rows copied"""
+    old = f"{TABLE}_unpartitioned"
+
+    # Nothing can reference a partitioned table by id alone, and the old
+    # table's own foreign keys would take the new table's constraint names
+    for table, constraint in conn.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = to_regclass(:table)"
+    ), {"table": TABLE}).all():
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"'))
+
+    for constraint in conn.execute(text(
+        "SELECT conname FROM pg_constraint WHERE contype = 'f' AND conrelid = to_regclass(:table)"
+    ), {"table": TABLE}).scalars().all():
+        conn.execute(text(f'ALTER TABLE {TABLE} DROP CONSTRAINT "{constraint}"'))
+
+    # Free the table, sequence and index names for the new table
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": TABLE}).scalar()
+    indexes = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"
+    ), {"table": TABLE}).scalars().all()
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old}"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {old}_id_seq"))
+    for index in indexes:
+        conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{(index + "_unpartitioned")[:63]}"'))
+
+    first, last = conn.execute(text(
+        f"SELECT date_trunc('month', min(check_in_time))::date, date_trunc('month', max(check_in_time))::date FROM {old}"
+    )).one()
+    months = []
+    while first is not None and first <= last:
+        months.append(first)
+        first = add_months(first, 1)
+    _create_partitioned(conn, months)
+
+    existing = {column["name"] for column in inspect(conn).get_columns(old)}
+    columns = ", ".join(column.name for column in AttendanceRecord.__table__.columns if column.name in existing)
+    copied = conn.execute(text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {old}")).rowcount
+    conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"(SELECT coalesce(max(id), 0) + 1 FROM {TABLE}), false)"
+    ))
+    conn.execute(text(f"DROP TABLE {old}"))
+    return copied
+
+
+def partition_attendance_records(bind) -> None:
+    """Create attendance_records partitioned, converting a plain table in place; safe to run repeatedly"""
+    with bind.begin() as conn:
+        _lock(conn)
+        if is_partitioned(conn):
+            pass
+        elif inspect(conn).has_table(TABLE):
+            copied = _convert(conn)
+            logger.info("converted attendance_records to a partitioned table", extra={"rows": copied})
+        else:
+            _create_partitioned(conn, [])
+    ensure_partitions(bind)
+
+
+def drop_partitions_before(conn, cutoff: datetime) -> Dict:
+    """
+    Detach and drop every monthly partition that ends on or before ``cutoff``,
+    on the caller's transaction. Returns what was removed so callers can
+    report it and invalidate per-user caches.
+    """
+    removed = {"partitions": [], "records": 0, "bytes": 0, "user_ids": set()}
+    if not is_partitioned(conn):
+        return removed
+
+    _lock(conn)
+    for name in list_partitions(conn):
+        month = partition_month(name)
+        if month is None or datetime.combine(add_months(month, 1), time.min) > cutoff:
+            continue
+        for user_id, records, size in conn.execute(text(
+            f"SELECT user_id, count(*), coalesce(sum(length(face_image)), 0) FROM {name} GROUP BY user_id"
+        )):
+            removed["user_ids"].add(user_id)
+            removed["records"] += records
+            removed["bytes"] += size
+        conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        removed["partitions"].append(name)
+
+    if removed["partitions"]:
+        logger.info("dropped attendance partitions", extra={
+            "partitions": removed["partitions"], "records": removed["records"]
+        })
+    return removed
+
+
+def drop_partition_if_empty(conn, month: date) -> bool:
+    """Detach and drop ``month``'s partition once nothing is left in it (e.g. after archiving)"""
+    name = partition_name(month)
+    if name not in list_partitions(conn):
+        return False
+    _lock(conn)
+    if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+        return False
+    conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    return True
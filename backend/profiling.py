@@ -0,0 +1,223 @@
+"""
+Opt-in request profiling
+Admin-controlled triggers, a stack sampler producing folded (flamegraph) output,
+and a bounded on-disk ring of captures. Triggers and captures both live in
+PROFILE_DIR, so every worker process on the host sees the same ones.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Pattern
+
+from starlette.routing import compile_path
+
+from config import settings
+
+MODES = ("sampling", "deterministic")
+
+
+class ProfilerState:
+    """
+    Which requests to profile. Nothing is profiled until an admin arms at
+    least one trigger: a route template, a sampling rate, or signed headers.
+
+    ``configure`` writes the triggers to ``path`` and every worker re-reads
+    that file when it changes, checking at most once per ``RELOAD_SECONDS``,
+    so arming through any worker arms them all.
+    """
+
+    RELOAD_SECONDS = 1.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._apply([], 0.0, False, "sampling")
+        self._loaded = None
+        self._checked = 0.0
+
+    def _apply(self, routes: List[str], sample_rate: float, header_enabled: bool, mode: str):
+        self.routes: Dict[str, Pattern] = {route: compile_path(route)[0] for route in routes}
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self.mode = mode
+        self.armed = bool(self.routes) or self.sample_rate > 0 or self.header_enabled
+
+    def configure(self, routes: List[str], sample_rate: float, header_enabled: bool, mode: str):
+        self._apply(routes, sample_rate, header_enabled, mode)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"routes": routes, "sample_rate": sample_rate, "header_enabled": header_enabled, "mode": mode}, f)
+        os.replace(tmp, self.path)
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        """Pick up triggers written by another worker"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.RELOAD_SECONDS:
+            return
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stamp = None
+        else:
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._loaded:
+            return
+        config = {}
+        if stamp is not None:
+            try:
+                with open(self.path) as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                # Replaced mid-read; try again on the next check
+                return
+        self._apply(
+            config.get("routes", []),
+            config.get("sample_rate", 0.0),
+            config.get("header_enabled", False),
+            config.get("mode", "sampling")
+        )
+        self._loaded = stamp
+
+    def should_profile(self, path: str, header_value: Optional[str]) -> bool:
+        if self.header_enabled and header_value and verify_header_token(header_value):
+            return True
+        if any(pattern.match(path) for pattern in self.routes.values()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def as_dict(self) -> dict:
+        return {
+            "armed": self.armed,
+            "routes": list(self.routes),
+            "sample_rate": self.sample_rate,
+            "header_enabled": self.header_enabled,
+            "mode": self.mode
+        }
+
+
+def _sign(expires: int) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def issue_header_token(ttl_seconds: int) -> str:
+    """Value for the X-Profile header, valid for ``ttl_seconds``"""
+    expires = int(time.time()) + ttl_seconds
+    return f"{expires}.{_sign(expires)}"
+
+
+def verify_header_token(value: str) -> bool:
+    expires, _, signature = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _sign(int(expires)))
+
+
+class StackSampler:
+    """
+    Samples every thread's Python stack at a fixed interval and aggregates
+    them in the folded format (``thread;module:func;... count``) accepted by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class CaptureStore:
+    """
+    Keeps the newest ``max_captures`` profile files in a directory. Workers
+    sharing the directory prune it independently, so a capture may vanish
+    between listing and removal.
+    """
+
+    _NAME = re.compile(r"^\w[\w.\-]*$")
+
+    def __init__(self, directory: str, max_captures: int):
+        self.directory = directory
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+
+    def new_name(self, method: str, path: str, extension: str) -> str:
+        slug = re.sub(r"[^\w]+", "_", path).strip("_") or "root"
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        return f"{stamp}_{method.lower()}_{slug}.{extension}"
+
+    def save(self, name: str, data: bytes):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(data)
+            captures = self.list()
+            for capture in captures[self.max_captures:]:
+                try:
+                    os.remove(os.path.join(self.directory, capture["name"]))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[dict]:
+        """Captures, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        captures = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and self._NAME.match(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                captures.append({
+                    "name": entry.name,
+                    "size_bytes": stat.st_size,
+                    "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+        return sorted(captures, key=lambda capture: capture["name"], reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        """Absolute path of an existing capture, or None (rejects path traversal)"""
+        if not self._NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+profiler_state = ProfilerState(os.path.join(settings.PROFILE_DIR, ".triggers.json"))
+capture_store = CaptureStore(settings.PROFILE_DIR, settings.PROFILE_MAX_CAPTURES)
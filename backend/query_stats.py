@@ -0,0 +1,123 @@
+"""
+Per-request SQL instrumentation
+Counts statements, sums DB time, times the slowest statement and flags likely N+1 patterns
+"""
+
+import logging
+import threading
+import time
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from config import settings
+from logging_config import make_formatter, queue_handler
+
+slow_query_logger = logging.getLogger("sql.slow")
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total_ms: float = 0.0
+    slowest_ms: float = 0.0
+    statements: StatementCounter = field(default_factory=StatementCounter)
+
+    def record(self, statement: str, duration_ms: float):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.statements[statement] += 1
+        self.slowest_ms = max(self.slowest_ms, duration_ms)
+
+    def repeated_statements(self, threshold: int):
+        """Statements issued at least ``threshold`` times - the usual N+1 signature"""
+        return [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+
+
+# Mutable stats object shared by everything that runs inside one request,
+# including work handed to thread pools with a copied context
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    """Collect QueryStats for every statement executed inside the block"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+# Process-wide collectors for tests, where the app may run on another
+# thread (TestClient) that doesn't inherit the caller's context
+_global_collectors: List[QueryStats] = []
+_global_lock = threading.Lock()
+
+
+@contextmanager
+def assert_max_queries(max_count: int):
+    """
+    Test helper: fail if the block runs more than ``max_count`` statements.
+
+        with assert_max_queries(3):
+            client.get("/api/attendance/dashboard", headers=headers)
+    """
+    stats = QueryStats()
+    with _global_lock:
+        _global_collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        with _global_lock:
+            _global_collectors.remove(stats)
+    if stats.count > max_count:
+        statements = "\n".join(f"  {count}x {statement}" for statement, count in stats.statements.most_common())
+        raise AssertionError(f"Expected at most {max_count} queries, got {stats.count}:\n{statements}")
+
+
+def instrument_engine(engine):
+    """Attach timing hooks to every statement executed on this engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.record(statement, duration_ms)
+        if _global_collectors:
+            with _global_lock:
+                for collector in _global_collectors:
+                    collector.record(statement, duration_ms)
+
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            slow_query_logger.warning(
+                "slow query (%.1f ms): %s", duration_ms, " ".join(statement.split()),
+                extra={"duration_ms": round(duration_ms, 2)}
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # after_cursor_execute doesn't fire for failed statements
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+
+def configure_slow_query_log():
+    """Send the slow-query log to SLOW_QUERY_LOG_FILE when one is configured"""
+    if settings.SLOW_QUERY_LOG_FILE and not slow_query_logger.handlers:
+        handler = logging.FileHandler(settings.SLOW_QUERY_LOG_FILE)
+        handler.setFormatter(make_formatter())
+        # File writes happen on the listener thread, never in the request path
+        slow_query_logger.addHandler(queue_handler(handler))
+        slow_query_logger.propagate = False
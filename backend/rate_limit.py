@@ -0,0 +1,124 @@
+"""
+Per-client token buckets for CPU-heavy endpoints
+Every (route class, client IP) pair gets a bucket that refills at a steady
+rate up to its burst size. A request spends one token or is refused with the
+number of seconds until the next token, before any bcrypt or image work runs.
+Batch requests are then charged one token per item, which may leave the
+bucket in debt until it refills.
+State is per worker process, so with N workers a client can get up to N
+times the configured rate.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from config import settings
+
+
+@dataclass(frozen=True)
+class Rate:
+    per_minute: float
+    burst: int
+
+
+# Requests that run bcrypt or decode an uploaded image, by (method, path)
+ROUTE_CLASSES: Dict[Tuple[str, str], str] = {
+    ("POST", "/api/auth/login"): "login",
+    ("POST", "/api/auth/register"): "register",
+    ("POST", "/api/auth/register-face"): "face",
+    ("POST", "/api/auth/verify-face"): "face",
+    ("POST", "/api/attendance/checkin"): "face",
+    ("POST", "/api/attendance/bulk"): "face",  # plus one token per event, see charge()
+}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    return ROUTE_CLASSES.get((method, path.rstrip("/") or "/"))
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by (route class, client). Only the most recently
+    used ``max_clients`` buckets are kept; an evicted client starts again
+    with a full bucket, which is what an idle client would have anyway.
+    """
+
+    def __init__(self, rates: Dict[str, Rate], max_clients: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rates = rates
+        self.max_clients = max_clients
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (route class, client) -> [tokens, last refill]
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    def _bucket(self, rate: Rate, key: Tuple[str, str]) -> list:
+        """The refilled bucket for ``key``; call with the lock held"""
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(rate.burst), now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(rate.burst), bucket[0] + (now - bucket[1]) * rate.per_minute / 60)
+            bucket[1] = now
+        return bucket
+
+    def acquire(self, route_class: str, client: str) -> float:
+        """Spend a token; returns 0 when admitted, otherwise seconds until a token is available"""
+        rate = self.rates[route_class]
+        if rate.per_minute <= 0:
+            return 0.0
+
+        with self._lock:
+            bucket = self._bucket(rate, (route_class, client))
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / (rate.per_minute / 60)
+
+    def charge(self, route_class: str, client: str, tokens: float) -> None:
+        """
+        Spend ``tokens`` more for an already admitted request, e.g. one per
+        item of a batch. The bucket may go negative, so the client's next
+        requests wait until the whole batch has been paid for.
+        """
+        rate = self.rates[route_class]
+        if rate.per_minute <= 0 or tokens <= 0:
+            return
+
+        with self._lock:
+            self._bucket(rate, (route_class, client))[0] -= tokens
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+def _exempt_clients() -> frozenset:
+    return frozenset(ip.strip() for ip in settings.RATE_LIMIT_EXEMPT_IPS.split(",") if ip.strip())
+
+
+limiter = TokenBucketLimiter(
+    {
+        "login": Rate(settings.RATE_LIMIT_LOGIN_PER_MINUTE, settings.RATE_LIMIT_LOGIN_BURST),
+        "register": Rate(settings.RATE_LIMIT_REGISTER_PER_MINUTE, settings.RATE_LIMIT_REGISTER_BURST),
+        "face": Rate(settings.RATE_LIMIT_FACE_PER_MINUTE, settings.RATE_LIMIT_FACE_BURST),
+    },
+    max_clients=settings.RATE_LIMIT_MAX_CLIENTS,
+)
+exempt_clients = _exempt_clients()
+
+
+def charge_request(route_class: str, client: str, tokens: float) -> None:
+    """Charge an admitted request's extra cost, unless rate limiting is off or the client is exempt"""
+    if settings.RATE_LIMIT_ENABLED and client not in exempt_clients:
+        limiter.charge(route_class, client, tokens)
@@ -0,0 +1,93 @@
+"""
+Read routing between the primary database and a read replica
+GET endpoints read from the replica unless that could hide the caller's own
+writes: for READ_YOUR_WRITES_SECONDS after a user writes, and whenever the
+replica has not yet replayed the user's latest ``users.data_version`` (every
+attendance write bumps it), their reads stay on the primary. The version
+check also covers writes handled by other worker processes.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import ReplicaSessionLocal
+from metrics import db_read_routes
+
+logger = logging.getLogger(__name__)
+
+# After a failed replica connection, reads use the primary for this long
+# instead of paying a connection attempt on every request
+RETRY_AFTER_ERROR_SECONDS = 5.0
+_replica_down_until = 0.0
+
+
+class RecentWriters:
+    """Users who wrote in this process within the last ``window`` seconds"""
+
+    def __init__(self, window: float, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._until: Dict[int, float] = {}  # user id -> end of their window
+        self._next_prune = 0.0
+
+    def mark(self, user_id: int):
+        now = self._clock()
+        with self._lock:
+            self._until[user_id] = now + self.window
+            if now >= self._next_prune:
+                # Forget expired windows once per window instead of on every read
+                self._until = {uid: until for uid, until in self._until.items() if until > now}
+                self._next_prune = now + self.window
+
+    def recent(self, user_id: int) -> bool:
+        with self._lock:
+            until = self._until.get(user_id)
+        return until is not None and until > self._clock()
+
+
+recent_writers = RecentWriters(settings.READ_YOUR_WRITES_SECONDS)
+
+
+def replica_session(user_id: int, data_version: int,
+                    session_factory: Optional[Callable[[], Session]] = ReplicaSessionLocal) -> Optional[Session]:
+    """
+    A replica session that already sees the user's latest write, or None
+    when their reads should go to the primary
+    """
+    global _replica_down_until
+    if session_factory is None:
+        return None
+    if recent_writers.recent(user_id):
+        db_read_routes.labels("primary_recent_write").inc()
+        return None
+    if time.monotonic() < _replica_down_until:
+        db_read_routes.labels("primary_replica_error").inc()
+        return None
+
+    session = session_factory()
+    try:
+        replica_version = session.execute(
+            text("SELECT data_version FROM users WHERE id = :id"), {"id": user_id}
+        ).scalar()
+    except DBAPIError as e:
+        session.close()
+        _replica_down_until = time.monotonic() + RETRY_AFTER_ERROR_SECONDS
+        db_read_routes.labels("primary_replica_error").inc()
+        logger.warning("read replica unavailable, reading from the primary", extra={
+            "error": str(e.orig), "retry_in_seconds": RETRY_AFTER_ERROR_SECONDS
+        })
+        return None
+    if replica_version is None or replica_version < data_version:
+        session.close()
+        db_read_routes.labels("primary_replica_behind").inc()
+        return None
+    db_read_routes.labels("replica").inc()
+    return session
@@ -0,0 +1,27 @@
+"""
+Fast JSON response class backed by orjson
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    # orjson handles datetime, date, dict, list and dataclasses natively;
+    # anything else (pydantic models, Decimal, sets) goes through FastAPI's encoder
+    return jsonable_encoder(obj)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson.
+
+    Returning one of these directly from an endpoint also skips FastAPI's
+    jsonable_encoder pass over the content.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,424 @@
+"""
+Admin API endpoints
+Requires admin privileges
+"""
+
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from datetime import date, datetime
+from typing import List, Optional
+
+from config import settings
+from database import get_db as get_jobs_db  # the jobs table lives on shard 0
+from sharding import shard_map, shard_number
+from models import Job, User, LoginAttempt, SecurityEvent, LoginAttemptRollup, SecurityEventRollup
+from profiling import MODES, capture_store, issue_header_token, profiler_state
+from routers.auth import get_current_user
+from routers.storage import check_admin
+from services.analytics import attendance_report
+from services.audit import keyset_page, merge_pages, merge_rollups
+from services.jobs import JOB_KINDS, job_dict, job_runner, list_jobs, validate_params
+import services.maintenance  # registers the maintenance job kinds
+
+router = APIRouter()
+
+class ProfilerConfig(BaseModel):
+    routes: List[str] = []  # path templates, e.g. "/api/attendance/records" or "/api/storage/user/{user_id}"
+    sample_rate: float = Field(0.0, ge=0.0, le=1.0)
+    header_enabled: bool = False  # profile requests carrying a valid signed X-Profile header
+    mode: str = "sampling"  # "sampling" (folded stacks) or "deterministic" (cProfile .pstats)
+
+class ProfilerStatus(ProfilerConfig):
+    armed: bool
+
+class HeaderTokenRequest(BaseModel):
+    ttl_seconds: int = Field(600, gt=0)
+
+class CaptureInfo(BaseModel):
+    name: str
+    size_bytes: int
+    created_at: str
+
+class SecurityEventItem(BaseModel):
+    id: int
+    user_id: Optional[int]
+    event_type: str
+    description: str
+    ip_address: Optional[str]
+    severity: Optional[str]
+    timestamp: datetime
+
+class SecurityEventPage(BaseModel):
+    items: List[SecurityEventItem]
+    next_cursor: Optional[str]
+
+class LoginAttemptItem(BaseModel):
+    id: int
+    user_id: Optional[int]
+    username: Optional[str]
+    ip_address: str
+    user_agent: Optional[str]
+    success: Optional[bool]
+    failure_reason: Optional[str]
+    timestamp: datetime
+
+class LoginAttemptPage(BaseModel):
+    items: List[LoginAttemptItem]
+    next_cursor: Optional[str]
+
+class LoginAttemptRollupItem(BaseModel):
+    bucket_start: datetime
+    username: str
+    ip_address: str
+    user_id: Optional[int]
+    attempts: int
+    failures: int
+
+class SecurityEventRollupItem(BaseModel):
+    day: date
+    event_type: str
+    severity: str
+    count: int
+
+class JobRequest(BaseModel):
+    kind: str
+    params: dict = {}
+
+@router.get("/profiling", response_model=ProfilerStatus)
+async def get_profiling(current_user: User = Depends(get_current_user)):
+    """Current profiler triggers (Admin only)"""
+    check_admin(current_user)
+    profiler_state.refresh(force=True)
+    return profiler_state.as_dict()
+
+@router.put("/profiling", response_model=ProfilerStatus)
+async def configure_profiling(
+    config: ProfilerConfig,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Arm or disarm the request profiler (Admin only).
+    Send the defaults (no routes, rate 0, headers off) to turn it off.
+    Settings are written to PROFILE_DIR and picked up by every worker within a second.
+    """
+    check_admin(current_user)
+
+    if config.mode not in MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"mode must be one of: {', '.join(MODES)}"
+        )
+    if any(not route.startswith("/") for route in config.routes):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Routes must be absolute paths"
+        )
+
+    await asyncio.to_thread(
+        profiler_state.configure, config.routes, config.sample_rate, config.header_enabled, config.mode
+    )
+    return profiler_state.as_dict()
+
+@router.post("/profiling/header-token")
+async def create_profiling_header_token(
+    request: HeaderTokenRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Issue a signed value for the X-Profile request header (Admin only)"""
+    check_admin(current_user)
+
+    ttl_seconds = min(request.ttl_seconds, settings.PROFILE_HEADER_TOKEN_MAX_TTL_SECONDS)
+    return {
+        "header": "X-Profile",
+        "value": issue_header_token(ttl_seconds),
+        "expires_in": ttl_seconds
+    }
+
+@router.get("/profiling/captures", response_model=List[CaptureInfo])
+async def list_profiling_captures(current_user: User = Depends(get_current_user)):
+    """List stored profiles, newest first (Admin only)"""
+    check_admin(current_user)
+    return capture_store.list()
+
+@router.get("/profiling/captures/{name}")
+async def download_profiling_capture(
+    name: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Download a stored profile (Admin only)"""
+    check_admin(current_user)
+
+    path = capture_store.path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Capture not found"
+        )
+    media_type = "text/plain" if name.endswith(".folded") else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+async def _page(build_query, model, limit: int, cursor: Optional[str], since: Optional[datetime],
+                until: Optional[datetime]):
+    """One page of ``build_query(db)`` merged from every shard, fetched in parallel"""
+    def shard_page(db: Session):
+        query = build_query(db)
+        if since:
+            query = query.filter(model.timestamp >= since)
+        if until:
+            query = query.filter(model.timestamp < until)
+        shard = shard_number(db)
+        return (shard, *keyset_page(query, model, limit, cursor, shard))
+
+    try:
+        items, next_cursor = merge_pages(await asyncio.to_thread(shard_map.fan_out, shard_page), limit)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/audit/security-events", response_model=SecurityEventPage)
+async def list_security_events(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    user_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="UTC, inclusive"),
+    until: Optional[datetime] = Query(None, description="UTC, exclusive"),
+    current_user: User = Depends(get_current_user)
+):
+    """Security events of every site, newest first, one page at a time (Admin only)"""
+    check_admin(current_user)
+
+    def build_query(db: Session):
+        query = db.query(SecurityEvent)
+        if user_id is not None:
+            query = query.filter(SecurityEvent.user_id == user_id)
+        if event_type:
+            query = query.filter(SecurityEvent.event_type == event_type)
+        if severity:
+            query = query.filter(SecurityEvent.severity == severity)
+        return query
+    return await _page(build_query, SecurityEvent, limit, cursor, since, until)
+
+@router.get("/audit/login-attempts", response_model=LoginAttemptPage)
+async def list_login_attempts(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    username: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    success: Optional[bool] = None,
+    since: Optional[datetime] = Query(None, description="UTC, inclusive"),
+    until: Optional[datetime] = Query(None, description="UTC, exclusive"),
+    current_user: User = Depends(get_current_user)
+):
+    """Login attempts of every site, newest first, one page at a time (Admin only)"""
+    check_admin(current_user)
+
+    def build_query(db: Session):
+        query = db.query(LoginAttempt)
+        if username:
+            query = query.filter(LoginAttempt.username == username)
+        if ip_address:
+            query = query.filter(LoginAttempt.ip_address == ip_address)
+        if success is not None:
+            query = query.filter(LoginAttempt.success == success)
+        return query
+    return await _page(build_query, LoginAttempt, limit, cursor, since, until)
+
+@router.get("/audit/login-attempts/hourly", response_model=List[LoginAttemptRollupItem])
+async def get_login_attempt_rollups(
+    since: datetime = Query(..., description="UTC, inclusive"),
+    until: Optional[datetime] = Query(None, description="UTC, exclusive"),
+    username: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    min_failures: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: User = Depends(get_current_user)
+):
+    """Login attempts and failures per username and IP per hour, kept past raw-row retention (Admin only)"""
+    check_admin(current_user)
+
+    # A username's attempts are all logged on its site's shard, so per-shard filters are exact
+    def shard_rollups(db: Session):
+        query = db.query(LoginAttemptRollup).filter(LoginAttemptRollup.bucket_start >= since)
+        if until:
+            query = query.filter(LoginAttemptRollup.bucket_start < until)
+        if username:
+            query = query.filter(LoginAttemptRollup.username == username)
+        if ip_address:
+            query = query.filter(LoginAttemptRollup.ip_address == ip_address)
+        if min_failures:
+            query = query.filter(LoginAttemptRollup.failures >= min_failures)
+        return query.order_by(LoginAttemptRollup.bucket_start.desc(), LoginAttemptRollup.failures.desc()).limit(limit).all()
+    rows = merge_rollups(await asyncio.to_thread(shard_map.fan_out, shard_rollups),
+                         key=lambda row: (row.bucket_start, row.username, row.ip_address),
+                         counts=("attempts", "failures"))
+    rows.sort(key=lambda row: (row.bucket_start, row.failures), reverse=True)
+    return rows[:limit]
+
+@router.get("/audit/security-events/daily", response_model=List[SecurityEventRollupItem])
+async def get_security_event_rollups(
+    since: date = Query(..., description="UTC day, inclusive"),
+    until: Optional[date] = Query(None, description="UTC day, exclusive"),
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Security events per type and severity per day, kept past raw-row retention (Admin only)"""
+    check_admin(current_user)
+
+    def shard_rollups(db: Session):
+        query = db.query(SecurityEventRollup).filter(SecurityEventRollup.day >= since)
+        if until:
+            query = query.filter(SecurityEventRollup.day < until)
+        if event_type:
+            query = query.filter(SecurityEventRollup.event_type == event_type)
+        if severity:
+            query = query.filter(SecurityEventRollup.severity == severity)
+        return query.all()
+    rows = merge_rollups(await asyncio.to_thread(shard_map.fan_out, shard_rollups),
+                         key=lambda row: (row.day, row.event_type, row.severity), counts=("count",))
+    rows.sort(key=lambda row: row.event_type)
+    rows.sort(key=lambda row: row.day, reverse=True)
+    return rows
+
+ANALYTICS_SECTIONS = {
+    "attendance-rate": "attendance",
+    "late-arrivals": "late_arrivals",
+    "hours-worked": "hours_worked",
+    "check-in-times": "check_in_times",
+}
+
+async def _analytics(start_date: Optional[date], end_date: Optional[date]) -> dict:
+    today = date.today()
+    start = start_date or today.replace(day=1)
+    end = end_date or today
+    if end < start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_date must not be before start_date"
+        )
+    if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Period must be at most {settings.ANALYTICS_MAX_DAYS} days"
+        )
+    # Loading and aggregating a large period is CPU-bound; keep it off the event loop
+    return await asyncio.to_thread(attendance_report, start, end)
+
+@router.get("/analytics")
+async def get_attendance_analytics(
+    start_date: Optional[date] = Query(None, description="Local date, default: first day of this month"),
+    end_date: Optional[date] = Query(None, description="Local date, inclusive, default: today"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Org-wide attendance report (Admin only): attendance rate by day, late
+    arrivals, hours-worked percentiles and check-in times, over every site
+    """
+    check_admin(current_user)
+    return await _analytics(start_date, end_date)
+
+@router.get("/analytics/{section}")
+async def get_attendance_analytics_section(
+    section: str,
+    start_date: Optional[date] = Query(None, description="Local date, default: first day of this month"),
+    end_date: Optional[date] = Query(None, description="Local date, inclusive, default: today"),
+    current_user: User = Depends(get_current_user)
+):
+    """One section of the org-wide report (Admin only); shares the cached report"""
+    check_admin(current_user)
+    if section not in ANALYTICS_SECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown report; choose one of: {', '.join(ANALYTICS_SECTIONS)}"
+        )
+    report = await _analytics(start_date, end_date)
+    return {"period": report["period"], "active_users": report["active_users"],
+            ANALYTICS_SECTIONS[section]: report[ANALYTICS_SECTIONS[section]]}
+
+@router.get("/jobs")
+async def get_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", description="queued, running, succeeded, failed or cancelled"),
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_jobs_db)
+):
+    """Background jobs, newest first (Admin only)"""
+    check_admin(current_user)
+    return {
+        "kinds": sorted(JOB_KINDS),
+        "jobs": [job_dict(job) for job in list_jobs(db, status_filter, kind, limit)]
+    }
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    request: JobRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a maintenance job, e.g. {"kind": "vacuum"} (Admin only)"""
+    check_admin(current_user)
+    if request.kind not in JOB_KINDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown job kind; choose one of: {', '.join(sorted(JOB_KINDS))}"
+        )
+    try:
+        validate_params(request.kind, request.params)
+    except TypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid params for {request.kind}: {e}"
+        )
+    job, created = await asyncio.to_thread(
+        job_runner.submit, request.kind, request.params, created_by=current_user.id
+    )
+    return {"created": created, "job": job}
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_jobs_db)
+):
+    """Status, progress and result of one background job (Admin only)"""
+    check_admin(current_user)
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job_dict(job)
+
+@router.post("/jobs/{job_id}/cancel", status_code=status.HTTP_202_ACCEPTED)
+async def cancel_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_jobs_db)
+):
+    """
+    Cancel a background job (Admin only). A queued job is cancelled at once;
+    a running one stops at its next checkpoint, keeping work already committed.
+    """
+    check_admin(current_user)
+    job = await asyncio.to_thread(job_runner.cancel, db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    if job.status not in ("queued", "running", "cancelled"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job already {job.status}"
+        )
+    return job_dict(job)
@@ -1,13 +1,21 @@
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from datetime import datetime, timedelta, date as DateType
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
+import asyncio
+import json
 
-from database import get_db
+from sharding import get_db
 from models import User
 from services.attendance_service import AttendanceService
-from routers.auth import get_current_user
+from services.event_bus import attendance_events
+from services.executors import face_pool
+from rate_limit import charge_request
+from routers.auth import get_current_user, get_current_user_if_modified, get_read_db
+from config import settings
+from responses import FastJSONResponse
 
 router = APIRouter()
 
@@ -16,6 +24,31 @@ class CheckInRequest(BaseModel):
     face_image: str  # base64 encoded image
     location: Optional[str] = None
 
+class BulkAttendanceEvent(BaseModel):
+    idempotency_key: str = Field(..., min_length=1, max_length=64)
+    event_type: str  # check_in or check_out
+    user_id: Optional[int] = None  # defaults to the caller; other users require admin
+    occurred_at: Optional[datetime] = None  # time recorded by the kiosk, defaults to now
+    face_image: Optional[str] = None  # base64 encoded image, required for face-registered check-ins
+    location: Optional[str] = None
+    attendance_id: Optional[int] = None  # check-out target, defaults to the open record of that day
+
+class BulkAttendanceRequest(BaseModel):
+    events: List[BulkAttendanceEvent]
+
+class BulkEventResult(BaseModel):
+    idempotency_key: str
+    status: str  # created, updated, duplicate, rejected
+    message: str
+    attendance_id: Optional[int] = None
+
+class BulkAttendanceResponse(BaseModel):
+    received: int
+    applied: int
+    duplicates: int
+    rejected: int
+    results: List[BulkEventResult]
+
 class AttendanceRecord(BaseModel):
     id: int
     check_in_time: datetime
@@ -23,7 +56,7 @@ class AttendanceRecord(BaseModel):
     work_duration: Optional[float]
     location: Optional[str]
     face_verified: bool
-    date: str
+    date: DateType
 
 class AttendanceSummary(BaseModel):
     total_days: int
@@ -45,7 +78,9 @@ async def check_in(checkin_data: CheckInRequest,
     client_ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent", "") if request else None
     
-    result = attendance_service.check_in(
+    # Face verification decodes and hashes the image; keep it off the event loop
+    result = await face_pool.run(
+        attendance_service.check_in,
         user=current_user,
         face_image_base64=checkin_data.face_image,
         location=checkin_data.location,
@@ -81,9 +116,44 @@ async def check_out(attendance_id: Optional[int] = None,
     
     return result
 
+@router.post("/bulk", response_model=BulkAttendanceResponse)
+async def bulk_ingest(bulk_data: BulkAttendanceRequest,
+                      request: Request,
+                      current_user: User = Depends(get_current_user),
+                      db: Session = Depends(get_db)):
+    """Ingest a batch of check-in/check-out events from an offline kiosk"""
+    if len(bulk_data.events) > settings.BULK_MAX_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may contain at most {settings.BULK_MAX_EVENTS} events"
+        )
+    
+    # Every event may decode and match a photo: charge the face budget per event
+    # (the rate limit middleware already took one token for the request)
+    charge_request("face", request.client.host, len(bulk_data.events) - 1)
+    
+    attendance_service = AttendanceService(db)
+    
+    results = await face_pool.run(
+        attendance_service.bulk_ingest,
+        actor=current_user,
+        events=[event.model_dump() for event in bulk_data.events],
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent", "")
+    )
+    
+    statuses = [result["status"] for result in results]
+    return {
+        "received": len(results),
+        "applied": statuses.count("created") + statuses.count("updated"),
+        "duplicates": statuses.count("duplicate"),
+        "rejected": statuses.count("rejected"),
+        "results": results
+    }
+
 @router.get("/today-status")
 async def get_today_status(current_user: User = Depends(get_current_user),
-                          db: Session = Depends(get_db)):
+                          db: Session = Depends(get_read_db)):
     """Get today's attendance status"""
     attendance_service = AttendanceService(db)
     
@@ -94,8 +164,8 @@ async def get_attendance_records(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     limit: int = Query(30, description="Number of records to return"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_if_modified),
+    db: Session = Depends(get_read_db)
 ):
     """Get user's attendance records"""
     attendance_service = AttendanceService(db)
@@ -128,7 +198,8 @@ async def get_attendance_records(
         user=current_user,
         start_date=start_datetime,
         end_date=end_datetime,
-        limit=limit
+        limit=limit,
+        include_images=False  # not part of the response
     )
     
     return records
@@ -137,8 +208,8 @@ async def get_attendance_records(
 async def get_attendance_summary(
     start_date: str = Query(..., description="Start date (YYYY-MM-DD)"),
     end_date: str = Query(..., description="End date (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_if_modified),
+    db: Session = Depends(get_read_db)
 ):
     """Get attendance summary for a date range"""
     attendance_service = AttendanceService(db)
@@ -169,12 +240,13 @@ async def get_attendance_summary(
     
     return summary
 
-@router.get("/monthly-summary")
+@router.get("/monthly-summary", response_class=FastJSONResponse)
 async def get_monthly_summary(
+    response: Response,
     year: int = Query(..., description="Year"),
     month: int = Query(..., description="Month (1-12)"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_if_modified),
+    db: Session = Depends(get_read_db)
 ):
     """Get monthly attendance summary"""
     attendance_service = AttendanceService(db)
@@ -207,21 +279,23 @@ async def get_monthly_summary(
         limit=100
     )
     
-    return {
+    # Returned directly so the image-heavy records skip jsonable_encoder;
+    # carry over the ETag headers set by the dependency
+    return FastJSONResponse({
         "summary": summary,
         "daily_records": records,
         "month": month,
         "year": year
-    }
+    }, headers=dict(response.headers))
 
-@router.get("/dashboard")
+@router.get("/dashboard", response_class=FastJSONResponse)
 async def get_dashboard_data(current_user: User = Depends(get_current_user),
-                           db: Session = Depends(get_db)):
+                           db: Session = Depends(get_read_db)):
     """Get dashboard data for current user"""
     attendance_service = AttendanceService(db)
     
-    # Today's status
-    today_status = attendance_service.get_today_status(current_user)
+    # Today's status and recent records (the dashboard doesn't show check-in photos)
+    today_status = attendance_service.get_today_status(current_user, include_image=False)
     
     # This week's summary
     today = datetime.now().date()
@@ -250,10 +324,11 @@ async def get_dashboard_data(current_user: User = Depends(get_current_user),
     # Recent records
     recent_records = attendance_service.get_user_attendance(
         user=current_user,
-        limit=10
+        limit=10,
+        include_images=False
     )
     
-    return {
+    return FastJSONResponse({
         "today_status": today_status,
         "week_summary": week_summary,
         "month_summary": month_summary,
@@ -263,4 +338,66 @@ async def get_dashboard_data(current_user: User = Depends(get_current_user),
             "full_name": current_user.full_name,
             "face_registered": current_user.face_registered
         }
-    }
+    })
+
+@router.get("/live")
+async def live_events(
+    request: Request,
+    user_id: Optional[int] = Query(None, description="Only events for this user (admin only)"),
+    event_type: Optional[str] = Query(None, description="Comma-separated event types, e.g. check_in,check_out"),
+    location: Optional[str] = Query(None, description="Only events at this location"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Server-Sent Events stream of check-ins and check-outs as they happen"""
+    # Non-admins may only follow their own events
+    if not current_user.is_admin:
+        if user_id is not None and user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin privileges required"
+            )
+        user_id = current_user.id
+    
+    event_types = {t.strip() for t in event_type.split(",") if t.strip()} if event_type else None
+    
+    def matches(event: dict) -> bool:
+        if user_id is not None and event["user_id"] != user_id:
+            return False
+        if event_types is not None and event["type"] not in event_types:
+            return False
+        if location is not None and event["location"] != location:
+            return False
+        return True
+    
+    # The stream can stay open for hours; don't hold a pooled connection for it
+    db.close()
+    
+    subscription = attendance_events.subscribe(matches)
+    
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(),
+                        timeout=settings.LIVE_EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Server is shutting down; the client reconnects to another worker
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            attendance_events.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
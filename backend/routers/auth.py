@@ -1,17 +1,24 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
+import asyncio
+import hashlib
+import logging
 
-from database import get_db
 from models import User
 from services.auth_service import AuthService
+from replica import replica_session
+from sharding import (SITE_PATTERN, add_user, get_db, get_db_by_body, shard_map, shard_number,
+                      site_of_refresh_token)
+from services.executors import face_pool, bcrypt_pool
 from config import settings
 
 router = APIRouter()
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
 
 # Pydantic models
 class UserRegister(BaseModel):
@@ -20,6 +27,7 @@ class UserRegister(BaseModel):
     password: str
     full_name: str
     phone_number: Optional[str] = None
+    site: Optional[str] = Field(None, pattern=SITE_PATTERN.pattern)  # defaults to DEFAULT_SITE
 
 class UserLogin(BaseModel):
     username: str
@@ -34,9 +42,13 @@ class FaceVerification(BaseModel):
 class TOTPVerification(BaseModel):
     totp_code: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
     user_id: int
     username: str
     requires_face_verification: bool
@@ -89,21 +101,74 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     
     return user
 
+def get_current_user_if_modified(request: Request, response: Response,
+                                 current_user: User = Depends(get_current_user)) -> User:
+    """
+    Get current user for a cacheable read.
+    
+    The weak ETag is derived from the user's data version and the request
+    URL, so a matching If-None-Match short-circuits with 304 before the
+    endpoint runs any queries of its own.
+    """
+    fingerprint = f"{current_user.id}:{current_user.data_version}:{request.url.path}?{request.url.query}"
+    etag = f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:20]}"'
+    
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    
+    response.headers.update(cache_headers)
+    return current_user
+
+def get_read_db(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Session for a read-only endpoint: the read replica when it already has
+    the caller's latest write, otherwise the request's primary session.
+    The replica mirrors shard 0; users on other shards always read their shard.
+    """
+    replica = replica_session(current_user.id, current_user.data_version) if shard_number(db) == 0 else None
+    if replica is None:
+        yield db
+        return
+    try:
+        yield replica
+    finally:
+        replica.close()
+
+# Requests without an access token find their shard from the body
+def _site_of_registration(body: dict) -> Optional[str]:
+    site = body.get("site")
+    return site if isinstance(site, str) else None
+
+def _site_of_login(body: dict) -> Optional[str]:
+    username = body.get("username")
+    return shard_map.site_of_username(username) if isinstance(username, str) else None
+
+def _site_of_refresh(body: dict) -> Optional[str]:
+    token = body.get("refresh_token")
+    return site_of_refresh_token(token) if isinstance(token, str) else None
+
 @router.post("/register", response_model=dict)
-async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register_user(user_data: UserRegister, db: Session = Depends(get_db_by_body(_site_of_registration))):
     """Register a new user"""
     try:
         auth_service = AuthService(db)
         
+        # Usernames and emails are unique across every site's shard
+        username_taken, email_taken = await asyncio.to_thread(
+            shard_map.registered, user_data.username, user_data.email
+        )
+        
         # Check if user already exists
-        if auth_service.get_user_by_username(user_data.username):
+        if username_taken:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already registered"
             )
         
         # Check if email already exists
-        if auth_service.get_user_by_email(user_data.email):
+        if email_taken:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="This email address is already registered. Please use a different email or try logging in."
@@ -117,9 +182,10 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
             )
         
         # Create new user
-        hashed_password = auth_service.get_password_hash(user_data.password)
+        hashed_password = await bcrypt_pool.run(auth_service.get_password_hash, user_data.password)
         
         new_user = User(
+            site=user_data.site or settings.DEFAULT_SITE,
             username=user_data.username,
             email=user_data.email,
             hashed_password=hashed_password,
@@ -127,20 +193,16 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
             phone_number=user_data.phone_number
         )
         
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        # The flush assigns the id; user and audit event commit together
+        add_user(db, new_user)
         
-        # Log security event
-        try:
-            auth_service.log_security_event(
-                user_id=new_user.id,
-                event_type="user_registered",
-                description="New user registered successfully",
-                severity="info"
-            )
-        except Exception as log_error:
-            print(f"Warning: Failed to log security event: {log_error}")
+        auth_service.log_security_event(
+            user_id=new_user.id,
+            event_type="user_registered",
+            description="New user registered successfully",
+            severity="info"
+        )
+        db.commit()
         
         return {
             "message": "User registered successfully",
@@ -150,9 +212,7 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Registration error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("registration failed", extra={"username": user_data.username})
         
         # Handle specific database errors with user-friendly messages
         error_message = str(e)
@@ -173,7 +233,8 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
             )
 
 @router.post("/login", response_model=TokenResponse)
-async def login_user(login_data: UserLogin, request: Request, db: Session = Depends(get_db)):
+async def login_user(login_data: UserLogin, request: Request,
+                     db: Session = Depends(get_db_by_body(_site_of_login))):
     """Login user with username and password"""
     auth_service = AuthService(db)
     
@@ -191,6 +252,7 @@ async def login_user(login_data: UserLogin, request: Request, db: Session = Depe
             success=False,
             failure_reason="User not found"
         )
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -206,13 +268,14 @@ async def login_user(login_data: UserLogin, request: Request, db: Session = Depe
             user_id=user.id,
             failure_reason="Account locked"
         )
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_423_LOCKED,
             detail="Account is locked due to too many failed attempts"
         )
     
     # Verify password
-    if not auth_service.verify_password(login_data.password, user.hashed_password):
+    if not await bcrypt_pool.run(auth_service.verify_password, login_data.password, user.hashed_password):
         auth_service.increment_login_attempts(user)
         auth_service.log_login_attempt(
             username=login_data.username,
@@ -222,6 +285,7 @@ async def login_user(login_data: UserLogin, request: Request, db: Session = Depe
             user_id=user.id,
             failure_reason="Invalid password"
         )
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -237,6 +301,7 @@ async def login_user(login_data: UserLogin, request: Request, db: Session = Depe
             user_id=user.id,
             failure_reason="Account inactive"
         )
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Account is inactive"
@@ -257,13 +322,62 @@ async def login_user(login_data: UserLogin, request: Request, db: Session = Depe
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth_service.create_access_token(
-        data={"sub": user.id, "username": user.username},
+        data={"sub": user.id, "username": user.username, "site": user.site},
         expires_delta=access_token_expires
     )
     
+    # Create refresh token so the client can renew without re-sending the password
+    refresh_token = auth_service.create_refresh_token(
+        user,
+        ip_address=client_ip,
+        user_agent=user_agent
+    )
+    db.commit()
+    
     return TokenResponse(
         access_token=access_token,
         token_type="bearer",
+        refresh_token=refresh_token,
+        user_id=user.id,
+        username=user.username,
+        requires_face_verification=user.face_registered,
+        requires_totp=user.totp_enabled
+    )
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_access_token(refresh_data: RefreshRequest, request: Request,
+                               db: Session = Depends(get_db_by_body(_site_of_refresh))):
+    """Exchange a refresh token for a new access token and rotated refresh token"""
+    auth_service = AuthService(db)
+    
+    # Get client info
+    client_ip = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+    
+    result = auth_service.rotate_refresh_token(
+        refresh_data.refresh_token,
+        ip_address=client_ip,
+        user_agent=user_agent
+    )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user, refresh_token = result
+    
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = auth_service.create_access_token(
+        data={"sub": user.id, "username": user.username, "site": user.site},
+        expires_delta=access_token_expires
+    )
+    
+    return TokenResponse(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token,
         user_id=user.id,
         username=user.username,
         requires_face_verification=user.face_registered,
@@ -277,13 +391,14 @@ async def register_face(face_data: FaceRegistration,
     """Register face encoding for user"""
     auth_service = AuthService(db)
     
-    success = auth_service.register_face_encoding(current_user, face_data.face_image)
+    success = await face_pool.run(auth_service.register_face_encoding, current_user, face_data.face_image)
     
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Face registration failed. Please ensure your face is clearly visible."
         )
+    db.commit()
     
     return {"message": "Face registered successfully"}
 
@@ -300,7 +415,7 @@ async def verify_face(face_data: FaceVerification,
             detail="Face recognition not set up for this user"
         )
     
-    success = auth_service.verify_face_user(current_user, face_data.face_image)
+    success = await face_pool.run(auth_service.verify_face_user, current_user, face_data.face_image)
     
     if not success:
         raise HTTPException(
@@ -317,6 +432,7 @@ async def setup_totp(current_user: User = Depends(get_current_user),
     auth_service = AuthService(db)
     
     secret = auth_service.generate_totp_secret(current_user)
+    db.commit()
     qr_code = auth_service.generate_totp_qr_code(current_user, secret)
     
     return {
@@ -349,11 +465,12 @@ async def verify_totp(totp_data: TOTPVerification,
     # Enable TOTP if not already enabled
     if not current_user.totp_enabled:
         auth_service.enable_totp(current_user)
+        db.commit()
     
     return {"message": "TOTP verification successful"}
 
 @router.get("/profile")
-async def get_profile(current_user: User = Depends(get_current_user)):
+async def get_profile(current_user: User = Depends(get_current_user_if_modified)):
     """Get current user profile"""
     return {
         "id": current_user.id,
@@ -373,11 +490,14 @@ async def logout(current_user: User = Depends(get_current_user),
     """Logout user (client should discard token)"""
     auth_service = AuthService(db)
     
+    auth_service.revoke_user_refresh_tokens(current_user)
+    
     auth_service.log_security_event(
         user_id=current_user.id,
         event_type="logout",
         description="User logged out successfully",
         severity="info"
     )
+    db.commit()
     
     return {"message": "Logged out successfully"}
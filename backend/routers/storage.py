@@ -4,15 +4,19 @@ Requires admin privileges
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime, timedelta
+import asyncio
 import os
 
-from database import get_db
+from sharding import shard_map
 from models import User, AttendanceRecord
 from routers.auth import get_current_user
+from services.archive import attendance_archive, naive
+from services.jobs import job_runner
+import services.maintenance  # registers the maintenance job kinds
 
 router = APIRouter()
 
@@ -33,6 +37,9 @@ class StorageStats(BaseModel):
     oldest_record: Optional[str]
     newest_record: Optional[str]
     days_span: int
+    archived_records: int
+    archived_records_with_images: int
+    archive_size_mb: float
 
 def check_admin(current_user: User):
     """Check if current user is admin"""
@@ -43,44 +50,59 @@ def check_admin(current_user: User):
         )
     return current_user
 
+async def submit_job(kind: str, params: dict, current_user: User) -> dict:
+    """Queue a maintenance job, or return the one of the same kind already in progress"""
+    job, created = await asyncio.to_thread(job_runner.submit, kind, params, created_by=current_user.id)
+    return {
+        "success": True,
+        "message": "Job queued" if created else "A job of this kind is already in progress",
+        "job": job,
+        "status_url": f"/api/admin/jobs/{job['id']}"
+    }
+
 @router.get("/stats", response_model=StorageStats)
 async def get_storage_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Get storage statistics (Admin only)"""
+    """Get storage statistics of every site (Admin only)"""
     check_admin(current_user)
     
-    # Count records
-    total_records = db.query(AttendanceRecord).count()
-    records_with_images = db.query(AttendanceRecord).filter(
-        AttendanceRecord.face_image.isnot(None)
-    ).count()
-    
-    # Calculate storage
-    records = db.query(AttendanceRecord).filter(
-        AttendanceRecord.face_image.isnot(None)
-    ).all()
+    # Aggregated in SQL on every shard in parallel, then combined
+    def shard_stats(db: Session):
+        stats = db.query(
+            func.count(AttendanceRecord.id),
+            func.count(AttendanceRecord.face_image),
+            func.coalesce(func.sum(func.length(AttendanceRecord.face_image)), 0),
+            func.min(AttendanceRecord.check_in_time),
+            func.max(AttendanceRecord.check_in_time)
+        ).one()
+        url = db.get_bind().url
+        db_path = url.database if url.get_backend_name() == "sqlite" else None
+        db_size = os.path.getsize(db_path) if db_path and os.path.exists(db_path) else 0
+        return (*stats, db_size)
     
-    total_size = sum(len(r.face_image) for r in records if r.face_image)
+    shards, archive = await asyncio.gather(
+        asyncio.to_thread(shard_map.fan_out, shard_stats),
+        asyncio.to_thread(attendance_archive.stats)
+    )
+    total_records = sum(stats[0] for stats in shards)
+    records_with_images = sum(stats[1] for stats in shards)
+    total_size = sum(stats[2] for stats in shards)
     avg_size = total_size / records_with_images if records_with_images > 0 else 0
+    db_size = sum(stats[5] for stats in shards)
     
-    # Database file size
-    db_path = "mfa_attendance.db"
-    db_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
-    
-    # Record age
-    oldest_record = db.query(AttendanceRecord).order_by(AttendanceRecord.check_in_time).first()
-    newest_record = db.query(AttendanceRecord).order_by(AttendanceRecord.check_in_time.desc()).first()
+    # Record age (local naive times, so shards on different backends compare)
+    oldest = min((naive(stats[3]) for stats in shards if stats[3] is not None), default=None)
+    newest = max((naive(stats[4]) for stats in shards if stats[4] is not None), default=None)
     
     days_span = 0
     oldest_str = None
     newest_str = None
     
-    if oldest_record and newest_record:
-        oldest_str = oldest_record.check_in_time.isoformat()
-        newest_str = newest_record.check_in_time.isoformat()
-        days_span = (newest_record.check_in_time - oldest_record.check_in_time).days
+    if oldest and newest:
+        oldest_str = oldest.isoformat()
+        newest_str = newest.isoformat()
+        days_span = (newest - oldest).days
     
     return StorageStats(
         total_records=total_records,
@@ -93,118 +115,28 @@ async def get_storage_stats(
         database_file_size_mb=db_size / (1024*1024),
         oldest_record=oldest_str,
         newest_record=newest_str,
-        days_span=days_span
+        days_span=days_span,
+        archived_records=archive["records"],
+        archived_records_with_images=archive["records_with_images"],
+        archive_size_mb=archive["size_bytes"] / (1024*1024)
     )
 
-@router.post("/cleanup")
+@router.post("/cleanup", status_code=status.HTTP_202_ACCEPTED)
 async def cleanup_storage(
     cleanup_data: CleanupRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Clean up old attendance records (Admin only)"""
+    """
+    Clean up old attendance records (Admin only).
+    Runs as a background job; poll ``status_url`` for progress and the result.
+    """
     check_admin(current_user)
-    
-    try:
-        cutoff_date = datetime.now() - timedelta(days=cleanup_data.days_to_keep)
-        
-        # Build query
-        query = db.query(AttendanceRecord).filter(
-            AttendanceRecord.check_in_time < cutoff_date
-        )
-        
-        # Filter by user if specified
-        if cleanup_data.user_id:
-            query = query.filter(AttendanceRecord.user_id == cleanup_data.user_id)
-        
-        # Only get records with images if not deleting entire records
-        if not cleanup_data.delete_records:
-            query = query.filter(AttendanceRecord.face_image.isnot(None))
-        
-        old_records = query.all()
-        
-        if not old_records:
-            return {
-                "success": True,
-                "message": f"No records older than {cleanup_data.days_to_keep} days found",
-                "records_processed": 0,
-                "space_freed_mb": 0
-            }
-        
-        # Calculate space to be freed
-        total_size = sum(len(r.face_image) for r in old_records if r.face_image)
-        
-        # Perform cleanup
-        if cleanup_data.delete_records:
-            # Delete entire records
-            for record in old_records:
-                db.delete(record)
-            action = "deleted"
-        else:
-            # Just remove face images
-            for record in old_records:
-                record.face_image = None
-            action = "cleaned (images removed)"
-        
-        db.commit()
-        
-        # Run VACUUM if records were deleted (SQLite specific)
-        if cleanup_data.delete_records:
-            db.execute("VACUUM")
-        
-        return {
-            "success": True,
-            "message": f"Successfully {action} {len(old_records)} records",
-            "records_processed": len(old_records),
-            "space_freed_mb": total_size / (1024*1024),
-            "action": "deleted_records" if cleanup_data.delete_records else "removed_images"
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Cleanup failed: {str(e)}"
-        )
+    return await submit_job("storage_cleanup", cleanup_data.model_dump(), current_user)
 
-@router.delete("/all-images")
+@router.delete("/all-images", status_code=status.HTTP_202_ACCEPTED)
 async def delete_all_images(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Emergency: Delete ALL face images (Admin only)"""
+    """Emergency: Delete ALL face images (Admin only); runs as a background job"""
     check_admin(current_user)
-    
-    try:
-        records = db.query(AttendanceRecord).filter(
-            AttendanceRecord.face_image.isnot(None)
-        ).all()
-        
-        if not records:
-            return {
-                "success": True,
-                "message": "No face images to delete",
-                "records_processed": 0,
-                "space_freed_mb": 0
-            }
-        
-        total_size = sum(len(r.face_image) for r in records if r.face_image)
-        
-        for record in records:
-            record.face_image = None
-        
-        db.commit()
-        
-        return {
-            "success": True,
-            "message": f"All face images deleted. Attendance data preserved.",
-            "records_processed": len(records),
-            "space_freed_mb": total_size / (1024*1024)
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Emergency cleanup failed: {str(e)}"
-        )
+    return await submit_job("delete_all_images", {}, current_user)
@@ -0,0 +1,286 @@
+"""
+Organisation-wide attendance analytics
+A period's check-ins (database and archive) are loaded once as NumPy columns
+and every report is aggregated from the same arrays; with several shards the
+database part is loaded from all of them in parallel. Reports are cached per
+period and recomputed only once the period's own check-ins change: the stamp
+aggregates the rows in the period's range (one index range scan per shard)
+and the archive files of its months, so closed months stay cached while
+today's check-ins come in.
+"""
+
+import logging
+import os
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import AttendanceRecord, User
+from services.archive import attendance_archive
+from sharding import shard_map
+
+logger = logging.getLogger(__name__)
+
+LATE_BUCKETS_MINUTES = (15, 30, 60)  # upper edges after the grace period; the last bucket is open
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+
+def _minutes_of(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _local_datetimes(values, aware: bool):
+    """
+    datetime64[us] array of local wall-clock times. ``values`` are ISO
+    strings or timestamps; with ``aware`` they carry an offset (PostgreSQL
+    text, archive UTC) and are converted, otherwise they already are local.
+    """
+    import pandas as pd
+    from dateutil.tz import tzlocal
+
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601", utc=aware)
+    if aware:
+        parsed = parsed.dt.tz_convert(tzlocal()).dt.tz_localize(None)
+    return parsed.to_numpy(dtype="datetime64[us]")
+
+
+def _load_database(db: Session, since: datetime, until: datetime) -> Dict[str, Any]:
+    """One shard's check-ins in [since, until) as NumPy arrays"""
+    import numpy as np
+
+    table = AttendanceRecord.__table__
+    # Timestamps come back as text and are parsed in one vectorized pass,
+    # several times faster than building a datetime object per row
+    rows = db.execute(
+        select(table.c.user_id, cast(table.c.check_in_time, String), table.c.work_duration)
+        .where(table.c.check_in_time >= since, table.c.check_in_time < until)
+    ).all()
+    user_ids, check_ins, durations = zip(*rows) if rows else ((), (), ())
+    aware = db.get_bind().dialect.name == "postgresql"
+
+    return {
+        "user_id": np.fromiter(user_ids, dtype=np.int64, count=len(rows)),
+        "check_in": _local_datetimes(check_ins, aware),
+        "work_duration": np.array(durations, dtype=np.float64),  # None (still open) becomes NaN
+    }
+
+
+def load_period(start: date, end: date) -> Dict[str, Any]:
+    """
+    user_id, check_in (local datetime64) and work_duration (float, NaN if
+    still open) of every check-in from ``start`` to ``end`` inclusive, from
+    every shard and the archive, as NumPy arrays.
+    """
+    import numpy as np
+
+    since = datetime.combine(start, time.min)
+    until = datetime.combine(end + timedelta(days=1), time.min)
+    shards = shard_map.fan_out(lambda db: _load_database(db, since, until))
+    columns = {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]}
+
+    archived = attendance_archive.read_columns(since, until - timedelta(microseconds=1),
+                                               ["user_id", "check_in_time", "work_duration"])
+    if archived is not None and archived.num_rows:
+        columns = {
+            "user_id": np.concatenate([columns["user_id"], archived.column("user_id").to_numpy()]),
+            "check_in": np.concatenate([
+                columns["check_in"], _local_datetimes(archived.column("check_in_time").to_pandas(), True)
+            ]),
+            "work_duration": np.concatenate([
+                columns["work_duration"],
+                archived.column("work_duration").to_numpy(zero_copy_only=False).astype(np.float64)
+            ]),
+        }
+    # Archived rows are filtered in UTC; keep exactly the local days asked for
+    keep = (columns["check_in"] >= np.datetime64(since)) & (columns["check_in"] < np.datetime64(until))
+    return {name: values[keep] for name, values in columns.items()}
+
+
+def compute_report(columns: Dict[str, Any], start: date, end: date, active_users: int,
+                   today: Optional[date] = None) -> Dict[str, Any]:
+    """All four reports from the loaded columns, without Python-level loops over records"""
+    import numpy as np
+
+    today = today or date.today()
+    user_id, check_in, work_duration = columns["user_id"], columns["check_in"], columns["work_duration"]
+    days = (end - start).days + 1
+    day_index = (check_in.astype("datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+    minute_of_day = (check_in - check_in.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int64)
+
+    # One (user, day) pair per person present; the first check-in of the day decides lateness
+    order = np.lexsort((check_in, user_id, day_index))
+    pair = day_index[order] * (1 << 32) + user_id[order]
+    first = np.ones(len(pair), dtype=bool)
+    first[1:] = pair[1:] != pair[:-1]
+    present_day = day_index[order][first]
+    arrival_minute = minute_of_day[order][first]
+
+    # Attendance rate by day
+    present = np.bincount(present_day, minlength=days) if len(present_day) else np.zeros(days, dtype=np.int64)
+    day_dates = np.datetime64(start, "D") + np.arange(days)
+    weekday = (day_dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+    elapsed = day_dates <= np.datetime64(today, "D")
+    working = (weekday < 5) & elapsed
+    rate = present / active_users * 100 if active_users else np.zeros(days)
+    by_day = [
+        {
+            "date": start + timedelta(days=int(i)),
+            "present": int(present[i]),
+            "attendance_rate": round(float(rate[i]), 2),
+            "working_day": bool(weekday[i] < 5),
+        }
+        for i in np.flatnonzero(elapsed)
+    ]
+
+    # Late arrivals
+    lateness = arrival_minute - _minutes_of(settings.ANALYTICS_WORKDAY_START)
+    late = lateness > settings.ANALYTICS_LATE_GRACE_MINUTES
+    grace = settings.ANALYTICS_LATE_GRACE_MINUTES
+    edges = np.array([grace] + [m for m in LATE_BUCKETS_MINUTES if m > grace] + [24 * 60])
+    late_counts = np.histogram(lateness[late], bins=edges)[0] if late.any() else np.zeros(len(edges) - 1, dtype=np.int64)
+    buckets = [{"minutes_late": "on_time", "count": int((~late).sum())}] + [
+        {"minutes_late": f"{low}-{high}" if high < 24 * 60 else f"{low}+", "count": int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], late_counts)
+    ]
+
+    # Hours worked: per closed session and per person over the period
+    closed = ~np.isnan(work_duration)
+    sessions = work_duration[closed]
+    _, per_user_index = np.unique(user_id[closed], return_inverse=True)
+    per_user = np.bincount(per_user_index, weights=sessions) if len(sessions) else sessions
+
+    def distribution(values) -> Dict[str, Any]:
+        if not len(values):
+            return {"count": 0, "mean": None, **{f"p{p}": None for p in PERCENTILES}}
+        points = np.percentile(values, PERCENTILES)
+        return {"count": int(len(values)), "mean": round(float(values.mean()), 2),
+                **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, points)}}
+
+    # Check-in time histogram (all check-ins)
+    bin_minutes = settings.ANALYTICS_HISTOGRAM_BIN_MINUTES
+    histogram = np.bincount(minute_of_day // bin_minutes, minlength=(24 * 60) // bin_minutes) \
+        if len(minute_of_day) else np.zeros((24 * 60) // bin_minutes, dtype=np.int64)
+    occupied = np.flatnonzero(histogram)
+    span = range(occupied[0], occupied[-1] + 1) if len(occupied) else range(0)
+
+    working_days = int(working.sum())
+    return {
+        "period": {"start_date": start, "end_date": end},
+        "active_users": active_users,
+        "check_ins": int(len(user_id)),
+        "attendance": {
+            "working_days": working_days,
+            "average_rate": round(float(rate[working].mean()), 2) if working_days else 0,
+            "by_day": by_day,
+        },
+        "late_arrivals": {
+            "workday_start": settings.ANALYTICS_WORKDAY_START,
+            "grace_minutes": settings.ANALYTICS_LATE_GRACE_MINUTES,
+            "arrivals": int(len(arrival_minute)),
+            "late": int(late.sum()),
+            "late_rate": round(float(late.mean()) * 100, 2) if len(late) else 0,
+            "median_minutes_late": float(np.median(lateness[late])) if late.any() else None,
+            "buckets": buckets,
+        },
+        "hours_worked": {
+            "per_session": distribution(sessions),
+            "per_user": distribution(per_user),
+        },
+        "check_in_times": {
+            "bin_minutes": bin_minutes,
+            "bins": [
+                {"time": f"{(i * bin_minutes) // 60:02d}:{(i * bin_minutes) % 60:02d}", "count": int(histogram[i])}
+                for i in span
+            ],
+        },
+    }
+
+
+class AnalyticsCache:
+    """Most recently used reports per period, valid while the data stamp is unchanged"""
+
+    def __init__(self, max_periods: int):
+        self.max_periods = max_periods
+        self._lock = threading.Lock()
+        self._reports: "OrderedDict[Tuple[date, date], Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: Tuple[date, date], stamp: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._reports.get(key)
+            if cached is None or cached[0] != stamp:
+                return None
+            self._reports.move_to_end(key)
+            return cached[1]
+
+    def put(self, key: Tuple[date, date], stamp: Tuple, report: Dict[str, Any]):
+        with self._lock:
+            self._reports[key] = (stamp, report)
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_periods:
+                self._reports.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._reports.clear()
+
+
+analytics_cache = AnalyticsCache(settings.ANALYTICS_CACHE_PERIODS)
+
+
+def _period_stamp(db: Session, since: datetime, until: datetime) -> Tuple:
+    """
+    Active users plus count, check-outs, total hours and highest id of the
+    shard's check-ins in [since, until): any insert, check-out or delete in
+    the period changes one of them
+    """
+    table = AttendanceRecord.__table__
+    active = select(func.count(User.id)).where(User.is_active == True).scalar_subquery()
+    row = db.execute(
+        select(active, func.count(), func.count(table.c.work_duration),
+               func.coalesce(func.sum(table.c.work_duration), 0), func.max(table.c.id))
+        .where(table.c.check_in_time >= since, table.c.check_in_time < until)
+    ).one()
+    return (int(row[0]), int(row[1]), int(row[2]), round(float(row[3]), 6), row[4])
+
+
+def data_stamp(start: date, end: date) -> Tuple:
+    """Changes whenever the check-ins of ``start``..``end`` (or the set of active users) change, on any shard"""
+    since = datetime.combine(start, time.min)
+    until = datetime.combine(end + timedelta(days=1), time.min)
+    shards = shard_map.fan_out(lambda db: _period_stamp(db, since, until))
+    # Archive files are rewritten in place by storage cleanup, so their size and mtime count too
+    archived = []
+    for month in attendance_archive.overlapping(since, until):
+        for path in attendance_archive.files(month):
+            info = os.stat(path)
+            archived.append((path, info.st_size, info.st_mtime_ns))
+    # Which days count as elapsed only moves while the period is still open
+    return (sum(shard[0] for shard in shards), tuple(shard[1:] for shard in shards),
+            min(date.today(), end + timedelta(days=1)), tuple(archived))
+
+
+def attendance_report(start: date, end: date) -> Dict[str, Any]:
+    """Org-wide report for ``start``..``end`` (inclusive), from cache when nothing changed"""
+    stamp = data_stamp(start, end)
+    report = analytics_cache.get((start, end), stamp)
+    if report is not None:
+        return report
+
+    started = clock.perf_counter()
+    columns = load_period(start, end)
+    loaded = clock.perf_counter()
+    report = compute_report(columns, start, end, active_users=stamp[0])
+    analytics_cache.put((start, end), stamp, report)
+    logger.info("attendance report computed", extra={
+        "start": start.isoformat(), "end": end.isoformat(), "check_ins": report["check_ins"],
+        "load_ms": round((loaded - started) * 1000, 1),
+        "aggregate_ms": round((clock.perf_counter() - loaded) * 1000, 1),
+    })
+    return report
@@ -0,0 +1,354 @@
+"""
+Cold archive of closed months of attendance_records
+Each archived month is a directory of compressed Parquet files,
+``<ARCHIVE_DIR>/attendance/month=YYYY-MM/part-*.parquet``. A record lives
+either in the database or in the archive, never both; AttendanceService
+reads both for ranges that reach into archived months. Files of shard n > 0
+are named ``part-s<n>-*.parquet`` since record ids are only unique per shard.
+"""
+
+import os
+import threading
+import uuid
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import and_, delete, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import AttendanceRecord
+from partitioning import add_months, drop_partition_if_empty, partitioning_enabled
+
+# The site is not archived: files written before it existed lack it, and reads go by user
+COLUMNS = [column.name for column in AttendanceRecord.__table__.columns if column.name != "site"]
+TIMESTAMP_COLUMNS = ("check_in_time", "check_out_time", "created_at")
+
+
+def naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Local naive time, the way the application writes timestamps"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive values are local time; the archive stores UTC instants"""
+    return value.astimezone(timezone.utc) if value is not None else None
+
+
+def _schema():
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(),
+        "user_id": pa.int64(),
+        "replay_of": pa.int64(),
+        "work_duration": pa.float64(),
+        "face_verified": pa.bool_(),
+    }
+    return pa.schema([
+        (name, pa.timestamp("us", tz="UTC") if name in TIMESTAMP_COLUMNS else types.get(name, pa.string()))
+        for name in COLUMNS
+    ])
+
+
+class AttendanceArchive:
+    """Month directories of Parquet files under ``root``"""
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, "attendance")
+        self._lock = threading.Lock()
+        self._listed_mtime = None
+        self._months: List[date] = []
+
+    @staticmethod
+    def _month_of(dirname: str) -> Optional[date]:
+        try:
+            return datetime.strptime(dirname, "month=%Y-%m").date()
+        except ValueError:
+            return None
+
+    def month_dir(self, month: date) -> str:
+        return os.path.join(self.root, f"month={month:%Y-%m}")
+
+    def months(self) -> List[date]:
+        """Archived months, oldest first; re-listed only when a month directory is added"""
+        try:
+            mtime = os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if mtime != self._listed_mtime:
+                self._months = sorted(m for m in map(self._month_of, os.listdir(self.root)) if m)
+                self._listed_mtime = mtime
+            return list(self._months)
+
+    @staticmethod
+    def _prefix(shard: int) -> str:
+        return f"part-s{shard}-" if shard else "part-"
+
+    def files(self, month: date, shard: Optional[int] = None) -> List[str]:
+        """The month's Parquet files, of every shard or of one"""
+        directory = self.month_dir(month)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        if shard is None:
+            keep = lambda n: n.startswith("part-")
+        elif shard:
+            keep = lambda n: n.startswith(self._prefix(shard))
+        else:
+            keep = lambda n: n.startswith("part-") and not n.startswith("part-s")
+        return sorted(os.path.join(directory, n) for n in names if keep(n) and n.endswith(".parquet"))
+
+    def overlapping(self, start: Optional[datetime], end: Optional[datetime]) -> List[date]:
+        """Archived months with any day inside [start, end]"""
+        start, end = _utc(start), _utc(end)
+        return [
+            month for month in self.months()
+            if (end is None or _utc(datetime.combine(month, time.min)) <= end)
+            and (start is None or _utc(datetime.combine(add_months(month, 1), time.min)) > start)
+        ]
+
+    def read(self, user_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             columns: Optional[Sequence[str]] = None, aware: bool = False) -> List[Dict[str, Any]]:
+        """
+        One user's archived records with ``start <= check_in_time <= end``.
+        Timestamps come back in local time, naive unless ``aware`` (match
+        what the database driver returns).
+        """
+        return self._read_months(self.overlapping(start, end), user_id, start, end, columns, aware)
+
+    def _read_months(self, months: List[date], user_id: int, start: Optional[datetime], end: Optional[datetime],
+                     columns: Optional[Sequence[str]], aware: bool) -> List[Dict[str, Any]]:
+        if not months:
+            return []
+
+        import pyarrow.parquet as pq
+
+        columns = list(columns or COLUMNS)
+        filters = [("user_id", "=", user_id)]
+        if start is not None:
+            filters.append(("check_in_time", ">=", _utc(start)))
+        if end is not None:
+            filters.append(("check_in_time", "<=", _utc(end)))
+        local = (lambda value: value.astimezone()) if aware else naive
+
+        rows = []
+        for month in months:
+            for path in self.files(month):
+                for row in pq.read_table(path, columns=columns, filters=filters).to_pylist():
+                    for column in TIMESTAMP_COLUMNS:
+                        if row.get(column) is not None:
+                            row[column] = local(row[column])
+                    rows.append(row)
+        return rows
+
+    def read_latest(self, user_id: int, limit: int, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None, columns: Optional[Sequence[str]] = None,
+                    aware: bool = False) -> List[Dict[str, Any]]:
+        """
+        One user's newest ``limit`` archived records in [start, end], newest
+        first. Months are read newest first and older ones are skipped once
+        ``limit`` records are found, so an open-ended range doesn't read the
+        whole archive.
+        """
+        rows = []
+        for month in reversed(self.overlapping(start, end)):
+            rows += self._read_months([month], user_id, start, end, columns, aware)
+            if len(rows) >= limit:
+                break
+        return sorted(rows, key=lambda row: naive(row["check_in_time"]), reverse=True)[:limit]
+
+    def read_columns(self, start: Optional[datetime], end: Optional[datetime], columns: Sequence[str]):
+        """
+        Every user's archived records with ``start <= check_in_time <= end`` as
+        one pyarrow Table (timestamps stay UTC), or None if no month overlaps
+        """
+        months = self.overlapping(start, end)
+        if not months:
+            return None
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append(("check_in_time", ">=", _utc(start)))
+        if end is not None:
+            filters.append(("check_in_time", "<=", _utc(end)))
+        tables = [
+            pq.read_table(path, columns=list(columns), filters=filters or None)
+            for month in months for path in self.files(month)
+        ]
+        return pa.concat_tables(tables) if tables else None
+
+    def archived_ids(self, month: date, shard: int = 0) -> set:
+        import pyarrow.parquet as pq
+
+        ids = set()
+        for path in self.files(month, shard):
+            ids.update(pq.read_table(path, columns=["id"]).column("id").to_pylist())
+        return ids
+
+    def purge(self, end: Optional[datetime], user_id: Optional[int] = None, delete_records: bool = False,
+              shard: int = 0, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Delete one shard's archived records with ``check_in_time < end`` (all
+        of them if ``end`` is None), optionally only one user's, or only clear
+        their face_image. Each affected file is rewritten in place and removed
+        once empty. Returns the records processed, the image bytes freed and
+        the users whose records changed; ``dry_run`` only counts them.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        result = {"records": 0, "bytes": 0, "user_ids": set()}
+        months = self.overlapping(None, end) if end is not None else self.months()
+        for month in months:
+            for path in self.files(month, shard):
+                table = pq.read_table(path)
+                match = pa.array([True] * table.num_rows, pa.bool_())
+                if end is not None:
+                    match = pc.and_(match, pc.less(table["check_in_time"],
+                                                   pa.scalar(_utc(end), pa.timestamp("us", tz="UTC"))))
+                if user_id is not None:
+                    match = pc.and_(match, pc.equal(table["user_id"], user_id))
+                if not delete_records:
+                    match = pc.and_(match, pc.is_valid(table["face_image"]))
+                match = pc.fill_null(match, False)
+                affected = table.filter(match)
+                if not affected.num_rows:
+                    continue
+
+                result["records"] += affected.num_rows
+                result["bytes"] += pc.sum(pc.utf8_length(affected["face_image"])).as_py() or 0
+                result["user_ids"].update(pc.unique(affected["user_id"]).to_pylist())
+                if dry_run:
+                    continue
+                if delete_records:
+                    table = table.filter(pc.invert(match))
+                else:
+                    column = table.schema.get_field_index("face_image")
+                    table = table.set_column(column, table.schema.field(column), pc.if_else(
+                        match, pa.nulls(table.num_rows, pa.string()), table["face_image"]
+                    ))
+                self._replace(path, table)
+        return result
+
+    def _replace(self, path: str, table):
+        """Swap in the rewritten contents of a file, or remove it (and its empty month) if none are left"""
+        import pyarrow.parquet as pq
+
+        if table.num_rows:
+            temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+            try:
+                pq.write_table(table, temp_path, compression=settings.ARCHIVE_COMPRESSION)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            return
+        os.remove(path)
+        directory = os.path.dirname(path)
+        if not os.listdir(directory):
+            os.rmdir(directory)
+
+    def stats(self) -> Dict[str, int]:
+        """Archived records, records with a face image and bytes on disk, from file metadata"""
+        import pyarrow.parquet as pq
+
+        stats = {"records": 0, "records_with_images": 0, "size_bytes": 0}
+        for month in self.months():
+            for path in self.files(month):
+                metadata = pq.ParquetFile(path).metadata
+                stats["records"] += metadata.num_rows
+                stats["size_bytes"] += os.path.getsize(path)
+                column = metadata.schema.names.index("face_image")
+                statistics = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+                if all(stat is not None and stat.has_null_count for stat in statistics):
+                    nulls = sum(stat.null_count for stat in statistics)
+                else:
+                    nulls = pq.read_table(path, columns=["face_image"]).column(0).null_count
+                stats["records_with_images"] += metadata.num_rows - nulls
+        return stats
+
+    def write(self, month: date, batches: Iterable[List[Dict[str, Any]]], shard: int = 0) -> int:
+        """
+        Write rows as one new Parquet file of the month, one row group per
+        batch. The file only appears under its final name once complete.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = self.month_dir(month)
+        name = f"{self._prefix(shard)}{uuid.uuid4().hex}.parquet"
+        temp_path = os.path.join(directory, f".{name}.tmp")
+
+        schema = _schema()
+        writer = None
+        written = 0
+        try:
+            for batch in batches:
+                for row in batch:
+                    for column in TIMESTAMP_COLUMNS:
+                        row[column] = _utc(row[column])
+                if writer is None:
+                    os.makedirs(directory, exist_ok=True)
+                    writer = pq.ParquetWriter(temp_path, schema, compression=settings.ARCHIVE_COMPRESSION)
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(temp_path, os.path.join(directory, name))
+        finally:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return written
+
+
+attendance_archive = AttendanceArchive(settings.ARCHIVE_DIR)
+
+
+def archive_month(db: Session, month: date, archive: AttendanceArchive = attendance_archive,
+                  batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Move one month of attendance_records into the archive. Rows are written
+    first and deleted only once their file is in place, so an interrupted
+    run is finished by running it again.
+    """
+    shard = db.info.get("shard", 0)
+    table = AttendanceRecord.__table__
+    in_month = and_(
+        table.c.check_in_time >= datetime.combine(month, time.min),
+        table.c.check_in_time < datetime.combine(add_months(month, 1), time.min)
+    )
+    already_archived = archive.archived_ids(month, shard)
+    moved = set()
+
+    def batches():
+        result = db.execute(
+            select(table).where(in_month).order_by(table.c.check_in_time).execution_options(yield_per=batch_size)
+        )
+        for partition in result.mappings().partitions():
+            batch = [{c: row[c] for c in COLUMNS} for row in partition if row["id"] not in already_archived]
+            moved.update(row["id"] for row in batch)
+            if batch:
+                yield batch
+
+    written = archive.write(month, batches(), shard)
+
+    ids = sorted(already_archived | moved)
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        deleted += db.execute(delete(table).where(in_month, table.c.id.in_(ids[i:i + batch_size]))).rowcount
+
+    partition_dropped = partitioning_enabled(db.get_bind()) and drop_partition_if_empty(db.connection(), month)
+    db.commit()
+    return {"month": f"{month:%Y-%m}", "shard": shard, "written": written, "deleted": deleted, "partition_dropped": partition_dropped}
@@ -2,8 +2,14 @@ from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, desc
-from models import AttendanceRecord, User
+from sqlalchemy.exc import IntegrityError
+from models import AttendanceRecord, User, SecurityEvent, IdempotencyKey
 from services.auth_service import AuthService
+from services.event_bus import attendance_events
+from services.presence import presence_table
+from services.replay import ReplayMatch, image_fingerprint, replay_index, to_hex
+from services.archive import attendance_archive, naive
+from config import settings
 
 class AttendanceService:
     def __init__(self, db: Session):
@@ -15,44 +21,68 @@ class AttendanceService:
         """Check in user with face verification"""
         
         # Check if user already checked in today
-        today = datetime.now().date()
-        existing_record = self.db.query(AttendanceRecord).filter(
-            and_(
-                AttendanceRecord.user_id == user.id,
-                AttendanceRecord.check_in_time >= datetime.combine(today, datetime.min.time()),
-                AttendanceRecord.check_out_time.is_(None)
-            )
-        ).first()
+        existing_entry = presence_table.get(self.db, user)
         
-        if existing_record:
+        if existing_entry and not existing_entry.checked_out:
             return {
                 "success": False,
                 "message": "You have already checked in today",
-                "check_in_time": existing_record.check_in_time
+                "check_in_time": existing_entry.check_in_time
             }
         
+        # Decoded once for both face verification and replay detection
+        try:
+            image = self.auth_service.decode_face_image(face_image_base64)
+        except Exception:
+            image = None
+        
         # Verify face if face recognition is enabled
         if user.face_registered:
-            if not self.auth_service.verify_face_user(user, face_image_base64):
+            if not self.auth_service.match_face(user, face_image_base64, image):
                 return {
                     "success": False,
                     "message": "Face verification failed. The face in your photo doesn't match your registered face. Please try again with better lighting and ensure your face is clearly visible."
                 }
         
+        # A photo nearly identical to one of the user's earlier check-ins is a likely replay
+        fingerprint = replay = None
+        if image is not None and settings.REPLAY_DETECTION_ENABLED:
+            fingerprint = image_fingerprint(image)
+            replay = replay_index.find(self.db, user, fingerprint)
+            if replay and settings.REPLAY_REJECT:
+                self.auth_service.log_security_event(
+                    user_id=user.id,
+                    event_type="check_in_replay_rejected",
+                    description=f"Check-in photo matches check-in {replay.attendance_id} ({replay.distance} bits apart)",
+                    ip_address=ip_address,
+                    severity="warning"
+                )
+                self.db.commit()
+                return {
+                    "success": False,
+                    "message": "This photo was already used for an earlier check-in. Please take a new photo."
+                }
+        
         # Create attendance record
         attendance_record = AttendanceRecord(
             user_id=user.id,
+            site=user.site,
             check_in_time=datetime.now(),
             location=location,
             face_verified=user.face_registered,
             face_image=face_image_base64,  # Store the captured face image
+            image_hash=to_hex(fingerprint) if fingerprint is not None else None,
+            replay_of=replay.attendance_id if replay else None,
             ip_address=ip_address,
             user_agent=user_agent
         )
         
+        # Record, version bump and audit events go out in one transaction;
+        # the flush assigns the record's id for the event descriptions
+        loaded_version = user.data_version
         self.db.add(attendance_record)
-        self.db.commit()
-        self.db.refresh(attendance_record)
+        committed_version = self.auth_service.bump_data_version(user)
+        self.db.flush()
         
         # Log security event
         self.auth_service.log_security_event(
@@ -61,36 +91,51 @@ class AttendanceService:
             description=f"User checked in at {attendance_record.check_in_time}",
             ip_address=ip_address
         )
+        if replay:
+            self.auth_service.log_security_event(
+                user_id=user.id,
+                event_type="check_in_replay_suspected",
+                description=f"Check-in {attendance_record.id} photo matches check-in {replay.attendance_id} "
+                            f"({replay.distance} bits apart)",
+                ip_address=ip_address,
+                severity="warning"
+            )
+        self.db.commit()
+        
+        presence_table.record_check_in(user.id, attendance_record.id, attendance_record.check_in_time,
+                                       (loaded_version, committed_version))
+        if fingerprint is not None:
+            replay_index.record(user.id, attendance_record.id, fingerprint, attendance_record.check_in_time,
+                                loaded_version, committed_version)
+        
+        self._publish("check_in", user, attendance_record)
         
         return {
             "success": True,
             "message": "Check-in successful",
             "attendance_id": attendance_record.id,
             "check_in_time": attendance_record.check_in_time,
-            "face_verified": attendance_record.face_verified
+            "face_verified": attendance_record.face_verified,
+            "replay_suspected": replay is not None
         }
     
     def check_out(self, user: User, attendance_id: Optional[int] = None) -> Dict[str, Any]:
         """Check out user"""
         
         # Find today's check-in record
-        today = datetime.now().date()
+        query = self.db.query(AttendanceRecord).filter(AttendanceRecord.user_id == user.id)
+        if not attendance_id:
+            entry = presence_table.get(self.db, user)
+            if entry is None or entry.checked_out:
+                return {
+                    "success": False,
+                    "message": "No active check-in record found"
+                }
+            attendance_id = entry.attendance_id
+            # Lets a partitioned table look in a single month
+            query = query.filter(AttendanceRecord.check_in_time == entry.check_in_time)
         
-        if attendance_id:
-            attendance_record = self.db.query(AttendanceRecord).filter(
-                and_(
-                    AttendanceRecord.id == attendance_id,
-                    AttendanceRecord.user_id == user.id
-                )
-            ).first()
-        else:
-            attendance_record = self.db.query(AttendanceRecord).filter(
-                and_(
-                    AttendanceRecord.user_id == user.id,
-                    AttendanceRecord.check_in_time >= datetime.combine(today, datetime.min.time()),
-                    AttendanceRecord.check_out_time.is_(None)
-                )
-            ).first()
+        attendance_record = query.filter(AttendanceRecord.id == attendance_id).first()
         
         if not attendance_record:
             return {
@@ -111,8 +156,8 @@ class AttendanceService:
         # Update attendance record
         attendance_record.check_out_time = check_out_time
         attendance_record.work_duration = round(work_duration, 2)
-        
-        self.db.commit()
+        loaded_version = user.data_version
+        committed_version = self.auth_service.bump_data_version(user)
         
         # Log security event
         self.auth_service.log_security_event(
@@ -121,6 +166,12 @@ class AttendanceService:
             description=f"User checked out at {check_out_time} (Work duration: {work_duration:.2f} hours)",
             ip_address=None
         )
+        self.db.commit()
+        
+        presence_table.record_check_out(user.id, attendance_record.id, check_out_time,
+                                        attendance_record.work_duration, (loaded_version, committed_version))
+        
+        self._publish("check_out", user, attendance_record)
         
         return {
             "success": True,
@@ -130,11 +181,281 @@ class AttendanceService:
             "work_duration": attendance_record.work_duration
         }
     
+    def bulk_ingest(self, actor: User, events: List[Dict[str, Any]], ip_address: Optional[str] = None,
+                    user_agent: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Ingest a batch of check-in/check-out events replayed by a kiosk.
+        
+        Each event carries a client idempotency key; keys that were already
+        ingested are reported as duplicates instead of being applied twice.
+        All accepted events are written in a single transaction.
+        """
+        try:
+            return self._bulk_ingest(actor, events, ip_address, user_agent)
+        except IntegrityError:
+            # Another request ingested some of the same keys concurrently.
+            # Retry once; those keys are now reported as duplicates.
+            self.db.rollback()
+            return self._bulk_ingest(actor, events, ip_address, user_agent)
+    
+    def _bulk_ingest(self, actor: User, events: List[Dict[str, Any]], ip_address: Optional[str],
+                     user_agent: Optional[str]) -> List[Dict[str, Any]]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(events)
+        now = datetime.now()
+        max_time = now + timedelta(minutes=settings.BULK_MAX_CLOCK_SKEW_MINUTES)
+        
+        def reject(index: int, message: str):
+            results[index] = {
+                "idempotency_key": events[index]["idempotency_key"],
+                "status": "rejected",
+                "message": message
+            }
+        
+        # Keys are scoped to the user the event is for; keys already ingested
+        # by earlier batches are found with one query
+        owners = [event.get("user_id") or actor.id for event in events]
+        keys = [event["idempotency_key"] for event in events]
+        known_keys = {
+            (row.user_id, row.key): row for row in self.db.query(IdempotencyKey).filter(
+                IdempotencyKey.key.in_(keys), IdempotencyKey.user_id.in_(set(owners))
+            ).all()
+        }
+        
+        pending = []
+        seen_keys = set()
+        for index, event in enumerate(events):
+            key = event["idempotency_key"]
+            user_id = owners[index]
+            if user_id != actor.id and not actor.is_admin:
+                reject(index, "Not allowed to submit events for other users")
+                continue
+            
+            if (user_id, key) in known_keys:
+                results[index] = {
+                    "idempotency_key": key,
+                    "status": "duplicate",
+                    "message": "Event already ingested",
+                    "attendance_id": known_keys[(user_id, key)].attendance_id
+                }
+                continue
+            if (user_id, key) in seen_keys:
+                results[index] = {
+                    "idempotency_key": key,
+                    "status": "duplicate",
+                    "message": "Duplicate idempotency key in batch"
+                }
+                continue
+            seen_keys.add((user_id, key))
+            
+            if event["event_type"] not in ("check_in", "check_out"):
+                reject(index, "event_type must be check_in or check_out")
+                continue
+            
+            occurred_at = event.get("occurred_at") or now
+            if occurred_at.tzinfo is not None:
+                occurred_at = occurred_at.astimezone().replace(tzinfo=None)
+            if occurred_at > max_time:
+                reject(index, "Event time is in the future")
+                continue
+            
+            pending.append((occurred_at, index, user_id))
+        
+        if not pending:
+            return results
+        
+        # Load every user and their open records from the earliest event day onwards (two queries)
+        user_ids = {user_id for _, _, user_id in pending}
+        users = {user.id: user for user in self.db.query(User).filter(User.id.in_(user_ids)).all()}
+        
+        earliest_day = min(occurred_at for occurred_at, _, _ in pending).date()
+        open_records: Dict[int, List[AttendanceRecord]] = {}
+        records_by_id: Dict[int, AttendanceRecord] = {}
+        for record in self.db.query(AttendanceRecord).filter(
+            and_(
+                AttendanceRecord.user_id.in_(user_ids),
+                AttendanceRecord.check_in_time >= datetime.combine(earliest_day, datetime.min.time())
+            )
+        ).all():
+            records_by_id[record.id] = record
+            if record.check_out_time is None:
+                open_records.setdefault(record.user_id, []).append(record)
+        
+        def find_open_record(user_id: int, day, attendance_id: Optional[int]) -> Optional[AttendanceRecord]:
+            for record in open_records.get(user_id, []):
+                if attendance_id is not None:
+                    if record.id == attendance_id:
+                        return record
+                elif record.check_in_time.date() == day:
+                    return record
+            return None
+        
+        accepted = []
+        rejected_replays = []
+        # Photos of this batch's check-ins per user, so a photo reused within the batch is caught too
+        batch_fingerprints: Dict[int, List[tuple]] = {}  # user id -> [(fingerprint, attendance id, check-in)]
+        # Apply in event-time order so a check-in replayed in the same batch as its check-out pairs up
+        for occurred_at, index, user_id in sorted(pending, key=lambda item: (item[0], item[1])):
+            event = events[index]
+            user = users.get(user_id)
+            if user is None or not user.is_active:
+                reject(index, "User not found or inactive")
+                continue
+            
+            if event["event_type"] == "check_in":
+                if find_open_record(user_id, occurred_at.date(), None):
+                    reject(index, "User already checked in that day")
+                    continue
+                
+                face_image = event.get("face_image")
+                image = None
+                if face_image:
+                    try:
+                        image = self.auth_service.decode_face_image(face_image)
+                    except Exception:
+                        image = None
+                if user.face_registered and (
+                    not face_image or not self.auth_service.match_face(user, face_image, image)
+                ):
+                    reject(index, "Face verification failed")
+                    continue
+                
+                # Same replay check as check_in, against the user's earlier check-ins and this batch's
+                fingerprint = replay = None
+                if image is not None and settings.REPLAY_DETECTION_ENABLED:
+                    fingerprint = image_fingerprint(image)
+                    replay = replay_index.find(self.db, user, fingerprint, occurred_at)
+                    for earlier in batch_fingerprints.get(user_id, []):
+                        distance = bin(earlier[0] ^ fingerprint).count("1")
+                        if distance <= replay_index.max_distance and (replay is None or distance < replay.distance):
+                            replay = ReplayMatch(earlier[1], distance, earlier[2])
+                    if replay and settings.REPLAY_REJECT:
+                        rejected_replays.append((user_id, replay))
+                        reject(index, "This photo was already used for an earlier check-in")
+                        continue
+                
+                record = AttendanceRecord(
+                    user_id=user_id,
+                    site=user.site,
+                    check_in_time=occurred_at,
+                    location=event.get("location"),
+                    face_verified=user.face_registered,
+                    face_image=face_image,
+                    image_hash=to_hex(fingerprint) if fingerprint is not None else None,
+                    replay_of=replay.attendance_id if replay else None,
+                    ip_address=ip_address,
+                    user_agent=user_agent
+                )
+                self.db.add(record)
+                open_records.setdefault(user_id, []).append(record)
+                if fingerprint is not None:
+                    # Later photos of the batch may match this one, so it needs its id now
+                    self.db.flush()
+                    batch_fingerprints.setdefault(user_id, []).append((fingerprint, record.id, occurred_at))
+                accepted.append((index, user_id, record, f"User checked in at {occurred_at} (bulk)", replay))
+            else:
+                record = find_open_record(user_id, occurred_at.date(), event.get("attendance_id"))
+                if record is None:
+                    reject(index, "No active check-in record found")
+                    continue
+                if occurred_at < record.check_in_time:
+                    reject(index, "Check-out time is before check-in time")
+                    continue
+                
+                work_duration = (occurred_at - record.check_in_time).total_seconds() / 3600
+                record.check_out_time = occurred_at
+                record.work_duration = round(work_duration, 2)
+                open_records[user_id].remove(record)
+                accepted.append((index, user_id, record,
+                                 f"User checked out at {occurred_at} (Work duration: {work_duration:.2f} hours, bulk)",
+                                 None))
+        
+        for user_id, replay in rejected_replays:
+            self.db.add(SecurityEvent(
+                user_id=user_id,
+                event_type="check_in_replay_rejected",
+                description=f"Check-in photo matches check-in {replay.attendance_id} "
+                            f"({replay.distance} bits apart, bulk)",
+                ip_address=ip_address,
+                severity="warning",
+                timestamp=datetime.utcnow()
+            ))
+        if not accepted:
+            if rejected_replays:
+                self.db.commit()
+            return results
+        
+        # Assign ids to new records, then write keys and audit events in the same transaction
+        self.db.flush()
+        for user_id in {user_id for _, user_id, _, _, _ in accepted}:
+            self.auth_service.bump_data_version(users[user_id])
+        for index, user_id, record, description, replay in accepted:
+            event = events[index]
+            self.db.add(IdempotencyKey(
+                key=event["idempotency_key"],
+                user_id=user_id,
+                event_type=event["event_type"],
+                attendance_id=record.id
+            ))
+            self.db.add(SecurityEvent(
+                user_id=user_id,
+                event_type=event["event_type"],
+                description=description,
+                ip_address=ip_address,
+                timestamp=datetime.utcnow()
+            ))
+            if replay:
+                self.db.add(SecurityEvent(
+                    user_id=user_id,
+                    event_type="check_in_replay_suspected",
+                    description=f"Check-in {record.id} photo matches check-in {record.replay_of} "
+                                f"({replay.distance} bits apart, bulk)",
+                    ip_address=ip_address,
+                    severity="warning",
+                    timestamp=datetime.utcnow()
+                ))
+            results[index] = {
+                "idempotency_key": event["idempotency_key"],
+                "status": "created" if event["event_type"] == "check_in" else "updated",
+                "message": "Check-in recorded" if event["event_type"] == "check_in" else "Check-out recorded",
+                "attendance_id": record.id
+            }
+        self.db.commit()
+        
+        # The version bump makes the replay index reload these users' hashes on next use
+        for index, user_id, record, _, _ in accepted:
+            if events[index]["event_type"] == "check_in":
+                presence_table.record_check_in(user_id, record.id, record.check_in_time)
+            else:
+                presence_table.record_check_out(user_id, record.id, record.check_out_time, record.work_duration)
+            self._publish(events[index]["event_type"], users[user_id], record)
+        
+        return results
+    
+    def _publish(self, event_type: str, user: User, record: AttendanceRecord):
+        """Push a committed check-in/check-out to live subscribers"""
+        attendance_events.publish({
+            "type": event_type,
+            "user_id": user.id,
+            "username": user.username,
+            "full_name": user.full_name,
+            "attendance_id": record.id,
+            "check_in_time": record.check_in_time.isoformat(),
+            "check_out_time": record.check_out_time.isoformat() if record.check_out_time else None,
+            "work_duration": record.work_duration,
+            "location": record.location
+        })
+    
     def get_user_attendance(self, user: User, start_date: Optional[datetime] = None, 
-                           end_date: Optional[datetime] = None, limit: int = 30) -> List[Dict[str, Any]]:
-        """Get user's attendance records"""
+                           end_date: Optional[datetime] = None, limit: int = 30,
+                           include_images: bool = True) -> List[Dict[str, Any]]:
+        """Get user's attendance records (without face_image unless ``include_images``)"""
         
-        query = self.db.query(AttendanceRecord).filter(AttendanceRecord.user_id == user.id)
+        columns = ["id", "check_in_time", "check_out_time", "work_duration", "location", "face_verified"]
+        if include_images:
+            columns.append("face_image")
+        query = self.db.query(*(getattr(AttendanceRecord, column) for column in columns)).filter(
+            AttendanceRecord.user_id == user.id
+        )
         
         if start_date:
             query = query.filter(AttendanceRecord.check_in_time >= start_date)
@@ -143,19 +464,27 @@ class AttendanceService:
         
         records = query.order_by(desc(AttendanceRecord.check_in_time)).limit(limit).all()
         
-        return [
-            {
-                "id": record.id,
-                "check_in_time": record.check_in_time,
-                "check_out_time": record.check_out_time,
-                "work_duration": record.work_duration,
-                "location": record.location,
-                "face_verified": record.face_verified,
-                "face_image": record.face_image,  # Include the captured face image
-                "date": record.check_in_time.date()
-            }
-            for record in records
-        ]
+        results = [{**record._asdict(), "date": record.check_in_time.date()} for record in records]
+        
+        # Archived months only matter if they could hold one of the newest `limit` records:
+        # with `limit` live records, only a month reaching past the oldest of them (usually
+        # none); otherwise the newest archived months since the account was created (a day
+        # early, created_at may be UTC), just as many as it takes to fill `limit`
+        if len(results) == limit:
+            archive_from = results[-1]["check_in_time"]
+        else:
+            created = naive(user.created_at) - timedelta(days=1) if user.created_at else None
+            archive_from = max(filter(None, [start_date, created]), default=None)
+        archived = attendance_archive.read_latest(
+            user.id, limit, archive_from, end_date, columns=columns,
+            aware=self.db.get_bind().dialect.name == "postgresql"
+        )
+        if archived:
+            for row in archived:
+                row["date"] = row["check_in_time"].date()
+            results = sorted(results + archived, key=lambda r: naive(r["check_in_time"]), reverse=True)[:limit]
+        
+        return results
     
     def get_attendance_summary(self, user: User, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get attendance summary for a date range"""
@@ -167,9 +496,11 @@ class AttendanceService:
                 AttendanceRecord.check_in_time <= end_date
             )
         ).all()
+        archived = attendance_archive.read(user.id, start_date, end_date, columns=["work_duration"])
         
-        total_days = len(records)
+        total_days = len(records) + len(archived)
         total_hours = sum(record.work_duration or 0 for record in records)
+        total_hours += sum(row["work_duration"] or 0 for row in archived)
         average_hours = total_hours / total_days if total_days > 0 else 0
         
         # Calculate working days (excluding weekends)
@@ -196,31 +527,31 @@ class AttendanceService:
             }
         }
     
-    def get_today_status(self, user: User) -> Dict[str, Any]:
+    def get_today_status(self, user: User, include_image: bool = True) -> Dict[str, Any]:
         """Get today's attendance status"""
-        today = datetime.now().date()
-        
-        today_record = self.db.query(AttendanceRecord).filter(
-            and_(
-                AttendanceRecord.user_id == user.id,
-                AttendanceRecord.check_in_time >= datetime.combine(today, datetime.min.time()),
-                AttendanceRecord.check_in_time <= datetime.combine(today, datetime.max.time())
-            )
-        ).first()
+        today_entry = presence_table.get(self.db, user)
         
-        if not today_record:
+        if not today_entry:
             return {
                 "checked_in": False,
                 "checked_out": False,
                 "message": "Not checked in today"
             }
         
-        return {
+        today_status = {
             "checked_in": True,
-            "checked_out": today_record.check_out_time is not None,
-            "check_in_time": today_record.check_in_time,
-            "check_out_time": today_record.check_out_time,
-            "work_duration": today_record.work_duration,
-            "attendance_id": today_record.id,
-            "face_image": today_record.face_image  # Include the captured face image
+            "checked_out": today_entry.checked_out,
+            "check_in_time": today_entry.check_in_time,
+            "check_out_time": today_entry.check_out_time,
+            "work_duration": today_entry.work_duration,
+            "attendance_id": today_entry.attendance_id
         }
+        
+        if include_image:
+            # Images are too large to keep in memory; fetch by primary key only when asked
+            today_status["face_image"] = self.db.query(AttendanceRecord.face_image).filter(
+                AttendanceRecord.id == today_entry.attendance_id,
+                AttendanceRecord.check_in_time == today_entry.check_in_time
+            ).scalar()
+        
+        return today_status
@@ -0,0 +1,216 @@
+"""
+Audit log rollups, retention and paging
+login_attempts and security_events are rolled up into hourly and daily
+tables; raw rows older than AUDIT_RETENTION_DAYS are then deleted in small
+batches so retention never holds long locks on the primary database.
+Audit timestamps are naive UTC (AuthService writes them with utcnow).
+"""
+
+import base64
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, Session
+
+from config import settings
+from models import LoginAttempt, LoginAttemptRollup, SecurityEvent, SecurityEventRollup
+
+logger = logging.getLogger(__name__)
+
+# A bucket is only rolled up once rows committed just after its end have landed
+SETTLE_TIME = timedelta(minutes=1)
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _hour(value: datetime) -> datetime:
+    return _utc(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _commit_rollup(db: Session, rows: List[Any], name: str) -> int:
+    db.add_all(rows)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker rolled up the same buckets first
+        db.rollback()
+        logger.info("audit rollup already done elsewhere", extra={"rollup": name})
+        return 0
+    return len(rows)
+
+
+def rollup_login_attempts(db: Session, now: Optional[datetime] = None) -> Tuple[int, Optional[datetime]]:
+    """Add hourly buckets for every closed hour not rolled up yet; returns (buckets, covered until)"""
+    until = _hour((now or datetime.utcnow()) - SETTLE_TIME)
+    last = db.query(func.max(LoginAttemptRollup.bucket_start)).scalar()
+    if last is not None:
+        since = last + timedelta(hours=1)
+    else:
+        oldest = db.query(func.min(LoginAttempt.timestamp)).scalar()
+        if oldest is None:
+            return 0, until
+        since = _hour(oldest)
+    if since >= until:
+        return 0, until
+
+    buckets = defaultdict(lambda: {"attempts": 0, "failures": 0, "user_id": None})
+    rows = db.execute(
+        select(LoginAttempt.timestamp, LoginAttempt.username, LoginAttempt.ip_address,
+               LoginAttempt.user_id, LoginAttempt.success)
+        .where(LoginAttempt.timestamp >= since, LoginAttempt.timestamp < until)
+        .execution_options(yield_per=settings.AUDIT_PRUNE_BATCH_SIZE)
+    )
+    for timestamp, username, ip_address, user_id, success in rows:
+        bucket = buckets[(_hour(timestamp), username or "", ip_address)]
+        bucket["attempts"] += 1
+        bucket["failures"] += 0 if success else 1
+        bucket["user_id"] = user_id or bucket["user_id"]
+
+    added = _commit_rollup(db, [
+        LoginAttemptRollup(bucket_start=hour, username=username, ip_address=ip_address, **counts)
+        for (hour, username, ip_address), counts in buckets.items()
+    ], "login_attempts")
+    return added, until
+
+
+def rollup_security_events(db: Session, now: Optional[datetime] = None) -> Tuple[int, Optional[datetime]]:
+    """Add daily buckets for every closed day not rolled up yet; returns (buckets, covered until)"""
+    until_day = _utc((now or datetime.utcnow()) - SETTLE_TIME).date()
+    until = datetime.combine(until_day, datetime.min.time())
+    last = db.query(func.max(SecurityEventRollup.day)).scalar()
+    if last is not None:
+        since_day = last + timedelta(days=1)
+    else:
+        oldest = db.query(func.min(SecurityEvent.timestamp)).scalar()
+        if oldest is None:
+            return 0, until
+        since_day = _utc(oldest).date()
+    if since_day >= until_day:
+        return 0, until
+
+    counts = defaultdict(int)
+    rows = db.execute(
+        select(SecurityEvent.timestamp, SecurityEvent.event_type, SecurityEvent.severity)
+        .where(SecurityEvent.timestamp >= datetime.combine(since_day, datetime.min.time()),
+               SecurityEvent.timestamp < until)
+        .execution_options(yield_per=settings.AUDIT_PRUNE_BATCH_SIZE)
+    )
+    for timestamp, event_type, severity in rows:
+        counts[(_utc(timestamp).date(), event_type, severity or "info")] += 1
+
+    added = _commit_rollup(db, [
+        SecurityEventRollup(day=day, event_type=event_type, severity=severity, count=count)
+        for (day, event_type, severity), count in counts.items()
+    ], "security_events")
+    return added, until
+
+
+def prune(db: Session, model, cutoff: datetime, batch_size: Optional[int] = None) -> int:
+    """Delete rows older than ``cutoff`` one short transaction per batch"""
+    batch_size = batch_size or settings.AUDIT_PRUNE_BATCH_SIZE
+    deleted = 0
+    while True:
+        ids = db.execute(
+            select(model.id).where(model.timestamp < cutoff).order_by(model.timestamp, model.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        deleted += db.execute(delete(model).where(model.id.in_(ids))).rowcount
+        db.commit()
+
+
+def run_audit_maintenance(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Roll up, then prune raw rows past retention that are already covered by a rollup"""
+    now = now or datetime.utcnow()
+    retention_cutoff = now - timedelta(days=settings.AUDIT_RETENTION_DAYS)
+
+    login_buckets, logins_until = rollup_login_attempts(db, now)
+    event_buckets, events_until = rollup_security_events(db, now)
+    result = {
+        "login_attempt_buckets": login_buckets,
+        "security_event_buckets": event_buckets,
+        "login_attempts_pruned": prune(db, LoginAttempt, min(retention_cutoff, logins_until)),
+        "security_events_pruned": prune(db, SecurityEvent, min(retention_cutoff, events_until)),
+    }
+    logger.info("audit maintenance finished", extra=result)
+    return result
+
+
+def encode_cursor(timestamp: datetime, row_id: int, shard: int = 0) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}" + (f"|{shard}" if shard else "")
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    """Raises ValueError for anything encode_cursor did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id, *shard = raw.split("|")
+        if len(shard) > 1:
+            raise ValueError(raw)
+        return datetime.fromisoformat(timestamp), int(row_id), int(shard[0]) if shard else 0
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def keyset_page(query: Query, model, limit: int, cursor: Optional[str] = None,
+                shard: int = 0) -> Tuple[List[Any], Optional[str]]:
+    """
+    Newest-first page of ``query`` after ``cursor``. Seeks on the
+    (timestamp, id) index, so deep pages cost the same as the first one.
+    Across shards rows are ordered by (timestamp, id, shard), see merge_pages.
+    """
+    if cursor:
+        timestamp, row_id, cursor_shard = decode_cursor(cursor)
+        # A row with the cursor's exact key on a lower-numbered shard still follows it
+        same_key = model.id < row_id if shard >= cursor_shard else model.id <= row_id
+        query = query.filter(or_(
+            model.timestamp < timestamp,
+            and_(model.timestamp == timestamp, same_key)
+        ))
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        return rows[:limit], encode_cursor(last.timestamp, last.id, shard)
+    return rows, None
+
+
+def merge_pages(pages: List[Tuple[int, List[Any], Optional[str]]], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    One newest-first page from the keyset_page of every shard, as (shard
+    number, rows, next cursor), all fetched with the same cursor and limit.
+    The shard number must be the one passed to keyset_page, so the
+    (timestamp, id, shard) order agrees with the cursor's.
+    """
+    rows = sorted(
+        ((_utc(row.timestamp), row.id, shard, row) for shard, items, _ in pages for row in items),
+        key=lambda item: item[:3], reverse=True
+    )
+    more = len(rows) > limit or any(next_cursor for _, _, next_cursor in pages)
+    rows = rows[:limit]
+    if more and rows:
+        _, row_id, shard, last = rows[-1]
+        return [row for *_, row in rows], encode_cursor(last.timestamp, row_id, shard)
+    return [row for *_, row in rows], None
+
+
+def merge_rollups(results: List[List[Any]], key: Callable[[Any], Tuple], counts: Tuple[str, ...]) -> List[Any]:
+    """Rollup rows of every shard with the same bucket ``key`` summed into one"""
+    merged: Dict[Tuple, Any] = {}
+    for rows in results:
+        for row in rows:
+            bucket = key(row)
+            if bucket not in merged:
+                merged[bucket] = row
+            else:
+                for name in counts:
+                    setattr(merged[bucket], name, getattr(merged[bucket], name) + getattr(row, name))
+    return list(merged.values())
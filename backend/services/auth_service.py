@@ -1,30 +1,48 @@
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 import base64
+import hashlib
 import json
+import logging
+import secrets
 import pyotp
-import qrcode
 from io import BytesIO
 
-from models import User, LoginAttempt, SecurityEvent
+from models import User, LoginAttempt, SecurityEvent, RefreshToken
 from config import settings
+from metrics import stage_timer, face_verifications
+from replica import recent_writers
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class AuthService:
+    """
+    Authentication, MFA and audit logging on top of a request's session.
+
+    Helpers that write (audit rows, refresh tokens, data version bumps) only
+    stage their changes; each request commits them together with its own
+    writes in a single transaction.
+    """
+
     def __init__(self, db: Session):
         self.db = db
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        with stage_timer("verify_password"):
+            return pwd_context.verify(plain_password, hashed_password)
 
     def get_password_hash(self, password: str) -> str:
         """Hash a password"""
-        return pwd_context.hash(password)
+        with stage_timer("hash_password"):
+            return pwd_context.hash(password)
 
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token"""
@@ -51,6 +69,98 @@ class AuthService:
         except JWTError:
             return None
 
+    def _hash_refresh_token(self, token: str) -> str:
+        """Hash a refresh token for storage (tokens are random, so SHA-256 is enough)"""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def create_refresh_token(self, user: User, family_id: Optional[str] = None,
+                             ip_address: str = None, user_agent: str = None) -> str:
+        """
+        Create a refresh token and stage its hash; stored on the caller's commit.
+        The token starts with the user's site so /refresh can find its shard.
+        """
+        token = f"{user.site}.{secrets.token_urlsafe(48)}"
+        refresh_token = RefreshToken(
+            user_id=user.id,
+            token_hash=self._hash_refresh_token(token),
+            family_id=family_id or secrets.token_hex(16),
+            expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        self.db.add(refresh_token)
+        return token
+
+    def rotate_refresh_token(self, token: str, ip_address: str = None,
+                             user_agent: str = None) -> Optional[Tuple[User, str]]:
+        """
+        Exchange a refresh token for a new one in the same family.
+        Presenting an already-rotated token revokes the whole family.
+        """
+        stored = self.db.query(RefreshToken).filter(
+            RefreshToken.token_hash == self._hash_refresh_token(token)
+        ).first()
+        if not stored:
+            return None
+        
+        now = datetime.utcnow()
+        if stored.revoked_at is not None:
+            self._refresh_token_reused(stored, ip_address)
+            return None
+        
+        if stored.expires_at.replace(tzinfo=None) <= now:
+            return None
+        
+        user = self.get_user_by_id(stored.user_id)
+        if not user or not user.is_active:
+            return None
+        
+        # Claim the token atomically; a concurrent refresh with the same token
+        # that already claimed it makes this one a reuse
+        claimed = self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=now)
+        ).rowcount
+        if claimed != 1:
+            self._refresh_token_reused(stored, ip_address)
+            return None
+        
+        new_token = self.create_refresh_token(
+            user,
+            family_id=stored.family_id,
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        self.db.commit()
+        return user, new_token
+
+    def _refresh_token_reused(self, stored: RefreshToken, ip_address: Optional[str]):
+        """Token reuse - someone is replaying a rotated token, kill the whole chain"""
+        self.revoke_refresh_token_family(stored.family_id)
+        self.log_security_event(
+            user_id=stored.user_id,
+            event_type="refresh_token_reuse",
+            description="Rotated refresh token was presented again; token family revoked",
+            ip_address=ip_address,
+            severity="critical"
+        )
+        self.db.commit()
+
+    def revoke_refresh_token_family(self, family_id: str):
+        """Revoke every active token in a refresh token family (on the caller's transaction)"""
+        self.db.query(RefreshToken).filter(
+            RefreshToken.family_id == family_id,
+            RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+    def revoke_user_refresh_tokens(self, user: User):
+        """Revoke all active refresh tokens for a user (on the caller's transaction)"""
+        self.db.query(RefreshToken).filter(
+            RefreshToken.user_id == user.id,
+            RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
     def authenticate_user(self, username: str, password: str) -> Optional[User]:
         """Authenticate user with username and password"""
         user = self.db.query(User).filter(User.username == username).first()
@@ -103,6 +213,7 @@ class AuthService:
         )
         
         # Generate QR code
+        import qrcode
         qr = qrcode.QRCode(version=1, box_size=10, border=5)
         qr.add_data(provisioning_uri)
         qr.make(fit=True)
@@ -125,18 +236,17 @@ class AuthService:
     def verify_totp(self, user_id: int, token: str) -> bool:
         """Verify TOTP token"""
         user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or not user.totp_secret:
-            return False
-        
-        totp = pyotp.TOTP(user.totp_secret)
-        return totp.verify(token, valid_window=1)
+        return self.verify_totp_user(user, token) if user else False
 
     def setup_face_recognition(self, user_id: int, face_image_base64: str) -> bool:
         """Setup face recognition using perceptual hashing"""
         user = self.db.query(User).filter(User.id == user_id).first()
         if not user:
             return False
-        
+        return self.register_face_encoding(user, face_image_base64)
+
+    def register_face_encoding(self, user: User, face_image_base64: str) -> bool:
+        """Store the perceptual hash of an already-loaded user's face image"""
         try:
             from PIL import Image
             from io import BytesIO
@@ -153,49 +263,76 @@ class AuthService:
             
             user.face_encoding = face_encoding
             user.face_registered = True
-            self.db.commit()
+            self.bump_data_version(user)
             
-            print(f"Face registration successful for {user.username}")
-            print(f"  - Perceptual hash stored: {len(face_encoding)} bytes")
+            logger.info(
+                "face registered for %s", user.username,
+                extra={"user_id": user.id, "hash_bytes": len(face_encoding)}
+            )
             
             return True
-        except Exception as e:
-            print(f"Face recognition setup error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("face recognition setup failed", extra={"user_id": user.id})
             return False
 
     def verify_face(self, user_id: int, face_image_base64: str) -> bool:
         """Verify face against stored encoding using perceptual hashing"""
         user = self.db.query(User).filter(User.id == user_id).first()
+        return self.match_face(user, face_image_base64)
+
+    def match_face(self, user: Optional[User], face_image_base64: str, image=None) -> bool:
+        """
+        Compare an image with an already-loaded user's stored encoding.
+        Pass ``image`` (from ``decode_face_image``) when the caller already decoded it.
+        """
         if not user or not user.face_encoding:
             return False
         
-        try:
-            from PIL import Image
-            from io import BytesIO
-            import hashlib
-            
+        with stage_timer("verify_face"):
+            is_match = self._match_face(user, face_image_base64, image)
+        
+        if is_match is None:
+            face_verifications.labels("error").inc()
+            return False
+        face_verifications.labels("match" if is_match else "mismatch").inc()
+        return is_match
+
+    def decode_face_image(self, face_image_base64: str):
+        """
+        Decode a data-URL upload into the 32x32 grayscale image faces are
+        compared on. Returns None if it is too small to be a photo; raises if
+        it is not an image.
+        """
+        from PIL import Image
+        from io import BytesIO
+        
+        with stage_timer("verify_face.decode"):
             # Decode the current image
             image_data = base64.b64decode(face_image_base64.split(',')[1])
             
             # Basic validation
             if len(image_data) < 100:
-                print(f"Face verification failed: Image too small")
-                return False
-            
-            # Load image using PIL
-            current_image = Image.open(BytesIO(image_data))
+                return None
             
-            # Convert to grayscale and resize for comparison
-            current_image = current_image.convert('L').resize((32, 32))
+            # Load image using PIL, convert to grayscale and resize for comparison
+            return Image.open(BytesIO(image_data)).convert('L').resize((32, 32))
+    
+    def _match_face(self, user: User, face_image_base64: str, current_image=None) -> Optional[bool]:
+        """Returns None if the image could not be processed"""
+        try:
+            if current_image is None:
+                current_image = self.decode_face_image(face_image_base64)
+            if current_image is None:
+                logger.info("face verification failed: image too small", extra={"user_id": user.id})
+                return False
             
             # Get stored encoding (which is the hash of the registered image)
             stored_hash = user.face_encoding
             
-            # Calculate perceptual hash of current image
-            # This creates a hash that's similar for similar images
-            current_hash = self._get_perceptual_hash(current_image)
+            with stage_timer("verify_face.hash"):
+                # Calculate perceptual hash of current image
+                # This creates a hash that's similar for similar images
+                current_hash = self._get_perceptual_hash(current_image)
             
             # Calculate Hamming distance between hashes
             # Hamming distance counts how many bits are different
@@ -209,23 +346,25 @@ class AuthService:
             is_match = distance < threshold
             similarity_percent = ((max_bits - distance) / max_bits) * 100
             
-            print(f"Face verification for user {user.username}:")
-            print(f"  - Image size: {len(image_data)} bytes")
-            print(f"  - Hamming distance: {distance}/{max_bits} bits")
-            print(f"  - Similarity: {similarity_percent:.1f}%")
-            print(f"  - Threshold: < {threshold} bits ({80}% similarity required)")
-            print(f"  - Match: {'✅ YES' if is_match else '❌ NO'}")
-            
-            if not is_match:
-                print(f"  - REASON: Images are too different (similarity {similarity_percent:.1f}% < 80%)")
+            # Matches are high volume (DEBUG, sampled); mismatches are worth keeping
+            logger.log(
+                logging.DEBUG if is_match else logging.INFO,
+                "face verification %s for %s", "matched" if is_match else "mismatched", user.username,
+                extra={
+                    "user_id": user.id,
+                    "hamming_distance": distance,
+                    "max_bits": max_bits,
+                    "threshold_bits": threshold,
+                    "similarity_percent": round(similarity_percent, 1),
+                    "match": is_match
+                }
+            )
             
             return is_match
             
-        except Exception as e:
-            print(f"Face verification error: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        except Exception:
+            logger.exception("face verification error", extra={"user_id": user.id})
+            return None
     
     def _get_perceptual_hash(self, image) -> bytes:
         """
@@ -301,7 +440,7 @@ class AuthService:
         return similarity
 
     def log_login_attempt(self, username: str, ip_address: str, success: bool, failure_reason: str = None, user_id: int = None, user_agent: str = None):
-        """Log login attempt"""
+        """Stage a login attempt row; written on the caller's commit"""
         attempt = LoginAttempt(
             username=username,
             ip_address=ip_address,
@@ -312,10 +451,9 @@ class AuthService:
             timestamp=datetime.utcnow()
         )
         self.db.add(attempt)
-        self.db.commit()
 
     def log_security_event(self, user_id: int, event_type: str, description: str, ip_address: str = None, severity: str = "info"):
-        """Log security event"""
+        """Stage a security event row; written on the caller's commit"""
         event = SecurityEvent(
             user_id=user_id,
             event_type=event_type,
@@ -325,7 +463,20 @@ class AuthService:
             timestamp=datetime.utcnow()
         )
         self.db.add(event)
-        self.db.commit()
+
+    def bump_data_version(self, user: User) -> int:
+        """
+        Mark the user's cached representations stale; takes effect on the
+        caller's commit. The increment happens in the database (concurrent
+        bumps never collapse) and returns the new version in the same round trip.
+        """
+        version = self.db.execute(
+            update(User).where(User.id == user.id).values(data_version=User.data_version + 1)
+            .returning(User.data_version).execution_options(synchronize_session=False)
+        ).scalar_one()
+        set_committed_value(user, "data_version", version)
+        recent_writers.mark(user.id)
+        return version
 
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Get user by ID"""
@@ -383,23 +534,26 @@ class AuthService:
         # This is a simple implementation - in production you'd want more sophisticated logic
         pass
 
-    def register_face_encoding(self, user: User, face_image_base64: str) -> bool:
-        """Register face encoding for user"""
-        return self.setup_face_recognition(user.id, face_image_base64)
-
     def verify_face_user(self, user: User, face_image_base64: str) -> bool:
         """Verify user's face"""
-        return self.verify_face(user.id, face_image_base64)
+        return self.match_face(user, face_image_base64)
 
     def generate_totp_secret(self, user: User) -> str:
         """Generate TOTP secret for user"""
         secret = pyotp.random_base32()
         user.totp_secret = secret
-        self.db.commit()
+        self.bump_data_version(user)
         return secret
 
     def generate_totp_qr_code(self, user: User, secret: str) -> str:
         """Generate TOTP QR code for user"""
+        with stage_timer("totp_qr_code"):
+            return self._render_totp_qr_code(user, secret)
+
+    def _render_totp_qr_code(self, user: User, secret: str) -> str:
+        # qrcode (and the PIL image stack behind it) is only needed during TOTP setup
+        import qrcode
+        
         totp = pyotp.TOTP(secret)
         provisioning_uri = totp.provisioning_uri(
             name=user.email,
@@ -421,9 +575,9 @@ class AuthService:
         """Verify TOTP token for user"""
         if not user.totp_secret:
             return False
-        return self.verify_totp(user.id, token)
+        return pyotp.TOTP(user.totp_secret).verify(token, valid_window=1)
 
     def enable_totp(self, user: User):
         """Enable TOTP for user"""
         user.totp_enabled = True
-        self.db.commit()
+        self.bump_data_version(user)
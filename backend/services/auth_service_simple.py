@@ -5,6 +5,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 import base64
 import json
+import logging
 import pyotp
 import qrcode
 from io import BytesIO
@@ -12,6 +13,8 @@ from io import BytesIO
 from models import User, LoginAttempt, SecurityEvent
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class AuthService:
@@ -142,8 +145,8 @@ class AuthService:
             user.face_encoding = face_encoding
             self.db.commit()
             return True
-        except Exception as e:
-            print(f"Face recognition setup error: {e}")
+        except Exception:
+            logger.exception("face recognition setup failed", extra={"user_id": user_id})
             return False
 
     def verify_face(self, user_id: int, face_image_base64: str) -> bool:
@@ -161,8 +164,8 @@ class AuthService:
             # For demo purposes, we'll do a simple comparison
             # In production, use proper face comparison algorithms
             return current_encoding == user.face_encoding
-        except Exception as e:
-            print(f"Face verification error: {e}")
+        except Exception:
+            logger.exception("face verification error", extra={"user_id": user_id})
             return False
 
     def log_login_attempt(self, username: str, ip_address: str, success: bool, failure_reason: str = None):
@@ -0,0 +1,174 @@
+"""
+Publish/subscribe bus for live attendance events
+Services publish after committing; SSE connections subscribe with filters.
+With several worker processes on one host, events are relayed between them
+over unix datagram sockets.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from config import settings
+
+
+class Subscription:
+    """A single listener with its own bounded queue and filter"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue_size: int,
+                 predicate: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.predicate = predicate
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        return self.predicate is None or self.predicate(event)
+
+    def _deliver(self, event: Dict[str, Any]):
+        # Runs on the subscriber's loop. Slow consumers lose the oldest events
+        # rather than blocking publishers or growing without bound.
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Next event, or None once the bus has been closed"""
+        return await self.queue.get()
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerRelay:
+    """
+    Forwards events to sibling worker processes. Each worker binds a datagram
+    socket named after its pid in a shared directory and sends every local
+    event to all other sockets found there.
+    """
+
+    PEER_REFRESH_SECONDS = 1.0
+
+    def __init__(self, directory: str, deliver: Callable[[Dict[str, Any]], None]):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._deliver = deliver
+        self._peers: List[str] = []
+        self._peers_loaded = 0.0
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._thread = threading.Thread(target=self._receive, name="event-relay", daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except OSError:
+                return  # socket closed
+            self._deliver(json.loads(data))
+
+    def _peer_paths(self) -> List[str]:
+        if time.monotonic() - self._peers_loaded > self.PEER_REFRESH_SECONDS:
+            self._peers = [
+                entry.path for entry in os.scandir(self.directory)
+                if entry.name.endswith(".sock") and entry.path != self.path
+            ]
+            self._peers_loaded = time.monotonic()
+        return self._peers
+
+    def send(self, event: Dict[str, Any]):
+        data = json.dumps(event).encode()
+        for path in self._peer_paths():
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker exited without cleaning up (e.g. SIGKILL)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._peers_loaded = 0.0
+            except BlockingIOError:
+                logger.warning("live event dropped: worker %s is not keeping up", path)
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._socket.close()
+        self._sender.close()
+
+
+class EventBus:
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._relay: Optional[WorkerRelay] = None
+
+    def enable_worker_relay(self, directory: str):
+        """Share events with the other worker processes using ``directory``"""
+        self._relay = WorkerRelay(directory, self._publish_local)
+
+    def subscribe(self, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Subscription:
+        """Register a listener on the running event loop"""
+        subscription = Subscription(asyncio.get_running_loop(), self.max_queue_size, predicate)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, event: Dict[str, Any]):
+        """Fan an event out to matching subscribers; safe to call from any thread"""
+        self._publish_local(event)
+        if self._relay is not None:
+            self._relay.send(event)
+
+    def _publish_local(self, event: Dict[str, Any]):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # Subscriber's loop has been closed
+                self.unsubscribe(subscription)
+
+    def close(self):
+        """End every open subscription (their streams see None) and stop relaying"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self._subscriptions.clear()
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, None)
+            except RuntimeError:
+                pass
+        if self._relay is not None:
+            self._relay.close()
+            self._relay = None
+
+
+attendance_events = EventBus(max_queue_size=settings.LIVE_EVENTS_QUEUE_SIZE)
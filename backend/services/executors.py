@@ -0,0 +1,63 @@
+"""
+Dedicated thread pools for CPU-heavy work (bcrypt, face image processing)
+and background jobs
+Keeps the event loop free and exposes backlog for readiness checks
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+from config import settings
+
+
+class WorkerPool:
+    """ThreadPoolExecutor that tracks queued and running tasks"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn`` on the pool and await its result"""
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        # Carry request-scoped context (e.g. per-request query stats) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(context.run, self._run, fn, *args, **kwargs))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule ``fn`` without waiting for it (background jobs)"""
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._run, fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"workers": self.max_workers, "running": self._running, "queued": self._queued}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+face_pool = WorkerPool("face", settings.FACE_POOL_WORKERS)
+bcrypt_pool = WorkerPool("bcrypt", settings.BCRYPT_POOL_WORKERS)
+job_pool = WorkerPool("jobs", settings.JOB_WORKERS)
@@ -0,0 +1,105 @@
+"""
+Readiness checks used by the load balancer probes
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from sqlalchemy import text
+
+from config import settings
+from database import engine
+from services.executors import face_pool, bcrypt_pool
+from sharding import shard_map
+
+
+def _select_one(bind) -> None:
+    with bind.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def _ping(bind) -> Dict[str, Any]:
+    timeout = settings.READINESS_DB_TIMEOUT_MS / 1000
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_select_one, bind), timeout=timeout)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"SELECT 1 exceeded {settings.READINESS_DB_TIMEOUT_MS} ms"}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+async def check_database() -> Dict[str, Any]:
+    """Timed SELECT 1 on every shard; a locked or unreachable database fails the probe"""
+    shards = shard_map.all()
+    if len(shards) == 1:
+        return await _ping(shards[0].engine)
+    results = await asyncio.gather(*(_ping(shard.engine) for shard in shards))
+    return {
+        "ok": all(result["ok"] for result in results),
+        "shards": {str(shard.number): result for shard, result in zip(shards, results)}
+    }
+
+
+def check_connection_pool() -> Dict[str, Any]:
+    """Fail when every pooled connection (including overflow) is checked out"""
+    pool = engine.pool
+    if not all(hasattr(pool, attr) for attr in ("size", "checkedout", "overflow")):
+        return {"ok": True, "pool": type(pool).__name__}
+
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    checked_out = pool.checkedout()
+    if max_overflow < 0:
+        return {"ok": True, "checked_out": checked_out, "capacity": "unbounded"}
+
+    capacity = pool.size() + max_overflow
+    return {
+        "ok": checked_out < capacity,
+        "checked_out": checked_out,
+        "capacity": capacity
+    }
+
+
+def check_executors() -> Dict[str, Any]:
+    """Fail when face or bcrypt work is queueing faster than the pools drain it"""
+    pools = {pool.name: pool.stats() for pool in (face_pool, bcrypt_pool)}
+    return {
+        "ok": all(stats["queued"] <= settings.READINESS_MAX_EXECUTOR_BACKLOG for stats in pools.values()),
+        "max_backlog": settings.READINESS_MAX_EXECUTOR_BACKLOG,
+        **pools
+    }
+
+
+def check_disk() -> Dict[str, Any]:
+    """Free space on the volume holding the SQLite database file"""
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return {"ok": True, "skipped": "not a file-backed database"}
+
+    directory = os.path.dirname(os.path.abspath(url.database))
+    free_mb = shutil.disk_usage(directory).free / (1024 * 1024)
+    return {
+        "ok": free_mb >= settings.READINESS_MIN_FREE_DISK_MB,
+        "free_mb": round(free_mb, 1),
+        "min_free_mb": settings.READINESS_MIN_FREE_DISK_MB
+    }
+
+
+async def readiness() -> Dict[str, Any]:
+    """Run every check; the instance is ready only if all pass"""
+    checks = {
+        "database": await check_database(),
+        "connection_pool": check_connection_pool(),
+        "executors": check_executors(),
+        "disk": check_disk()
+    }
+    return {
+        "status": "ready" if all(check["ok"] for check in checks.values()) else "not_ready",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "checks": checks
+    }
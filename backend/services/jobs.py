@@ -0,0 +1,311 @@
+"""
+In-process background jobs
+Long maintenance work is submitted as a ``jobs`` row and run on the job
+worker pool instead of inside the HTTP request, so it never hits proxy
+timeouts. A job reports progress and checks for cancellation between units
+of work; both go through the database, so any worker process can show a
+job's status or cancel it. Timestamps are naive UTC.
+"""
+
+import inspect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from metrics import background_job_duration, background_jobs
+from models import Job
+from services.executors import WorkerPool, job_pool
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed", "cancelled")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested"""
+
+
+@dataclass(frozen=True)
+class JobKind:
+    name: str
+    fn: Callable[..., Optional[Dict[str, Any]]]
+    exclusive: bool  # at most one queued or running job of this kind
+
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def job_kind(name: str, exclusive: bool = True):
+    """
+    Register ``fn(db, job, **params)`` as a job kind. It runs with its own
+    session, should commit as it goes and returns a JSON-serializable result.
+    """
+    def register(fn):
+        JOB_KINDS[name] = JobKind(name, fn, exclusive)
+        return fn
+    return register
+
+
+def validate_params(kind: str, params: Dict[str, Any]):
+    """Raises KeyError for an unknown kind and TypeError for parameters it does not take"""
+    inspect.signature(JOB_KINDS[kind].fn).bind(None, None, **params)
+
+
+def job_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": json.loads(job.params) if job.params else {},
+        "progress": round(job.progress or 0.0, 4),
+        "message": job.message,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_by": job.created_by,
+        "worker": job.worker,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobContext:
+    """Handed to a running job for progress reports and cancellation checks"""
+
+    def __init__(self, job_id: str, cancel_event: threading.Event,
+                 session_factory: Callable[[], Session] = SessionLocal):
+        self.id = job_id
+        self._cancel = cancel_event
+        self._session_factory = session_factory
+        self._last_sync = 0.0
+
+    def _sync(self, values: Dict[str, Any]):
+        """Write ``values`` (plus a heartbeat) and pick up a cancel request, in one short transaction"""
+        db = self._session_factory()
+        try:
+            cancel_requested = db.execute(
+                update(Job).where(Job.id == self.id)
+                .values(heartbeat_at=datetime.utcnow(), **values)
+                .returning(Job.cancel_requested)
+            ).scalar()
+            db.commit()
+        finally:
+            db.close()
+        self._last_sync = time.monotonic()
+        if cancel_requested:
+            self._cancel.set()
+
+    def progress(self, done: float, total: float, message: Optional[str] = None, force: bool = False):
+        """Record ``done`` out of ``total``; written at most every JOB_PROGRESS_INTERVAL_SECONDS"""
+        if force or time.monotonic() - self._last_sync >= settings.JOB_PROGRESS_INTERVAL_SECONDS:
+            values = {"progress": min(1.0, done / total) if total else 0.0}
+            if message is not None:
+                values["message"] = message
+            self._sync(values)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if an admin (in any worker process) cancelled this job"""
+        if not self._cancel.is_set() and time.monotonic() - self._last_sync >= settings.JOB_PROGRESS_INTERVAL_SECONDS:
+            self._sync({})
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    Runs submitted jobs on a worker pool. Jobs run in the process that
+    accepted them; their rows are heartbeated while queued or running, and
+    a row not heard from for three heartbeats belonged to a process that died
+    and is marked failed by whichever worker notices first.
+    """
+
+    def __init__(self, pool: WorkerPool = job_pool, session_factory: Callable[[], Session] = SessionLocal):
+        self.pool = pool
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._active: Dict[str, threading.Event] = {}  # local job id -> cancel flag
+        self._closing = False
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None,
+               created_by: Optional[int] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job; returns (job, created). For an exclusive kind that is
+        already queued or running, the existing job is returned instead. The
+        jobs table's unique index on active exclusive kinds settles races
+        between worker processes (e.g. every worker scheduling the same
+        periodic job at startup). Blocking: call it from a thread.
+        """
+        job_type = JOB_KINDS[kind]
+        params = params or {}
+        validate_params(kind, params)
+        db = self._session_factory()
+        try:
+            while True:
+                if job_type.exclusive:
+                    existing = db.query(Job).filter(Job.kind == kind, Job.status.in_(ACTIVE)).first()
+                    if existing is not None:
+                        return job_dict(existing), False
+                now = datetime.utcnow()
+                job = Job(id=uuid.uuid4().hex, kind=kind, status="queued", params=json.dumps(params, default=str),
+                          progress=0.0, cancel_requested=False, created_by=created_by, worker=WORKER_ID,
+                          created_at=now, heartbeat_at=now, exclusive=job_type.exclusive)
+                db.add(job)
+                try:
+                    db.commit()
+                    break
+                except IntegrityError:
+                    # Another process queued this kind since the check; report its job
+                    db.rollback()
+                    if not job_type.exclusive:
+                        raise
+            with self._lock:
+                self._active[job.id] = threading.Event()
+            self.pool.submit(self._execute, job.id)
+            logger.info("job queued", extra={"job_id": job.id, "kind": kind})
+            return job_dict(job), True
+        finally:
+            db.close()
+
+    def cancel(self, db: Session, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued job at once, or ask a running one to stop at its
+        next check. Returns the job, or None if there is no such job.
+        """
+        now = datetime.utcnow()
+        db.execute(
+            update(Job).where(Job.id == job_id, Job.status == "queued")
+            .values(status="cancelled", cancel_requested=True, finished_at=now, message="cancelled before it started")
+        )
+        db.execute(update(Job).where(Job.id == job_id, Job.status == "running").values(cancel_requested=True))
+        db.commit()
+        with self._lock:
+            event = self._active.get(job_id)
+        if event is not None:
+            event.set()
+        return db.get(Job, job_id, populate_existing=True)
+
+    def _finish(self, db: Session, job_id: str, status: str, **values):
+        db.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status=status, finished_at=datetime.utcnow(), heartbeat_at=datetime.utcnow(), **values)
+        )
+        db.commit()
+
+    def _execute(self, job_id: str):
+        with self._lock:
+            cancel_event = self._active.get(job_id) or threading.Event()
+        db = self._session_factory()
+        try:
+            if self._closing:
+                self._finish(db, job_id, "cancelled", message="server shut down before it started")
+                return
+            now = datetime.utcnow()
+            claimed = db.execute(
+                update(Job).where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", started_at=now, heartbeat_at=now, worker=WORKER_ID)
+            ).rowcount
+            db.commit()
+            if not claimed:  # cancelled while queued
+                return
+
+            job = db.get(Job, job_id)
+            kind, params = job.kind, json.loads(job.params or "{}")
+            started = time.perf_counter()
+            try:
+                result = JOB_KINDS[kind].fn(db, JobContext(job_id, cancel_event, self._session_factory), **params)
+            except JobCancelled:
+                db.rollback()
+                status = "cancelled"
+                self._finish(db, job_id, status, message="cancelled")
+            except Exception as e:
+                db.rollback()
+                status = "failed"
+                logger.exception("job failed", extra={"job_id": job_id, "kind": kind})
+                self._finish(db, job_id, status, error=f"{type(e).__name__}: {e}")
+            else:
+                status = "succeeded"
+                self._finish(db, job_id, status, progress=1.0,
+                             result=json.dumps(result, default=str) if result is not None else None)
+            elapsed = time.perf_counter() - started
+            background_jobs.labels(kind, status).inc()
+            background_job_duration.labels(kind).observe(elapsed)
+            logger.info("job finished", extra={
+                "job_id": job_id, "kind": kind, "status": status, "duration_ms": round(elapsed * 1000, 1)
+            })
+        except Exception:
+            logger.exception("job bookkeeping failed", extra={"job_id": job_id})
+        finally:
+            db.close()
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    def maintain(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Heartbeat this process's jobs, fail jobs whose process stopped
+        heartbeating and delete finished jobs past retention
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            local = list(self._active)
+        db = self._session_factory()
+        try:
+            if local:
+                db.execute(update(Job).where(Job.id.in_(local), Job.status.in_(ACTIVE)).values(heartbeat_at=now))
+            lost = db.execute(
+                update(Job).where(
+                    Job.status.in_(ACTIVE),
+                    Job.heartbeat_at < now - timedelta(seconds=3 * settings.JOB_HEARTBEAT_SECONDS)
+                ).values(status="failed", finished_at=now, error="worker process stopped before the job finished")
+            ).rowcount
+            pruned = db.execute(
+                delete(Job).where(Job.status.in_(FINISHED),
+                                  Job.finished_at < now - timedelta(days=settings.JOB_RETENTION_DAYS))
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if lost or pruned:
+            logger.info("job maintenance", extra={"lost": lost, "pruned": pruned})
+        return {"lost": lost, "pruned": pruned}
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self):
+        """Ask running jobs to stop at their next check and wait for them"""
+        self._closing = True
+        with self._lock:
+            events = list(self._active.values())
+        for event in events:
+            event.set()
+        self.pool.shutdown(wait=True)
+
+
+job_runner = JobRunner()
+
+
+def list_jobs(db: Session, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50):
+    query = select(Job)
+    if status:
+        query = query.where(Job.status == status)
+    if kind:
+        query = query.where(Job.kind == kind)
+    return db.execute(query.order_by(Job.created_at.desc()).limit(limit)).scalars().all()
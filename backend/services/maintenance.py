@@ -0,0 +1,206 @@
+"""
+Maintenance work run as background jobs
+Storage cleanup, VACUUM, audit log maintenance and partition upkeep. Each
+works in short batches, committing as it goes, so it holds no long locks and
+a cancelled job keeps the batches it already finished. Every kind runs on
+each shard in turn (the job row itself lives on shard 0).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import AttendanceRecord, IdempotencyKey, User
+from partitioning import drop_partitions_before, ensure_partitions, partitioning_enabled
+from services.archive import attendance_archive
+from services.audit import run_audit_maintenance
+from services.jobs import JobContext, job_kind
+from services.presence import presence_table
+from sharding import shard_map, shard_number
+
+
+def bump_data_versions(db: Session, user_ids: set):
+    """Invalidate cached responses of every user whose records were touched"""
+    if user_ids:
+        db.query(User).filter(User.id.in_(user_ids)).update(
+            {User.data_version: User.data_version + 1}, synchronize_session=False
+        )
+
+
+def _vacuum(db: Session) -> str:
+    """VACUUM outside a transaction; on PostgreSQL also refresh planner statistics"""
+    bind = db.get_bind()
+    statement = "VACUUM" if bind.dialect.name == "sqlite" else "VACUUM (ANALYZE)"
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(statement))
+    return statement
+
+
+class _ShardProgress:
+    """A JobContext for one shard's share of a job that visits every shard"""
+
+    def __init__(self, job: JobContext, index: int, count: int):
+        self._job, self._index, self._count = job, index, count
+
+    def progress(self, done: float, total: float, message: Optional[str] = None, force: bool = False):
+        self._job.progress(self._index + (done / total if total else 0.0), self._count, message, force)
+
+    def check_cancelled(self):
+        self._job.check_cancelled()
+
+
+def _combine(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One result from per-shard results: numbers add up, lists concatenate"""
+    if len(results) == 1:
+        return results[0]
+    combined = {}
+    for key, first in results[0].items():
+        values = [result[key] for result in results]
+        if isinstance(first, (int, float)) and not isinstance(first, bool):
+            combined[key] = sum(values)
+        elif isinstance(first, list):
+            combined[key] = [item for value in values for item in value]
+        else:
+            combined[key] = first if all(value == first for value in values) else values
+    return combined
+
+
+def _on_every_shard(job: JobContext, fn: Callable[[Session, JobContext], Dict[str, Any]]) -> Dict[str, Any]:
+    """``fn(db, job)`` on each shard in turn, with progress spread over the shards"""
+    shards = shard_map.all()
+    results = []
+    for index, shard in enumerate(shards):
+        job.check_cancelled()
+        db = shard.session()
+        try:
+            results.append(fn(db, _ShardProgress(job, index, len(shards)) if len(shards) > 1 else job))
+        finally:
+            db.close()
+    return _combine(results)
+
+
+@job_kind("storage_cleanup")
+def cleanup_storage(db: Session, job: JobContext, days_to_keep: int = 90, delete_records: bool = False,
+                    user_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Delete attendance records older than ``days_to_keep`` days, or only
+    remove their face images, in the database and the archive. Whole months
+    of a partitioned table are dropped with their partition; the rest goes
+    in batches.
+    """
+    cutoff = datetime.now() - timedelta(days=days_to_keep)
+    return _on_every_shard(job, lambda shard_db, shard_job: _cleanup(shard_db, shard_job, cutoff, delete_records, user_id))
+
+
+@job_kind("delete_all_images")
+def delete_all_images(db: Session, job: JobContext) -> Dict[str, Any]:
+    """Remove every stored face image, archived ones included, keeping the attendance records"""
+    return _on_every_shard(job, lambda shard_db, shard_job: _cleanup(shard_db, shard_job, None, delete_records=False))
+
+
+def _cleanup(db: Session, job: JobContext, cutoff: Optional[datetime], delete_records: bool,
+             user_id: Optional[int] = None) -> Dict[str, Any]:
+    table = AttendanceRecord.__table__
+    conditions = [table.c.check_in_time < cutoff] if cutoff is not None else []
+    if user_id:
+        conditions.append(table.c.user_id == user_id)
+    if not delete_records:
+        conditions.append(table.c.face_image.isnot(None))
+
+    dropped = {"partitions": [], "records": 0, "bytes": 0, "user_ids": set()}
+    if delete_records and cutoff is not None and not user_id and partitioning_enabled(db.get_bind()):
+        job.progress(0, 1, "dropping old partitions", force=True)
+        dropped = drop_partitions_before(db.connection(), cutoff)
+        bump_data_versions(db, dropped["user_ids"])
+        db.commit()
+
+    ids = db.execute(select(table.c.id).where(*conditions).order_by(table.c.id)).scalars().all()
+    processed, freed = dropped["records"], dropped["bytes"]
+    batch_size = settings.STORAGE_CLEANUP_BATCH_SIZE
+    for i in range(0, len(ids), batch_size):
+        job.check_cancelled()
+        batch = ids[i:i + batch_size]
+        touched = db.execute(
+            select(table.c.user_id, func.coalesce(func.length(table.c.face_image), 0))
+            .where(table.c.id.in_(batch), *conditions)
+        ).all()
+        if delete_records:
+            db.execute(delete(table).where(table.c.id.in_(batch), *conditions))
+        else:
+            db.execute(update(table).where(table.c.id.in_(batch), *conditions).values(face_image=None))
+        bump_data_versions(db, {user for user, _ in touched})
+        db.commit()
+        processed += len(touched)
+        freed += sum(size for _, size in touched)
+        job.progress(i + len(batch), len(ids), f"{processed} records processed")
+
+    # Archived months hold records (and images) too; their files are rewritten
+    job.progress(len(ids), len(ids), "cleaning the archive", force=True)
+    archived = attendance_archive.purge(cutoff, user_id or None, delete_records, shard_number(db))
+    if archived["records"]:
+        bump_data_versions(db, archived["user_ids"])
+        db.commit()
+    processed += archived["records"]
+    freed += archived["bytes"]
+
+    if delete_records:
+        presence_table.invalidate()
+        # Reclaim the freed pages (SQLite keeps them in the file otherwise)
+        if processed and db.get_bind().dialect.name == "sqlite":
+            job.progress(len(ids), len(ids), "vacuuming", force=True)
+            _vacuum(db)
+
+    return {
+        "records_processed": processed,
+        "archived_records_processed": archived["records"],
+        "partitions_dropped": dropped["partitions"],
+        "space_freed_mb": freed / (1024 * 1024),
+        "action": "deleted_records" if delete_records else "removed_images"
+    }
+
+
+@job_kind("vacuum")
+def vacuum(db: Session, job: JobContext) -> Dict[str, Any]:
+    """Compact the database file (SQLite) or vacuum and analyze every table (PostgreSQL)"""
+    def vacuum_shard(shard_db: Session, shard_job: JobContext) -> Dict[str, Any]:
+        shard_job.progress(0, 1, "vacuuming", force=True)
+        return {"statement": _vacuum(shard_db)}
+    return _on_every_shard(job, vacuum_shard)
+
+
+@job_kind("audit_maintenance")
+def audit_maintenance(db: Session, job: JobContext) -> Dict[str, int]:
+    """Roll up and prune login attempts and security events"""
+    return _on_every_shard(job, lambda shard_db, shard_job: run_audit_maintenance(shard_db))
+
+
+@job_kind("ensure_partitions")
+def create_partitions(db: Session, job: JobContext) -> Dict[str, Any]:
+    """Create upcoming monthly partitions of attendance_records"""
+    def partition_shard(shard_db: Session, shard_job: JobContext) -> Dict[str, Any]:
+        bind = shard_db.get_bind()
+        return {"created": ensure_partitions(bind) if partitioning_enabled(bind) else []}
+    return _on_every_shard(job, partition_shard)
+
+
+@job_kind("prune_idempotency_keys")
+def prune_idempotency_keys(db: Session, job: JobContext) -> Dict[str, int]:
+    """Delete bulk-ingestion idempotency keys older than IDEMPOTENCY_KEY_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.IDEMPOTENCY_KEY_RETENTION_DAYS)
+
+    def prune_shard(shard_db: Session, shard_job: JobContext) -> Dict[str, int]:
+        pruned = 0
+        while True:
+            shard_job.check_cancelled()
+            ids = shard_db.execute(
+                select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff)
+                .limit(settings.STORAGE_CLEANUP_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                return {"pruned": pruned}
+            pruned += shard_db.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids))).rowcount
+            shard_db.commit()
+    return _on_every_shard(job, prune_shard)
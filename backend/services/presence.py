@@ -0,0 +1,173 @@
+"""
+In-memory table of today's attendance, keyed by user id
+Answers "is this user checked in today?" without querying attendance_records
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import AttendanceRecord, User
+from sharding import shard_map
+
+
+@dataclass
+class PresenceEntry:
+    attendance_id: int
+    check_in_time: datetime
+    check_out_time: Optional[datetime] = None
+    work_duration: Optional[float] = None
+
+    @property
+    def checked_out(self) -> bool:
+        return self.check_out_time is not None
+
+
+class PresenceTable:
+    """
+    Latest attendance record of the current day for every user.
+
+    The table is rebuilt from the database at startup and whenever the
+    local date changes, and kept current by AttendanceService after each
+    committed check-in/check-out. Every attendance write also bumps
+    ``users.data_version``, so an entry is only trusted while the version it
+    was loaded at matches the caller's freshly loaded user; writes made by
+    other worker processes are picked up with one indexed query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._entries: Dict[int, PresenceEntry] = {}
+        self._versions: Dict[int, int] = {}
+
+    @staticmethod
+    def _load(db: Session, day: date):
+        rows = db.query(
+            AttendanceRecord.id,
+            AttendanceRecord.user_id,
+            AttendanceRecord.check_in_time,
+            AttendanceRecord.check_out_time,
+            AttendanceRecord.work_duration
+        ).filter(
+            AttendanceRecord.check_in_time >= datetime.combine(day, datetime.min.time()),
+            AttendanceRecord.check_in_time <= datetime.combine(day, datetime.max.time())
+        ).order_by(AttendanceRecord.check_in_time, AttendanceRecord.id).all()
+
+        # Read after the records, so a concurrent write leaves a newer version
+        # behind and the affected user is refreshed on next access
+        return rows, db.query(User.id, User.data_version).all()
+
+    def rebuild(self, db: Optional[Session] = None, day: Optional[date] = None):
+        """
+        Reload the table for the given day (default: today) from ``db``, or
+        from every shard in parallel when no session is given. Users of
+        shards left out have no loaded version and are refreshed on access.
+        """
+        day = day or datetime.now().date()
+        if db is not None:
+            loaded = [self._load(db, day)]
+        else:
+            loaded = shard_map.fan_out(lambda shard_db: self._load(shard_db, day))
+        entries, versions = {}, {}
+        for rows, shard_versions in loaded:
+            for row in rows:
+                # Later records of the same day replace earlier ones
+                entries[row.user_id] = self._entry(row)
+            versions.update(shard_versions)
+
+        with self._lock:
+            self._day = day
+            self._entries = entries
+            self._versions = versions
+
+    def _entry(self, row) -> PresenceEntry:
+        return PresenceEntry(
+            attendance_id=row.id,
+            check_in_time=row.check_in_time,
+            check_out_time=row.check_out_time,
+            work_duration=row.work_duration
+        )
+
+    def refresh_user(self, db: Session, user: User):
+        """Reload one user's entry for the current day"""
+        day = self._day or datetime.now().date()
+        version = user.data_version
+        row = db.query(
+            AttendanceRecord.id,
+            AttendanceRecord.check_in_time,
+            AttendanceRecord.check_out_time,
+            AttendanceRecord.work_duration
+        ).filter(
+            AttendanceRecord.user_id == user.id,
+            AttendanceRecord.check_in_time >= datetime.combine(day, datetime.min.time()),
+            AttendanceRecord.check_in_time <= datetime.combine(day, datetime.max.time())
+        ).order_by(AttendanceRecord.check_in_time.desc(), AttendanceRecord.id.desc()).first()
+
+        with self._lock:
+            if row is None:
+                self._entries.pop(user.id, None)
+            else:
+                self._entries[user.id] = self._entry(row)
+            self._versions[user.id] = version
+
+    def invalidate(self):
+        """Force a rebuild on next access (e.g. after bulk deletes)"""
+        with self._lock:
+            self._day = None
+            self._entries = {}
+            self._versions = {}
+
+    def get(self, db: Session, user: User) -> Optional[PresenceEntry]:
+        """
+        Today's entry for a user, rebuilding first if the day rolled over and
+        refreshing it if the user's data changed since it was loaded
+        """
+        if self._day != datetime.now().date():
+            self.rebuild(db)
+        if self._versions.get(user.id) != user.data_version:
+            self.refresh_user(db, user)
+        return self._entries.get(user.id)
+
+    def _advance_version(self, user_id: int, versions: Optional[Tuple[int, int]]):
+        """
+        The write bumped data_version. If it moved from the version this
+        entry was loaded at straight to the committed one, nobody else wrote
+        in between and the entry stays trusted; otherwise confirm against the
+        database on next access.
+        """
+        if versions is not None and self._versions.get(user_id) == versions[0] and versions[1] == versions[0] + 1:
+            self._versions[user_id] = versions[1]
+        else:
+            self._versions.pop(user_id, None)
+
+    def record_check_in(self, user_id: int, attendance_id: int, check_in_time: datetime,
+                        versions: Optional[Tuple[int, int]] = None):
+        """``versions`` is the user's (loaded, committed) data_version around the write, if known"""
+        with self._lock:
+            if self._day != check_in_time.date():
+                return
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.check_in_time > check_in_time:
+                # A replayed earlier check-in must not hide the latest record
+                self._versions.pop(user_id, None)
+                return
+            self._entries[user_id] = PresenceEntry(attendance_id=attendance_id, check_in_time=check_in_time)
+            self._advance_version(user_id, versions)
+
+    def record_check_out(self, user_id: int, attendance_id: int, check_out_time: datetime,
+                         work_duration: Optional[float], versions: Optional[Tuple[int, int]] = None):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.attendance_id != attendance_id:
+                self._versions.pop(user_id, None)
+                return
+            entry.check_out_time = check_out_time
+            entry.work_duration = work_duration
+            self._advance_version(user_id, versions)
+
+
+presence_table = PresenceTable()
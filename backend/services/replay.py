@@ -0,0 +1,173 @@
+"""
+Near-duplicate index of check-in photos
+A replayed photo still matches the enrolled face, so every check-in image is
+also compared with the same user's recent check-ins. Images are reduced to a
+256-bit difference hash split into bands; a lookup probes each band and every
+one-bit variant of it instead of comparing against stored images.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import AttendanceRecord, User
+from services.archive import naive
+
+HASH_BITS = 256
+BANDS = 8
+BAND_BITS = HASH_BITS // BANDS
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+# Probing one-bit variants of every band finds any hash that differs from the
+# query in fewer than 2 * BANDS bits: at least one band then differs in at most one
+MAX_DETECTABLE_DISTANCE = 2 * BANDS - 1
+
+
+def image_fingerprint(image) -> int:
+    """
+    Difference hash of a grayscale PIL image: 16 rows of 16 "brighter than
+    the next pixel" bits. Survives re-encoding and rescaling of the same photo
+    but, unlike the 64-bit hash used for face matching, separates two fresh
+    captures of the same face.
+    """
+    from PIL import Image
+
+    pixels = list(image.resize((17, 16), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(16):
+        offset = row * 17
+        for col in range(16):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def to_hex(fingerprint: int) -> str:
+    return f"{fingerprint:0{HASH_BITS // 4}x}"
+
+
+def _bands(fingerprint: int) -> List[int]:
+    return [(fingerprint >> (band * BAND_BITS)) & _BAND_MASK for band in range(BANDS)]
+
+
+@dataclass
+class _UserHashes:
+    version: Optional[int]
+    fingerprints: Dict[int, Tuple[int, datetime]] = field(default_factory=dict)  # attendance id -> (hash, check-in)
+    bands: List[Dict[int, List[int]]] = field(default_factory=lambda: [{} for _ in range(BANDS)])
+
+    def add(self, attendance_id: int, fingerprint: int, check_in_time: datetime):
+        self.fingerprints[attendance_id] = (fingerprint, check_in_time)
+        for band, value in enumerate(_bands(fingerprint)):
+            self.bands[band].setdefault(value, []).append(attendance_id)
+
+    def candidates(self, fingerprint: int) -> set:
+        found = set()
+        for band, value in enumerate(_bands(fingerprint)):
+            table = self.bands[band]
+            if not table:
+                continue
+            found.update(table.get(value, ()))
+            for bit in range(BAND_BITS):
+                found.update(table.get(value ^ (1 << bit), ()))
+        return found
+
+
+@dataclass
+class ReplayMatch:
+    attendance_id: int
+    distance: int
+    check_in_time: datetime
+
+
+class ReplayIndex:
+    """
+    Recent check-in fingerprints per user, banded for multi-probe lookups.
+
+    Like the presence table, a user's entry is trusted only while the
+    ``users.data_version`` it was loaded at matches the caller's user, so
+    check-ins handled by other worker processes are picked up with one
+    indexed query. Only the most recently used ``max_users`` are kept.
+    """
+
+    def __init__(self, window_days: int, max_distance: int, max_users: int):
+        self.window = timedelta(days=window_days)
+        self.max_distance = min(max_distance, MAX_DETECTABLE_DISTANCE)
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[int, _UserHashes]" = OrderedDict()
+
+    def _load(self, db: Session, user: User, now: datetime) -> _UserHashes:
+        version = user.data_version
+        rows = db.query(
+            AttendanceRecord.id, AttendanceRecord.image_hash, AttendanceRecord.check_in_time
+        ).filter(
+            AttendanceRecord.user_id == user.id,
+            AttendanceRecord.check_in_time >= now - self.window,
+            AttendanceRecord.image_hash.isnot(None)
+        ).all()
+        hashes = _UserHashes(version)
+        for attendance_id, image_hash, check_in_time in rows:
+            hashes.add(attendance_id, int(image_hash, 16), check_in_time)
+        return hashes
+
+    def _get(self, db: Session, user: User, now: datetime) -> _UserHashes:
+        with self._lock:
+            hashes = self._users.get(user.id)
+            if hashes is not None and hashes.version == user.data_version:
+                self._users.move_to_end(user.id)
+                return hashes
+        hashes = self._load(db, user, now)
+        with self._lock:
+            self._users[user.id] = hashes
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return hashes
+
+    def find(self, db: Session, user: User, fingerprint: int,
+             now: Optional[datetime] = None) -> Optional[ReplayMatch]:
+        """Closest earlier check-in of ``user`` within the window and distance threshold, if any"""
+        now = now or datetime.now()
+        hashes = self._get(db, user, now)
+        best = None
+        with self._lock:
+            for attendance_id in hashes.candidates(fingerprint):
+                earlier, check_in_time = hashes.fingerprints[attendance_id]
+                if naive(check_in_time) < now - self.window:
+                    continue
+                distance = bin(earlier ^ fingerprint).count("1")
+                if distance <= self.max_distance and (best is None or distance < best.distance):
+                    best = ReplayMatch(attendance_id, distance, check_in_time)
+        return best
+
+    def record(self, user_id: int, attendance_id: int, fingerprint: int, check_in_time: datetime,
+               loaded_version: int, committed_version: int):
+        """
+        Add a committed check-in. The entry stays valid only if this commit
+        was the user's sole write since it was loaded.
+        """
+        with self._lock:
+            hashes = self._users.get(user_id)
+            if hashes is None:
+                return
+            if hashes.version != loaded_version or committed_version != loaded_version + 1:
+                del self._users[user_id]
+                return
+            hashes.add(attendance_id, fingerprint, check_in_time)
+            hashes.version = committed_version
+
+    def invalidate(self):
+        with self._lock:
+            self._users.clear()
+
+
+replay_index = ReplayIndex(
+    window_days=settings.REPLAY_WINDOW_DAYS,
+    max_distance=settings.REPLAY_MAX_DISTANCE,
+    max_users=settings.REPLAY_INDEX_MAX_USERS,
+)
@@ -0,0 +1,218 @@
+"""
+Multi-site sharding
+Every user and attendance record belongs to a site, and every site lives in
+one shard (database). SHARD_DATABASE_URLS names the extra shards and
+SITE_SHARDS assigns sites to them; shard 0 is DATABASE_URL and holds every
+other site plus the tables that are not per site (jobs). Requests are routed
+by the site claim of their access token; admin reports fan out to all
+shards in parallel.
+
+User ids are handed out from a separate block per shard, so an id is unique
+across shards and everything keyed by user id (presence table, replay index,
+live events, ETags) works unchanged.
+"""
+
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, func, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import settings
+from database import SessionLocal, _connect_args, engine
+from metrics import instrument_sessions
+from models import User
+from query_stats import instrument_engine
+
+T = TypeVar("T")
+
+# Shard n assigns user ids n * USER_ID_BLOCK + 1 upwards; 32-bit ids leave room for shards 0-20
+USER_ID_BLOCK = 100_000_000
+MAX_SHARD = 20
+USER_ID_ATTEMPTS = 5
+SITE_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{0,49}$")
+
+
+def _pairs(value: str, separator: str) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = {}
+    for item in value.split(separator):
+        if item.strip():
+            key, _, val = item.partition("=")
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+@dataclass
+class Shard:
+    number: int
+    engine: Engine
+    session_factory: sessionmaker
+
+    def session(self) -> Session:
+        return self.session_factory()
+
+
+def shard_number(db: Session) -> int:
+    """The shard a session belongs to (sessions of the default SessionLocal are shard 0)"""
+    return db.info.get("shard", 0)
+
+
+class ShardMap:
+    """Shards by number and the shard of each site"""
+
+    def __init__(self, shards: Dict[int, Shard], sites: Dict[str, int]):
+        self.shards = shards
+        self.sites = sites
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_settings(cls) -> "ShardMap":
+        shards = {0: Shard(0, engine, SessionLocal)}
+        for number, url in _pairs(settings.SHARD_DATABASE_URLS, ";").items():
+            number = int(number)
+            if not 0 < number <= MAX_SHARD:
+                raise ValueError(f"shard numbers must be between 1 and {MAX_SHARD}, got {number}")
+            shard_engine = create_engine(url, connect_args=_connect_args(url))
+            instrument_engine(shard_engine)
+            factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                   bind=shard_engine, info={"shard": number})
+            instrument_sessions(factory)
+            shards[number] = Shard(number, shard_engine, factory)
+        sites = {site: int(number) for site, number in _pairs(settings.SITE_SHARDS, ",").items()}
+        unknown = set(sites.values()) - set(shards)
+        if unknown:
+            raise ValueError(f"SITE_SHARDS refers to shards without a URL: {sorted(unknown)}")
+        return cls(shards, sites)
+
+    def all(self) -> List[Shard]:
+        return [self.shards[number] for number in sorted(self.shards)]
+
+    def for_site(self, site: Optional[str]) -> Shard:
+        return self.shards[self.sites.get(site or settings.DEFAULT_SITE, 0)]
+
+    def session(self, site: Optional[str]) -> Session:
+        return self.for_site(site).session()
+
+    def fan_out(self, fn: Callable[[Session], T]) -> List[T]:
+        """``fn(session)`` on every shard, in parallel; results in shard order"""
+        def run(shard: Shard) -> T:
+            db = shard.session()
+            try:
+                return fn(db)
+            finally:
+                db.close()
+
+        shards = self.all()
+        if len(shards) == 1:
+            return [run(shards[0])]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=2 * len(shards), thread_name_prefix="shard-fan-out")
+        return list(self._pool.map(run, shards))
+
+    def site_of_username(self, username: Optional[str]) -> Optional[str]:
+        """Site of the user with this username, looked up on every shard (None if only one shard)"""
+        if len(self.shards) == 1 or not username:
+            return None
+        sites = self.fan_out(lambda db: db.query(User.site).filter(User.username == username).scalar())
+        return next((site for site in sites if site), None)
+
+    def registered(self, username: str, email: str) -> Tuple[bool, bool]:
+        """Whether the username and the email are taken on any shard"""
+        def taken(db: Session) -> Tuple[bool, bool]:
+            rows = db.query(User.username, User.email).filter(
+                or_(User.username == username, User.email == email)
+            ).all()
+            return any(row.username == username for row in rows), any(row.email == email for row in rows)
+
+        results = self.fan_out(taken)
+        return any(u for u, _ in results), any(e for _, e in results)
+
+
+shard_map = ShardMap.from_settings()
+
+
+def next_user_id(db: Session) -> Optional[int]:
+    """
+    Id for a new user: the next one in the shard's block, or None on shard 0,
+    which keeps autoincrementing as before
+    """
+    number = shard_number(db)
+    if not number:
+        return None
+    floor = number * USER_ID_BLOCK
+    current = db.query(func.max(User.id)).filter(User.id > floor, User.id <= floor + USER_ID_BLOCK).scalar()
+    return (current or floor) + 1
+
+
+def add_user(db: Session, user: User) -> None:
+    """
+    Add and flush a new user, assigning its id with ``next_user_id``.
+    Concurrent registrations on a shard can read the same highest id; the
+    one that loses the primary key retries with the next id inside a
+    savepoint, so the rest of the caller's transaction is kept. Other
+    integrity errors (username, email) are raised as they are.
+    """
+    for attempt in range(USER_ID_ATTEMPTS):
+        user.id = next_user_id(db)
+        try:
+            with db.begin_nested():
+                db.add(user)
+            return
+        except IntegrityError:
+            if user.id is None or attempt == USER_ID_ATTEMPTS - 1:
+                raise
+            if db.query(User.id).filter(User.id == user.id).first() is None:
+                raise
+
+
+def site_of_token(authorization: Optional[str]) -> Optional[str]:
+    """Site claim of a valid bearer token; anything else routes to the default site"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("site")
+    except JWTError:
+        return None
+
+
+def site_of_refresh_token(token: Optional[str]) -> Optional[str]:
+    """Refresh tokens are issued as "<site>.<random>"; older ones carry no site"""
+    site, dot, _ = (token or "").partition(".")
+    return site if dot else None
+
+
+def get_db(request: Request):
+    """Dependency to get a session on the authenticated user's shard"""
+    db = shard_map.session(site_of_token(request.headers.get("authorization")))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_db_by_body(site_of: Callable[[dict], Optional[str]]):
+    """
+    Dependency factory for requests made without an access token (login,
+    registration, refresh): the shard is picked from the JSON body
+    """
+    async def dependency(request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        site = await asyncio.to_thread(site_of, body) if isinstance(body, dict) else None
+        db = shard_map.session(site)
+        try:
+            yield db
+        finally:
+            db.close()
+    return dependency
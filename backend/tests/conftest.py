@@ -0,0 +1,100 @@
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Tests import the backend's top-level modules (models, services, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at throwaway storage before config is first imported
+_data_dir = tempfile.mkdtemp(prefix="mfa-attendance-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_data_dir, 'app.db')}",
+    "ARCHIVE_DIR": os.path.join(_data_dir, "archive"),
+    "PROFILE_DIR": os.path.join(_data_dir, "profiles"),
+    "FACE_ENCODINGS_PATH": os.path.join(_data_dir, "face_encodings"),
+    "LOG_LEVEL": "WARNING",
+})
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The FastAPI app on a freshly migrated database"""
+    from migrate import migrate
+    from sharding import shard_map
+
+    for shard in shard_map.all():
+        migrate(shard.engine)
+    from main import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def _session_client(app):
+    from fastapi.testclient import TestClient
+
+    # One lifespan for the whole run: startup rebuilds caches, shutdown stops the pools
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def client(_session_client):
+    """Test client with empty rate-limit buckets"""
+    from rate_limit import limiter
+
+    limiter.reset()
+    yield _session_client
+    limiter.reset()
+
+
+@pytest.fixture
+def db(app):
+    """Session on the primary database"""
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def make_user(client, db):
+    """
+    Register and log in a new user; returns ``(user_id, headers)`` with a
+    bearer token. Usernames are unique across the run, so tests can share
+    the database.
+    """
+    from models import User
+
+    def make(admin: bool = False):
+        username = f"user{next(_user_numbers)}"
+        response = client.post("/api/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "Password-123",
+            "full_name": username.title()
+        })
+        assert response.status_code == 200, response.text
+        if admin:
+            db.query(User).filter(User.username == username).update({"is_admin": True})
+            db.commit()
+
+        response = client.post("/api/auth/login", json={"username": username, "password": "Password-123"})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return body["user_id"], {"Authorization": f"Bearer {body['access_token']}"}
+
+    return make
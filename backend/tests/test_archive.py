@@ -0,0 +1,102 @@
+"""
+Reads that reach into the Parquet archive
+Recent-record lists merge archived months with live rows, read only as many
+months as it takes to fill the page, and leave check-in photos out unless
+asked for.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import AttendanceRecord, Base, User
+from partitioning import add_months
+from services import attendance_service
+from services.archive import AttendanceArchive, archive_month
+from services.attendance_service import AttendanceService
+
+
+@pytest.fixture
+def archived_history(tmp_path, monkeypatch):
+    """
+    A user with three records in each of two archived months and two live
+    records in the month after them
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    archive = AttendanceArchive(str(tmp_path / "archive"))
+    monkeypatch.setattr(attendance_service, "attendance_archive", archive)
+
+    this_month = date.today().replace(day=1)
+    months = [add_months(this_month, offset) for offset in (-3, -2, -1)]
+    user = User(username="archived", email="archived@example.com", hashed_password="x", full_name="Archived",
+                is_active=True, created_at=datetime.combine(add_months(this_month, -12), datetime.min.time()))
+    db.add(user)
+    db.flush()
+    for month, days in zip(months, ((3, 4, 5), (3, 4, 5), (3, 4))):
+        for day in days:
+            check_in = datetime.combine(month.replace(day=day), datetime.min.time()) + timedelta(hours=9)
+            db.add(AttendanceRecord(
+                user_id=user.id,
+                check_in_time=check_in,
+                check_out_time=check_in + timedelta(hours=8),
+                work_duration=8.0,
+                location="HQ",
+                face_verified=True,
+                face_image="data:image/png;base64,AAAA"
+            ))
+    db.commit()
+    for month in months[:2]:
+        archive_month(db, month, archive)
+
+    yield db, archive, user, months
+    db.close()
+    engine.dispose()
+
+
+def test_records_merge_live_and_archived_rows(archived_history):
+    db, _, user, months = archived_history
+    assert db.query(AttendanceRecord).count() == 2
+
+    records = AttendanceService(db).get_user_attendance(user, limit=10, include_images=False)
+    assert len(records) == 8
+    times = [record["check_in_time"] for record in records]
+    assert times == sorted(times, reverse=True)
+    assert [record["date"].month for record in records] == (
+        [months[2].month] * 2 + [months[1].month] * 3 + [months[0].month] * 3
+    )
+    assert all("face_image" not in record for record in records)
+
+
+def test_page_reads_only_the_months_it_needs(archived_history, monkeypatch):
+    db, archive, user, months = archived_history
+    read_months = []
+    read = archive._read_months
+
+    def spy(months_to_read, *args, **kwargs):
+        read_months.extend(months_to_read)
+        return read(months_to_read, *args, **kwargs)
+
+    monkeypatch.setattr(archive, "_read_months", spy)
+
+    # The newest archived month alone holds a full page
+    records = AttendanceService(db).get_user_attendance(user, limit=3, include_images=False)
+    assert len(records) == 3
+    assert read_months == [months[1]]
+
+
+def test_full_page_of_live_rows_skips_the_archive(archived_history, monkeypatch):
+    db, archive, user, _ = archived_history
+    monkeypatch.setattr(archive, "_read_months", lambda *args, **kwargs: pytest.fail("archive was read"))
+
+    assert len(AttendanceService(db).get_user_attendance(user, limit=2, include_images=False)) == 2
+
+
+def test_images_are_read_on_request(archived_history):
+    db, _, user, _ = archived_history
+
+    records = AttendanceService(db).get_user_attendance(user, limit=10)
+    assert all(record["face_image"] == "data:image/png;base64,AAAA" for record in records)
@@ -0,0 +1,65 @@
+"""
+Keyset pagination of audit logs across shards
+Every shard pages on (timestamp, id) and the merged page orders ties by shard
+number, so paging through shards whose rows share timestamps and ids visits
+each row exactly once, newest first.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, SecurityEvent
+from services.audit import decode_cursor, encode_cursor, keyset_page, merge_pages
+
+
+@pytest.fixture
+def shards():
+    """Shards 0, 5 and 7, each with events 1-3; events 1 and 2 share one timestamp everywhere"""
+    sessions = {}
+    for number in (0, 5, 7):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        base = datetime(2024, 1, 1, 12, 0)
+        for row_id, timestamp in ((1, base), (2, base), (3, base + timedelta(minutes=number))):
+            db.add(SecurityEvent(id=row_id, event_type="login", description=f"shard {number}", timestamp=timestamp))
+        db.commit()
+        sessions[number] = db
+    yield sessions
+    for db in sessions.values():
+        db.close()
+
+
+def page_through(shards, limit: int):
+    seen, cursor = [], None
+    while True:
+        pages = [
+            (number, *keyset_page(db.query(SecurityEvent), SecurityEvent, limit, cursor, number))
+            for number, db in shards.items()
+        ]
+        items, cursor = merge_pages(pages, limit)
+        assert len(items) <= limit
+        seen += [(item.description, item.id, item.timestamp) for item in items]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 20])
+def test_every_row_is_visited_once(shards, limit):
+    seen = page_through(shards, limit)
+
+    assert len(seen) == 9
+    assert len(set(seen)) == 9
+    keys = [(timestamp, row_id) for _, row_id, timestamp in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 1, 1, 12, 0)
+    assert decode_cursor(encode_cursor(timestamp, 42, 7)) == (timestamp, 42, 7)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42, 0)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
@@ -0,0 +1,55 @@
+"""
+Idempotent bulk ingestion of kiosk events
+Replaying a batch, or repeating a key inside one, applies each event once
+and reports the repeats as duplicates of the original attendance record.
+"""
+
+from datetime import datetime, timedelta
+
+from models import AttendanceRecord
+
+
+def kiosk_batch():
+    day = datetime.combine(datetime.now().date() - timedelta(days=1), datetime.min.time())
+    return {"events": [
+        {"idempotency_key": "kiosk-1-in", "event_type": "check_in",
+         "occurred_at": (day + timedelta(hours=8)).isoformat(), "location": "Lobby"},
+        {"idempotency_key": "kiosk-1-out", "event_type": "check_out",
+         "occurred_at": (day + timedelta(hours=16, minutes=30)).isoformat()},
+    ]}
+
+
+def test_replayed_batch_is_applied_once(client, make_user, db):
+    user_id, headers = make_user()
+
+    first = client.post("/api/attendance/bulk", headers=headers, json=kiosk_batch())
+    assert first.status_code == 200, first.text
+    assert (first.json()["applied"], first.json()["duplicates"]) == (2, 0)
+    attendance_id = first.json()["results"][0]["attendance_id"]
+
+    replay = client.post("/api/attendance/bulk", headers=headers, json=kiosk_batch())
+    assert replay.status_code == 200, replay.text
+    assert (replay.json()["applied"], replay.json()["duplicates"]) == (0, 2)
+    assert {result["attendance_id"] for result in replay.json()["results"]} == {attendance_id}
+
+    records = db.query(AttendanceRecord).filter(AttendanceRecord.user_id == user_id).all()
+    assert len(records) == 1
+    assert records[0].work_duration == 8.5
+
+
+def test_repeated_key_within_a_batch(client, make_user):
+    _, headers = make_user()
+    batch = kiosk_batch()
+    batch["events"][1] = dict(batch["events"][0])
+
+    response = client.post("/api/attendance/bulk", headers=headers, json=batch)
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()["results"]] == ["created", "duplicate"]
+
+
+def test_keys_are_scoped_to_the_user(client, make_user):
+    _, alice = make_user()
+    _, bob = make_user()
+
+    assert client.post("/api/attendance/bulk", headers=alice, json=kiosk_batch()).json()["applied"] == 2
+    assert client.post("/api/attendance/bulk", headers=bob, json=kiosk_batch()).json()["applied"] == 2
@@ -0,0 +1,40 @@
+"""
+Conditional GETs of per-user reads
+The weak ETag follows the user's data version, so an unchanged resource is
+answered with 304 and any attendance write makes the next read a 200.
+"""
+
+
+def test_unchanged_records_are_not_modified(client, make_user):
+    _, headers = make_user()
+
+    first = client.get("/api/attendance/records", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    cached = client.get("/api/attendance/records", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+
+def test_write_changes_the_etag(client, make_user):
+    _, headers = make_user()
+    etag = client.get("/api/attendance/records", headers=headers).headers["etag"]
+
+    response = client.post("/api/attendance/checkin", headers=headers, json={"face_image": "bm90IGFuIGltYWdl"})
+    assert response.status_code == 200, response.text
+
+    fresh = client.get("/api/attendance/records", headers={**headers, "If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+    assert len(fresh.json()) == 1
+
+
+def test_etag_depends_on_the_query(client, make_user):
+    _, headers = make_user()
+    etag = client.get("/api/attendance/records", headers=headers).headers["etag"]
+
+    other = client.get("/api/attendance/records?limit=5", headers={**headers, "If-None-Match": etag})
+    assert other.status_code == 200
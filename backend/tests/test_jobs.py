@@ -0,0 +1,106 @@
+"""
+Exclusive background job kinds
+At most one job of an exclusive kind is queued or running: a second submit
+gets the existing job back, and the jobs table's partial unique index holds
+even for writers that skip that check.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import Job
+from services.executors import WorkerPool
+from services.jobs import JOB_KINDS, JobKind, JobRunner
+
+
+@pytest.fixture
+def runner(app, monkeypatch):
+    """A JobRunner on its own pool; "test_blocking" jobs run until ``release`` is set"""
+    release = threading.Event()
+
+    def blocking(db, job):
+        while not release.wait(0.05):
+            job.check_cancelled()
+        return {"released": True}
+
+    monkeypatch.setitem(JOB_KINDS, "test_blocking", JobKind("test_blocking", blocking, exclusive=True))
+    monkeypatch.setitem(JOB_KINDS, "test_shared", JobKind("test_shared", blocking, exclusive=False))
+    runner = JobRunner(WorkerPool("test-jobs", 4))
+    yield runner, release
+    release.set()
+    runner.shutdown()
+
+
+def wait_for_status(db, job_id: str, status: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.expire_all()
+        if db.get(Job, job_id).status == status:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not reach {status}")
+
+
+def test_exclusive_kind_returns_the_active_job(runner, db):
+    runner, release = runner
+
+    job, created = runner.submit("test_blocking")
+    again, created_again = runner.submit("test_blocking")
+    assert created and not created_again
+    assert again["id"] == job["id"]
+
+    release.set()
+    wait_for_status(db, job["id"], "succeeded")
+    next_job, created = runner.submit("test_blocking")
+    assert created and next_job["id"] != job["id"]
+
+
+def test_shared_kind_queues_every_submit(runner):
+    runner, _ = runner
+
+    first, _ = runner.submit("test_shared")
+    second, created = runner.submit("test_shared")
+    assert created and second["id"] != first["id"]
+
+
+def test_concurrent_submits_create_one_job(runner, db):
+    runner, _ = runner
+    barrier = threading.Barrier(4)
+    results = []
+
+    def submit():
+        barrier.wait(timeout=5)
+        results.append(runner.submit("test_blocking"))
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(results) == 4
+    assert [created for _, created in results].count(True) == 1
+    assert len({job["id"] for job, _ in results}) == 1
+
+
+def test_database_rejects_a_second_active_exclusive_job(runner, db):
+    runner, _ = runner
+    job, _ = runner.submit("test_blocking")
+
+    def row(job_id: str, status: str, exclusive: bool) -> Job:
+        now = datetime.utcnow()
+        return Job(id=job_id, kind="test_blocking", status=status, exclusive=exclusive, created_at=now, heartbeat_at=now)
+
+    db.add(row("duplicate-active-job", "queued", True))
+    with pytest.raises(IntegrityError, match="jobs.kind"):
+        db.commit()
+    db.rollback()
+
+    # Non-exclusive rows and finished rows are not constrained
+    db.add(row("finished-job", "succeeded", True))
+    db.add(row("shared-job", "queued", False))
+    db.commit()
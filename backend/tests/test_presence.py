@@ -0,0 +1,62 @@
+"""
+Today's presence table across a change of date
+An entry belongs to the day it was loaded for; once the local date moves on,
+yesterday's open check-in must not count as being checked in today.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import AttendanceRecord, User
+from services import presence
+from services.presence import PresenceTable
+
+
+class _Clock(datetime):
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def open_check_in_yesterday(make_user, db):
+    user_id, headers = make_user()
+    check_in = datetime.combine(datetime.now().date() - timedelta(days=1), datetime.min.time()) + timedelta(hours=9)
+    db.add(AttendanceRecord(user_id=user_id, check_in_time=check_in, location="HQ", face_verified=False))
+    db.query(User).filter(User.id == user_id).update({"data_version": User.data_version + 1})
+    db.commit()
+    return user_id, headers, check_in
+
+
+def test_entry_expires_when_the_day_rolls_over(open_check_in_yesterday, db, monkeypatch):
+    user_id, _, check_in = open_check_in_yesterday
+    monkeypatch.setattr(presence, "datetime", _Clock)
+    table = PresenceTable()
+    user = db.get(User, user_id)
+
+    _Clock.current = check_in + timedelta(hours=9)
+    entry = table.get(db, user)
+    assert entry is not None and not entry.checked_out
+
+    _Clock.current = datetime.combine(check_in.date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=8)
+    assert table.get(db, user) is None
+
+    # Check-ins of the new day are picked up again
+    record = AttendanceRecord(user_id=user_id, check_in_time=_Clock.current, location="HQ", face_verified=False)
+    db.add(record)
+    user.data_version += 1
+    db.commit()
+    assert table.get(db, user).attendance_id == record.id
+
+
+def test_open_check_in_from_yesterday_allows_checking_in_today(client, open_check_in_yesterday):
+    _, headers, _ = open_check_in_yesterday
+
+    status = client.get("/api/attendance/today-status", headers=headers).json()
+    assert status["checked_in"] is False
+
+    response = client.post("/api/attendance/checkin", headers=headers, json={"face_image": "bm90IGFuIGltYWdl"})
+    assert response.status_code == 200, response.text
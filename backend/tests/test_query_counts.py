@@ -0,0 +1,58 @@
+"""
+Query budgets of the hot endpoints
+The number of SQL statements must not grow with the user's history; a new
+per-row lookup (N+1) fails these tests with the offending statements listed.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import AttendanceRecord
+from query_stats import assert_max_queries
+
+
+@pytest.fixture
+def user_with_history(make_user, db):
+    """A user with a closed check-in on each of the last 30 days"""
+    user_id, headers = make_user()
+    start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    for offset in range(1, 31):
+        check_in = start - timedelta(days=offset)
+        db.add(AttendanceRecord(
+            user_id=user_id,
+            check_in_time=check_in,
+            check_out_time=check_in + timedelta(hours=8),
+            work_duration=8.0,
+            location="HQ",
+            face_verified=False
+        ))
+    db.commit()
+    return headers
+
+
+def test_check_in_queries(client, user_with_history):
+    with assert_max_queries(5):
+        response = client.post("/api/attendance/checkin", headers=user_with_history,
+                               json={"face_image": "bm90IGFuIGltYWdl", "location": "HQ"})
+    assert response.status_code == 200, response.text
+
+
+def test_dashboard_queries(client, user_with_history):
+    # user, today's status, week and month summaries, recent records
+    with assert_max_queries(5):
+        response = client.get("/api/attendance/dashboard", headers=user_with_history)
+    assert response.status_code == 200, response.text
+
+
+def test_records_queries(client, user_with_history):
+    with assert_max_queries(2):
+        response = client.get("/api/attendance/records", headers=user_with_history)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 30
+
+
+def test_server_timing_reports_slowest_statement(client, user_with_history):
+    response = client.get("/api/attendance/records", headers=user_with_history)
+    metrics = {part.strip().split(";")[0] for part in response.headers["server-timing"].split(",")}
+    assert metrics == {"db", "db-slowest", "app"}
@@ -0,0 +1,81 @@
+"""
+Token-bucket admission of bcrypt- and image-heavy routes
+Buckets refill at their steady rate up to the burst; refused requests get 429
+with Retry-After, and a bulk upload pays one face token per event.
+"""
+
+from datetime import datetime, timedelta
+
+from config import settings
+from rate_limit import Rate, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_refills_at_the_configured_rate():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({"login": Rate(per_minute=6, burst=2)}, clock=clock)
+
+    assert limiter.acquire("login", "10.0.0.1") == 0
+    assert limiter.acquire("login", "10.0.0.1") == 0
+    assert limiter.acquire("login", "10.0.0.1") == 10.0
+    # Buckets are per client
+    assert limiter.acquire("login", "10.0.0.2") == 0
+
+    clock.now = 10.0
+    assert limiter.acquire("login", "10.0.0.1") == 0
+
+
+def test_charge_may_leave_the_bucket_in_debt():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({"face": Rate(per_minute=60, burst=5)}, clock=clock)
+
+    assert limiter.acquire("face", "kiosk") == 0
+    limiter.charge("face", "kiosk", 9)
+    assert limiter.acquire("face", "kiosk") == 6.0
+
+    clock.now = 6.0
+    assert limiter.acquire("face", "kiosk") == 0
+
+
+def test_least_recently_used_clients_are_evicted():
+    limiter = TokenBucketLimiter({"login": Rate(per_minute=1, burst=1)}, max_clients=2, clock=FakeClock())
+    for client in ("a", "b", "c"):
+        limiter.acquire("login", client)
+    assert len(limiter) == 2
+    # "a" was evicted and starts again with a full bucket
+    assert limiter.acquire("login", "a") == 0
+
+
+def test_login_is_refused_once_the_burst_is_spent(client):
+    statuses = [
+        client.post("/api/auth/login", json={"username": "nobody", "password": "wrong"}).status_code
+        for _ in range(11)
+    ]
+    assert 429 not in statuses[:10]
+    assert statuses[10] == 429
+
+    refused = client.post("/api/auth/login", json={"username": "nobody", "password": "wrong"})
+    assert refused.status_code == 429
+    assert int(refused.headers["retry-after"]) >= 1
+
+
+def test_bulk_upload_pays_per_event(client, make_user):
+    _, headers = make_user()
+    day = datetime.combine(datetime.now().date() - timedelta(days=2), datetime.min.time())
+    events = [
+        {"idempotency_key": f"burst-{i}", "event_type": "check_in",
+         "occurred_at": (day + timedelta(minutes=i)).isoformat()}
+        for i in range(settings.RATE_LIMIT_FACE_BURST)
+    ]
+
+    # The request takes one token and its other events one each: the whole burst
+    assert client.post("/api/attendance/bulk", headers=headers, json={"events": events}).status_code == 200
+    response = client.post("/api/attendance/checkin", headers=headers, json={"face_image": "bm90IGFuIGltYWdl"})
+    assert response.status_code == 429
@@ -0,0 +1,65 @@
+"""
+Refresh token rotation under concurrency
+Two /auth/refresh calls presenting the same token at the same moment must not
+both get a new token: one wins, the other counts as reuse and revokes the family.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, RefreshToken, SecurityEvent, User
+from services.auth_service import AuthService
+
+
+def test_concurrent_rotation_of_one_token_is_reuse(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'refresh.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    db = Session()
+    user = User(username="alice", email="alice@example.com", hashed_password="x", full_name="Alice",
+                is_active=True)
+    db.add(user)
+    db.commit()
+    token = AuthService(db).create_refresh_token(user)
+    db.commit()
+    db.close()
+
+    # Hold both requests between reading the token and claiming it
+    barrier = threading.Barrier(2)
+    get_user_by_id = AuthService.get_user_by_id
+
+    def get_user_after_both_read(self, user_id):
+        barrier.wait(timeout=5)
+        return get_user_by_id(self, user_id)
+
+    monkeypatch.setattr(AuthService, "get_user_by_id", get_user_after_both_read)
+
+    results = []
+
+    def refresh():
+        session = Session()
+        try:
+            results.append(AuthService(session).rotate_refresh_token(token) is not None)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=refresh) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert sorted(results) == [False, True]
+
+    db = Session()
+    try:
+        # The winner's new token was revoked with the rest of the family
+        assert db.query(RefreshToken).filter(RefreshToken.revoked_at.is_(None)).count() == 0
+        assert db.query(SecurityEvent).filter(SecurityEvent.event_type == "refresh_token_reuse").count() == 1
+    finally:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,60 @@
+"""
+Replay detection of check-in photos
+With REPLAY_REJECT on, a photo nearly identical to one of the user's earlier
+check-ins is refused and logged; a fresh photo is accepted.
+"""
+
+import base64
+import random
+from io import BytesIO
+
+from PIL import Image
+
+from config import settings
+from models import SecurityEvent
+
+
+def photo(seed: int) -> str:
+    rng = random.Random(seed)
+    image = Image.frombytes("L", (64, 64), bytes(rng.randrange(256) for _ in range(64 * 64)))
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def check_in_and_out(client, headers, image: str):
+    response = client.post("/api/attendance/checkin", headers=headers, json={"face_image": image})
+    if response.status_code == 200:
+        assert client.post("/api/attendance/checkout", headers=headers).status_code == 200
+    return response
+
+
+def test_replayed_photo_is_rejected(client, make_user, db, monkeypatch):
+    monkeypatch.setattr(settings, "REPLAY_REJECT", True)
+    user_id, headers = make_user()
+    image = photo(1)
+
+    assert check_in_and_out(client, headers, image).status_code == 200
+
+    replayed = check_in_and_out(client, headers, image)
+    assert replayed.status_code == 400
+    assert "already used" in replayed.json()["detail"]
+    assert db.query(SecurityEvent).filter(
+        SecurityEvent.user_id == user_id,
+        SecurityEvent.event_type == "check_in_replay_rejected"
+    ).count() == 1
+
+    assert check_in_and_out(client, headers, photo(2)).status_code == 200
+
+
+def test_replayed_photo_is_only_flagged_by_default(client, make_user, db):
+    user_id, headers = make_user()
+    image = photo(3)
+
+    first = check_in_and_out(client, headers, image)
+    second = check_in_and_out(client, headers, image)
+    assert first.status_code == second.status_code == 200
+    assert db.query(SecurityEvent).filter(
+        SecurityEvent.user_id == user_id,
+        SecurityEvent.event_type == "check_in_replay_suspected"
+    ).count() == 1
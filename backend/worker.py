@@ -0,0 +1,37 @@
+"""
+Gunicorn worker class for production
+Uvicorn worker that ends live event streams on shutdown and bounds the drain
+so lifespan shutdown (worker pools, log flush) runs before gunicorn's SIGKILL
+"""
+
+import sys
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn_worker import UvicornWorker
+
+from services.event_bus import attendance_events
+
+# Time left for lifespan shutdown after in-flight requests are drained
+SHUTDOWN_MARGIN_SECONDS = 5
+
+
+class DrainingServer(Server):
+    async def shutdown(self, sockets=None):
+        # SSE streams never finish on their own and would hold the drain open
+        attendance_events.close()
+        await super().shutdown(sockets=sockets)
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - SHUTDOWN_MARGIN_SECONDS)
+
+    async def _serve(self):
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
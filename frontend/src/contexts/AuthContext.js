@@ -22,6 +22,57 @@ export const AuthProvider = ({ children }) => {
     checkAuthStatus();
   }, []);
 
+  // Renew expired access tokens with the refresh token instead of logging in again
+  useEffect(() => {
+    let refreshPromise = null;
+
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const refreshToken = localStorage.getItem("refresh_token");
+
+        if (
+          error.response?.status !== 401 ||
+          !refreshToken ||
+          original._retry ||
+          original.url === "/auth/refresh"
+        ) {
+          return Promise.reject(error);
+        }
+        original._retry = true;
+
+        try {
+          // Share one refresh call between concurrent failed requests
+          if (!refreshPromise) {
+            refreshPromise = axios
+              .post("/auth/refresh", { refresh_token: refreshToken })
+              .finally(() => {
+                refreshPromise = null;
+              });
+          }
+          const response = await refreshPromise;
+          const { access_token, refresh_token } = response.data;
+
+          localStorage.setItem("access_token", access_token);
+          localStorage.setItem("refresh_token", refresh_token);
+          axios.defaults.headers.common["Authorization"] = `Bearer ${access_token}`;
+          original.headers["Authorization"] = `Bearer ${access_token}`;
+
+          return axios(original);
+        } catch (refreshError) {
+          localStorage.removeItem("access_token");
+          localStorage.removeItem("refresh_token");
+          delete axios.defaults.headers.common["Authorization"];
+          setUser(null);
+          return Promise.reject(error);
+        }
+      }
+    );
+
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const checkAuthStatus = async () => {
     try {
       const token = localStorage.getItem("access_token");
@@ -33,6 +84,7 @@ export const AuthProvider = ({ children }) => {
     } catch (error) {
       console.error("Auth check failed:", error);
       localStorage.removeItem("access_token");
+      localStorage.removeItem("refresh_token");
       delete axios.defaults.headers.common["Authorization"];
     } finally {
       setLoading(false);
@@ -46,9 +98,10 @@ export const AuthProvider = ({ children }) => {
         password,
       });
 
-      const { access_token, ...userData } = response.data;
+      const { access_token, refresh_token, ...userData } = response.data;
 
       localStorage.setItem("access_token", access_token);
+      localStorage.setItem("refresh_token", refresh_token);
       axios.defaults.headers.common["Authorization"] = `Bearer ${access_token}`;
 
       // Get full user profile
@@ -166,6 +219,7 @@ export const AuthProvider = ({ children }) => {
       console.error("Logout error:", error);
     } finally {
       localStorage.removeItem("access_token");
+      localStorage.removeItem("refresh_token");
       delete axios.defaults.headers.common["Authorization"];
       setUser(null);
     }